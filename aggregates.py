@@ -0,0 +1,173 @@
+# IMPORTS
+import os
+import pandas as pd
+
+BOROUGHS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'postcode_boroughs.csv')
+
+# Columns the daily rent statistics are grouped by
+DIMENSIONS = ['postcode', 'borough', 'region_loc', 'listing_type']
+
+# FUNCTIONS
+def create_aggregate_tables(conn, boroughs_csv=BOROUGHS_CSV):
+	"""
+	Creates the small pre-aggregated tables dashboards read instead of scanning every listing, and loads the postcode to borough dimension.
+	* listing_summary: one row per listing with the first and last day it was scraped, how often, and its first, last, lowest and highest rent.
+	* price_history: one row per listing per rent change, starting with its first rent.
+	* daily_rent_stats: per scrape date, the number of listings, median rent and median predicted minus actual rent by postcode, borough, region_loc and listing_type.
+	* postcode_borough: the borough each postcode district belongs to.
+	Dates are stored as 'YYYY-MM-DD' so they sort and filter as dates.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database, as returned by database.connect.
+
+	boroughs_csv : str -> Default = 'postcode_boroughs.csv'
+		CSV of postcode districts and the borough each mainly falls in.
+	Returns
+	------
+	"""
+
+	with conn:
+		conn.execute('''CREATE TABLE IF NOT EXISTS listing_summary (
+			property_id TEXT PRIMARY KEY, postcode TEXT, borough TEXT, first_seen TEXT, last_seen TEXT, times_seen INTEGER,
+			first_rent REAL, last_rent REAL, min_rent REAL, max_rent REAL)''')
+		conn.execute('''CREATE TABLE IF NOT EXISTS price_history (
+			property_id TEXT NOT NULL, scrape_date TEXT NOT NULL, rent_pcm REAL, predicted_monthly_rent REAL,
+			PRIMARY KEY (property_id, scrape_date))''')
+		conn.execute('''CREATE TABLE IF NOT EXISTS daily_rent_stats (
+			scrape_date TEXT NOT NULL, dimension TEXT NOT NULL, value TEXT NOT NULL, listings INTEGER,
+			median_rent REAL, median_prediction_error REAL, PRIMARY KEY (scrape_date, dimension, value))''')
+		conn.execute('CREATE TABLE IF NOT EXISTS postcode_borough (postcode TEXT PRIMARY KEY, borough TEXT)')
+		conn.executemany('INSERT OR IGNORE INTO postcode_borough VALUES (?, ?)', pd.read_csv(boroughs_csv).itertuples(index=False, name=None))
+
+
+def update_aggregates(conn, data):
+	"""
+	Brings the aggregate tables up to date after listings have been written to the rentals table.
+	The tables must have been created with create_aggregate_tables. Only the listings and scrape dates in data are recomputed, from their rows in the rentals table, so the cost depends on the size of the batch rather than the size of the table, and writing the same day twice gives the same result.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	data : DataFrame
+		The listings just written, with property_id and scrape_date columns.
+	Returns
+	------
+	"""
+
+	if len(data) == 0:
+		return
+	ids = data['property_id'].astype(str).unique().tolist()
+	dates = data['scrape_date'].astype(str).unique().tolist()
+
+	# Listings and rent changes of every listing in the batch
+	rows = pd.concat([pd.read_sql(f'''SELECT property_id, postcode, scrape_date, rent_pcm, predicted_monthly_rent FROM rentals
+		WHERE property_id IN ({', '.join('?' for i in chunk)})''', conn, params=chunk) for chunk in _chunks(ids)], ignore_index=True)
+	rows['property_id'] = rows['property_id'].astype(str)
+	rows['scrape_date'] = _iso_dates(rows['scrape_date'])
+	rows = _numeric_rents(rows)
+	rows = rows.dropna(subset=['scrape_date']).sort_values(['property_id', 'scrape_date'])
+	boroughs = _borough_lookup(conn, rows['postcode'])
+
+	# Rows are in date order, so the first and last scrape dates are the first and last rows of each listing
+	grouped = rows.groupby('property_id')
+	summary = pd.DataFrame({
+		'postcode': grouped['postcode'].last(), 'first_seen': grouped['scrape_date'].first(), 'last_seen': grouped['scrape_date'].last(),
+		'times_seen': grouped.size(), 'first_rent': grouped['rent_pcm'].first(), 'last_rent': grouped['rent_pcm'].last(),
+		'min_rent': grouped['rent_pcm'].min(), 'max_rent': grouped['rent_pcm'].max()}).reset_index()
+	summary.insert(2, 'borough', summary['postcode'].map(boroughs))
+
+	previous_rent = grouped['rent_pcm'].shift()
+	changes = rows[previous_rent.isna() | (rows['rent_pcm'] != previous_rent)]
+
+	# Rent statistics of every scrape date in the batch
+	day_rows = pd.concat([pd.read_sql(f'''SELECT scrape_date, postcode, region_loc, listing_type, rent_pcm, predicted_monthly_rent FROM rentals
+		WHERE scrape_date IN ({', '.join('?' for i in chunk)})''', conn, params=chunk) for chunk in _chunks(dates)], ignore_index=True)
+	day_rows['scrape_date'] = _iso_dates(day_rows['scrape_date'])
+	day_rows = _numeric_rents(day_rows)
+	day_rows['borough'] = day_rows['postcode'].map(_borough_lookup(conn, day_rows['postcode']))
+	day_rows['prediction_error'] = day_rows['predicted_monthly_rent'] - day_rows['rent_pcm']
+	stats = []
+	for dimension in DIMENSIONS:
+		grouped_days = day_rows.dropna(subset=[dimension]).groupby(['scrape_date', dimension])
+		daily = grouped_days.agg(listings=('rent_pcm', 'size'), median_rent=('rent_pcm', 'median'), median_prediction_error=('prediction_error', 'median')).reset_index()
+		daily.insert(1, 'dimension', dimension)
+		stats.append(daily.rename(columns={dimension: 'value'}))
+	stats = pd.concat(stats, ignore_index=True)
+
+	with conn:
+		for chunk in _chunks(ids):
+			conn.execute(f"DELETE FROM price_history WHERE property_id IN ({', '.join('?' for i in chunk)})", chunk)
+		conn.executemany('INSERT INTO price_history VALUES (?, ?, ?, ?)', _records(changes[['property_id', 'scrape_date', 'rent_pcm', 'predicted_monthly_rent']]))
+		conn.executemany('INSERT OR REPLACE INTO listing_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', _records(summary))
+		conn.executemany('DELETE FROM daily_rent_stats WHERE scrape_date = ?', [(date,) for date in stats['scrape_date'].unique()])
+		conn.executemany('INSERT INTO daily_rent_stats VALUES (?, ?, ?, ?, ?, ?)', _records(stats[['scrape_date', 'dimension', 'value', 'listings', 'median_rent', 'median_prediction_error']]))
+
+
+def rebuild_aggregates(conn, dates_per_batch=30, scrape_dates=None):
+	"""
+	Fills the aggregate tables from every listing already in the rentals table, e.g. the first time they are used on an existing database or after a bulk import.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	dates_per_batch : int -> Default = 30
+		Number of scrape dates recomputed at a time.
+
+	scrape_dates : list -> Default = None
+		Only recompute these scrape dates and the listings seen on them. If not provided, every scrape date is recomputed.
+	Returns
+	------
+	"""
+
+	create_aggregate_tables(conn)
+	dates = [row[0] for row in conn.execute('SELECT DISTINCT scrape_date FROM rentals')] if scrape_dates is None else sorted(scrape_dates)
+	for chunk in _chunks(dates, dates_per_batch):
+		update_aggregates(conn, pd.read_sql(f"SELECT property_id, scrape_date FROM rentals WHERE scrape_date IN ({', '.join('?' for i in chunk)})", conn, params=chunk))
+	print(f"Aggregate tables rebuilt for {len(dates)} scrape dates.")
+
+
+def borough_of(postcode, boroughs):
+	"""
+	Looks up the borough of a postcode district such as 'SE16', 'EC1V' or 'W1K'. Sub districts not in boroughs fall back to their parent district, e.g. 'W1K' to 'W1'.
+	"""
+
+	if not isinstance(postcode, str):
+		return None
+	postcode = postcode.strip().upper().split(' ')[0]
+	if postcode in boroughs:
+		return boroughs[postcode]
+	if postcode[-1:].isalpha():
+		return boroughs.get(postcode[:-1])
+	return None
+
+
+def _borough_lookup(conn, postcodes):
+	# Record every new postcode in the dimension table, then map them all
+	boroughs = dict(conn.execute('SELECT postcode, borough FROM postcode_borough'))
+	new = {postcode: borough_of(postcode, boroughs) for postcode in postcodes.dropna().unique() if postcode not in boroughs}
+	if new:
+		with conn:
+			conn.executemany('INSERT OR IGNORE INTO postcode_borough VALUES (?, ?)', new.items())
+		boroughs.update(new)
+	return boroughs
+
+
+def _iso_dates(scrape_dates):
+	return pd.to_datetime(scrape_dates, format="%d %B %Y", errors='coerce').dt.strftime("%Y-%m-%d")
+
+
+def _numeric_rents(rows):
+	# Columns that are NULL on every row come back from SQLite as objects, which pandas aggregates one Python value at a time
+	return rows.astype({'rent_pcm': 'float64', 'predicted_monthly_rent': 'float64'})
+
+
+def _records(data):
+	return data.astype(object).where(data.notna(), None).itertuples(index=False, name=None)
+
+
+def _chunks(values, size=500):
+	for start in range(0, len(values), size):
+		yield values[start:start + size]
@@ -0,0 +1,259 @@
+# IMPORTS
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from itertools import islice
+from database import populate_database
+from history_store import append_history
+from listing_parser import parse_listing, listings_to_frame
+from predict import PIPELINE_PATH, MODEL_PATH, load_artifacts, predict_rent
+from synthetic_listings import generate_description, generate_listing_page
+
+BENCHMARK_SIZES = (100, 10000, 1000000)
+RESULTS_DIR = 'benchmark_results'
+TODAY = '01 January 2026'
+
+# Listings run through the stages at a time, so memory stays flat however many listings are benchmarked
+CHUNK_SIZE = 100000
+
+# Stages timed for each size, in the order they run
+STAGES = ('parse', 'features', 'predict', 'populate_database', 'history_append')
+
+# Number of distinct synthetic pages generated. Larger sizes parse the same pages again under new property IDs, each with its own description.
+POOL_SIZE = 1000
+
+# Fraction of listings that are relisted copies of the listing POOL_SIZE before them: the same page and description under a new property ID
+RELIST_RATE = 0.05
+
+# Stands in for the description of the pooled pages until each listing's own is filled in
+_DESCRIPTION = '{description}'
+
+# FUNCTIONS
+def run_benchmarks(sizes=BENCHMARK_SIZES, pipeline_path=PIPELINE_PATH, model_path=MODEL_PATH, results_dir=RESULTS_DIR, seed=0):
+	"""
+	Times every stage of a scrape on synthetic listings, without any network access, and saves the results as JSON.
+	For each size the stages are run one after the other on the output of the previous stage, CHUNK_SIZE listings at a time: parsing the listing pages, building the DataFrame with engineered features, transforming and predicting with full_pipeline.joblib and the tuned model, writing to a fresh database with populate_database and appending to a fresh history store. A stage that cannot run, e.g. because the model artifacts are missing, is recorded with its error instead of a time.
+	Parameters
+	----------
+	sizes : tuple -> Default = (100, 10000, 1000000)
+		Numbers of listings to time each stage at.
+
+	pipeline_path : str -> Default = 'full_pipeline.joblib'
+		Path to the fitted transformation pipeline.
+
+	model_path : str -> Default = 'tuned_model.joblib'
+		Path to the tuned model.
+
+	results_dir : str -> Default = 'benchmark_results'
+		Folder the JSON results are saved in, one file per run named after the time and git commit.
+
+	seed : int -> Default = 0
+		Seed for the synthetic listings, so every run times the same pages.
+
+	Returns
+	------
+	results : dict
+		Seconds taken and listings per second for each stage at each size, and the path the results were saved to.
+	"""
+
+	commit = _git_commit()
+	results = {
+		'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+		'python': platform.python_version(), 'machine': platform.machine(), 'cpu_count': os.cpu_count(), 'sizes': {}}
+
+	rng = random.Random(seed)
+	pool = [generate_listing_page(rng, description=_DESCRIPTION) for i in range(min(POOL_SIZE, max(sizes)))]
+	try:
+		transformation_pipeline, model, model_version = load_artifacts(pipeline_path, model_path)
+		artifacts_error = None
+	except Exception as e:
+		transformation_pipeline, model, model_version = None, None, None
+		artifacts_error = f'{type(e).__name__}: {e}'
+	results['model_version'] = model_version
+
+	with tempfile.TemporaryDirectory() as work_dir:
+		for size in sizes:
+			print(f"Benchmarking {size} listings...")
+			results['sizes'][str(size)] = benchmark_size(size, pool, transformation_pipeline, model, work_dir, artifacts_error, seed)
+
+	os.makedirs(results_dir, exist_ok=True)
+	path = os.path.join(results_dir, f"{datetime.datetime.now():%Y-%m-%d-%H%M%S}-{commit or 'unknown'}.json")
+	with open(path, 'w') as f:
+		json.dump(results, f, indent=2)
+
+	for size, stages in results['sizes'].items():
+		print(f"{size} listings: " + ', '.join(f"{stage} {timing['per_sec']:,.0f}/s" if 'per_sec' in timing else f'{stage} failed'
+			for stage, timing in stages.items()))
+	print(f"Results saved to {path}.")
+	results['path'] = path
+	return results
+
+
+def benchmark_size(size, pool, transformation_pipeline, model, work_dir, artifacts_error=None, seed=0):
+	"""
+	Times each stage of a scrape for a given number of listings, run CHUNK_SIZE listings at a time into the same database and history store. The time of each stage is added up over the chunks.
+	Parameters
+	----------
+	size : int
+		Number of listings.
+
+	pool : list
+		Listing page HTML to parse, cycled through until size pages have been parsed. Each page is given the listing's own description first, see listing_pages.
+
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline, or None if it could not be loaded.
+
+	model : estimator
+		The tuned model, or None if it could not be loaded.
+
+	work_dir : str
+		Folder to create the database and history store in.
+
+	artifacts_error : str -> Default = None
+		Why the model artifacts could not be loaded, recorded for the predict stage.
+
+	seed : int -> Default = 0
+		Seed for the descriptions of the listings.
+
+	Returns
+	------
+	timings : dict
+		Seconds taken and listings per second for each stage.
+	"""
+
+	seconds = defaultdict(float)
+	errors = {} if model is not None else {'predict': artifacts_error}
+	database_path = os.path.join(work_dir, f'rentals-{size}.db')
+	history_dir = os.path.join(work_dir, f'history-{size}')
+	pages = listing_pages(size, pool, seed)
+	for start in range(0, size, CHUNK_SIZE):
+		records = _timed_parse(seconds, islice(pages, CHUNK_SIZE))
+		data = _timed(seconds, 'features', listings_to_frame, records, TODAY)
+		del records
+
+		if 'predict' not in errors:
+			try:
+				data['predicted_monthly_rent'] = _timed(seconds, 'predict', predict_rent, data, transformation_pipeline, model)
+			except Exception as e:
+				errors['predict'] = f'{type(e).__name__}: {e}'
+
+		_timed(seconds, 'populate_database', populate_database, database_path, data)
+		_timed(seconds, 'history_append', append_history, data, history_dir)
+		del data
+
+	return {stage: {'error': errors[stage]} if stage in errors else {'seconds': seconds[stage], 'per_sec': size / seconds[stage] if seconds[stage] > 0 else float('inf')}
+		for stage in STAGES}
+
+def listing_pages(size, pool, seed=0):
+	"""
+	The (property_link, html) of size listings, cycling through the pooled pages with a description generated for each listing.
+	RELIST_RATE of the listings after the first pass through the pool are relisted copies, with the description of the listing len(pool) before them, so the near-duplicate index sees a realistic share of copies.
+	Parameters
+	----------
+	size : int
+		Number of listings.
+
+	pool : list
+		Listing page HTML with _DESCRIPTION in place of the description.
+
+	seed : int -> Default = 0
+		Seed for the descriptions, so every run parses the same pages.
+
+	Returns
+	------
+	pages : generator
+		(property_link, html) tuples.
+	"""
+
+	for i in range(size):
+		original = i
+		while original >= len(pool) and random.Random(f'{seed}-relist-{original}').random() < RELIST_RATE:
+			original -= len(pool)
+		description = generate_description(random.Random(f'{seed}-{original}'))
+		yield f'https://www.openrent.co.uk//{1000000 + i}', pool[i % len(pool)].replace(_DESCRIPTION, description)
+
+
+def compare_results(baseline_path, current_path, threshold=0.1):
+	"""
+	Compares two saved benchmark runs and reports every stage that got slower by more than threshold.
+	Parameters
+	----------
+	baseline_path : str
+		JSON results of the earlier run.
+
+	current_path : str
+		JSON results of the later run.
+
+	threshold : float -> Default = 0.1
+		Fractional slowdown that counts as a regression, e.g. 0.1 is 10% fewer listings per second.
+
+	Returns
+	------
+	regressions : list
+		(size, stage, baseline per second, current per second) of every regression.
+	"""
+
+	with open(baseline_path) as f:
+		baseline = json.load(f)
+	with open(current_path) as f:
+		current = json.load(f)
+
+	regressions = []
+	for size, stages in current['sizes'].items():
+		for stage, timing in stages.items():
+			before = baseline['sizes'].get(size, {}).get(stage, {}).get('per_sec')
+			after = timing.get('per_sec')
+			if before is None or after is None:
+				continue
+			change = after / before - 1
+			flag = '  REGRESSION' if change < -threshold else ''
+			print(f"{size:>8} {stage:<18} {before:>12,.0f}/s -> {after:>12,.0f}/s ({change:+.1%}){flag}")
+			if flag:
+				regressions.append((int(size), stage, before, after))
+	return regressions
+
+
+def _timed(seconds, stage, func, *args):
+	start = time.perf_counter()
+	value = func(*args)
+	seconds[stage] += time.perf_counter() - start
+	return value
+
+
+def _timed_parse(seconds, pages):
+	# Only parsing is timed, not generating each listing's page
+	records = []
+	for property_link, html in pages:
+		start = time.perf_counter()
+		records.append(parse_listing(html, property_link, TODAY))
+		seconds['parse'] += time.perf_counter() - start
+	return records
+
+
+def _git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+			cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Time each scrape stage on synthetic listings and save the results as JSON.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES))
+	parser.add_argument('--pipeline', default=PIPELINE_PATH)
+	parser.add_argument('--model', default=MODEL_PATH)
+	parser.add_argument('--results-dir', default=RESULTS_DIR)
+	parser.add_argument('--compare', metavar='BASELINE_JSON', help='Compare this run against an earlier results file')
+	args = parser.parse_args()
+
+	results = run_benchmarks(args.sizes, args.pipeline, args.model, args.results_dir)
+	if args.compare:
+		compare_results(args.compare, results['path'])
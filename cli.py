@@ -0,0 +1,244 @@
+# IMPORTS
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported here. Each command imports what it needs when it runs, so housekeeping commands such as load and export never pay for importing the scraper or sklearn.
+
+DATABASE_PATH = 'real_estate.db'
+PIPELINE_PATH = 'full_pipeline.joblib'
+MODEL_PATH = 'tuned_model.joblib'
+BASE_URL = 'https://www.openrent.co.uk/'
+
+# Modules each command imports when it runs, timed by import-benchmark
+COMMAND_IMPORTS = {
+	'discover': ['index_crawler'], 'scrape': ['data_utils'], 'predict': ['sqlite3', 'predict', 'history_store'],
+	'load': ['pandas', 'database'], 'import': ['legacy_import'], 'export': ['history_store'], 'export --table': ['sqlite3', 'pandas']}
+
+# FUNCTIONS
+def discover(args):
+	"""
+	Crawls the search results and writes the link to every listing found, one per line.
+	"""
+
+	from index_crawler import discover_listings
+
+	hrefs, complete = discover_listings(args.radius, term=args.term, base_url=args.base_url, requests_per_second=args.requests_per_second)
+	lines = '\n'.join(args.base_url + href for href in hrefs) + '\n'
+	if args.output == '-':
+		sys.stdout.write(lines)
+	else:
+		with open(args.output, 'w') as f:
+			f.write(lines)
+		print(f"{len(hrefs)} listing links written to {args.output}{'' if complete else ', from search results that did not load in full'}.")
+
+
+def scrape(args):
+	"""
+	Scrapes Open Rent into the database, loading the model artifacts only if predictions are wanted.
+	"""
+
+	from data_utils import ScrapeSettings, scrape_flats
+
+	pipeline, model, model_version = None, None, None
+	if not args.no_model:
+		from predict import load_artifacts
+		pipeline, model, model_version = load_artifacts(args.pipeline, args.model)
+	settings = ScrapeSettings(radius=args.radius, mode=args.mode, base_url=args.base_url, requests_per_second=args.requests_per_second,
+		max_workers=args.max_workers, cache_max_age_days=args.cache_max_age_days, cache_max_bytes=args.cache_max_bytes)
+	scrape_flats(transformation_pipeline=pipeline, model=model, database_path=args.database, settings=settings, model_version=model_version)
+
+
+def predict(args):
+	"""
+	Scores stored listings that have no prediction or were scored by an older model. The artifacts are only loaded if something needs scoring.
+	"""
+
+	import sqlite3
+	from predict import artifact_version, load_artifacts, rescore_database, rescore_history
+	from history_store import outdated_files
+
+	# The version is a hash of the artifact files, so what needs scoring is known before loading them
+	version = artifact_version(args.pipeline, args.model)
+	score_database = False
+	if os.path.exists(args.database):
+		conn = sqlite3.connect(args.database)
+		try:
+			score_database = conn.execute('''SELECT 1 FROM rentals WHERE predicted_monthly_rent IS NULL OR model_version IS NULL
+				OR model_version != ? LIMIT 1''', (version,)).fetchone() is not None
+		finally:
+			conn.close()
+	score_history = bool(args.history) and os.path.exists(args.history) and outdated_files(args.history, version=version) > 0
+	if not score_database and not score_history:
+		print(f"Every stored listing is already scored with model version {version}.")
+		return
+
+	pipeline, model, version = load_artifacts(args.pipeline, args.model)
+	if score_database:
+		rescore_database(args.database, pipeline, model, version, batch_size=args.batch_size, n_jobs=args.n_jobs)
+	if score_history:
+		rescore_history(pipeline, model, version, history_dir=args.history, batch_size=args.batch_size, n_jobs=args.n_jobs)
+
+
+def load(args):
+	"""
+	Loads CSV files of scraped listings into the database, chunk_size rows at a time.
+	"""
+
+	import pandas as pd
+	from database import populate_database
+
+	for csv_path in args.csv:
+		for chunk in pd.read_csv(csv_path, chunksize=args.chunk_size):
+			populate_database(args.database, chunk)
+		print(f"{csv_path} loaded into {args.database}.")
+
+
+def import_history(args):
+	"""
+	Imports the history kept in the old Excel workbooks and CSV files into the database.
+	"""
+
+	from legacy_import import import_legacy
+
+	import_legacy(args.database, args.paths, chunk_size=args.chunk_size, scrape_date=args.scrape_date)
+
+
+def export(args):
+	"""
+	Exports the history store, or a table or view of the database, to CSV.
+	"""
+
+	if args.table is None:
+		from history_store import export_history_csv
+		export_history_csv(args.history, args.output)
+		return
+
+	import sqlite3
+	import pandas as pd
+
+	conn = sqlite3.connect(args.database)
+	num_rows = 0
+	try:
+		with open(args.output + '.tmp', 'w', newline='') as f:
+			for i, chunk in enumerate(pd.read_sql(f'SELECT * FROM "{args.table}"', conn, chunksize=args.chunk_size)):
+				chunk.to_csv(f, index=False, header=i == 0)
+				num_rows += len(chunk)
+	finally:
+		conn.close()
+	os.replace(args.output + '.tmp', args.output)
+	print(f"{num_rows} rows of {args.table} exported to {args.output}.")
+
+
+def import_benchmark(args):
+	"""
+	Times how long each command takes to start, by importing the CLI and the modules the command imports when it runs in a fresh interpreter.
+	"""
+
+	print(f"{'command':<30}{'median seconds':>16}")
+	for name, command in _benchmark_commands():
+		print(f"{name:<30}{import_time(command, args.repeat):>16.3f}")
+
+
+def import_time(command, repeat=5):
+	"""
+	Median wall time of running a command in a fresh Python interpreter.
+	Parameters
+	----------
+	command : list
+		Arguments passed to the interpreter, e.g. ['-c', 'import cli, database'].
+
+	repeat : int -> Default = 5
+		Number of runs.
+	Returns
+	------
+	seconds : float
+		Median wall time of the runs.
+	"""
+
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		subprocess.run([sys.executable] + command, check=True, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+		times.append(time.perf_counter() - start)
+	return statistics.median(times)
+
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='Scrape, score, load and export London rental listings.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	parser_discover = subparsers.add_parser('discover', help='Find the link to every listing on the search results')
+	parser_discover.add_argument('--radius', type=int, nargs='+', default=[5])
+	parser_discover.add_argument('--term', default='London')
+	parser_discover.add_argument('--base-url', default=BASE_URL)
+	parser_discover.add_argument('--requests-per-second', type=float, default=2.0)
+	parser_discover.add_argument('--output', default='-', help='File to write the links to. "-" prints them.')
+	parser_discover.set_defaults(func=discover)
+
+	parser_scrape = subparsers.add_parser('scrape', help='Scrape listings into the database and history store')
+	parser_scrape.add_argument('--database', default=DATABASE_PATH)
+	parser_scrape.add_argument('--radius', type=int, default=5)
+	parser_scrape.add_argument('--mode', choices=['full', 'new', 'stale', 'scheduled'], default='stale')
+	parser_scrape.add_argument('--pipeline', default=PIPELINE_PATH)
+	parser_scrape.add_argument('--model', default=MODEL_PATH)
+	parser_scrape.add_argument('--no-model', action='store_true', help='Scrape without predicting rents')
+	parser_scrape.add_argument('--base-url', default=BASE_URL)
+	parser_scrape.add_argument('--requests-per-second', type=float, default=2.0)
+	parser_scrape.add_argument('--max-workers', type=int, default=8)
+	parser_scrape.add_argument('--cache-max-age-days', type=int, default=30, help='Evict pages older than this from the HTML cache after the run')
+	parser_scrape.add_argument('--cache-max-bytes', type=int, help='Then evict the oldest days until the HTML cache is at most this size')
+	parser_scrape.set_defaults(func=scrape)
+
+	parser_predict = subparsers.add_parser('predict', help='Score stored listings with the current model')
+	parser_predict.add_argument('--database', default=DATABASE_PATH)
+	parser_predict.add_argument('--history', default='rental_history', help='History store folder. Use "" to skip.')
+	parser_predict.add_argument('--pipeline', default=PIPELINE_PATH)
+	parser_predict.add_argument('--model', default=MODEL_PATH)
+	parser_predict.add_argument('--batch-size', type=int, default=5000)
+	parser_predict.add_argument('--n-jobs', type=int, default=-1)
+	parser_predict.set_defaults(func=predict)
+
+	parser_load = subparsers.add_parser('load', help='Load CSV files of listings into the database')
+	parser_load.add_argument('csv', nargs='*', default=['scraped_data.csv'])
+	parser_load.add_argument('--database', default=DATABASE_PATH)
+	parser_load.add_argument('--chunk-size', type=int, default=50000)
+	parser_load.set_defaults(func=load)
+
+	parser_import = subparsers.add_parser('import', help='Import the old Excel workbooks and CSV files of listings into the database')
+	parser_import.add_argument('paths', nargs='*', default=['archive/raw_data.xlsx', 'archive/clean_data.xlsx', 'archive/test.csv', 'all_rental_data.csv'])
+	parser_import.add_argument('--database', default=DATABASE_PATH)
+	parser_import.add_argument('--chunk-size', type=int, default=50000)
+	parser_import.add_argument('--scrape-date', help="Scrape date of files that do not record one, e.g. '01 October 2020'")
+	parser_import.set_defaults(func=import_history)
+
+	parser_export = subparsers.add_parser('export', help='Export the history store or a database table to CSV')
+	parser_export.add_argument('--output', default='all_rental_data.csv')
+	parser_export.add_argument('--history', default='rental_history')
+	parser_export.add_argument('--table', help='Table or view of the database to export instead of the history store, e.g. listing_market')
+	parser_export.add_argument('--database', default=DATABASE_PATH)
+	parser_export.add_argument('--chunk-size', type=int, default=50000)
+	parser_export.set_defaults(func=export)
+
+	parser_benchmark = subparsers.add_parser('import-benchmark', help='Time how long each command takes to start')
+	parser_benchmark.add_argument('--repeat', type=int, default=5)
+	parser_benchmark.set_defaults(func=import_benchmark)
+	return parser
+
+
+def main(argv=None):
+	args = build_parser().parse_args(argv)
+	args.func(args)
+
+
+def _benchmark_commands():
+	commands = [('python', ['-c', 'pass']), ('import cli', ['-c', 'import cli'])]
+	commands += [(name, ['-c', 'import ' + ', '.join(['cli'] + modules)]) for name, modules in COMMAND_IMPORTS.items()]
+	return commands
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,285 @@
+# IMPORTS
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from sklearn.neighbors import KDTree
+from predict import model_input
+
+COMPARABLES_PATH = 'comparables.joblib'
+
+# Listings are only compared with listings of the same type in the same part of London, so each pair has its own tree
+PARTITION_COLUMNS = ['listing_type', 'region_loc']
+
+# Columns returned with each comparable listing
+INFO_COLUMNS = ['property_id', 'scrape_date', 'listing_title', 'postcode', 'num_bedrooms', 'num_bathrooms', 'rent_pcm', 'predicted_monthly_rent']
+
+# CLASSES
+class ComparablesIndex:
+	"""
+	Nearest neighbour index over the feature vectors full_pipeline.joblib produces, to find the listings most similar to any listing.
+	Each listing is indexed once, by its latest scrape. Listings are split by listing_type and region_loc, and each group is held in a KD-tree plus a small buffer of listings added since the tree was built. New listings go into the buffer, which is searched by brute force, and the tree is only rebuilt once the buffer and the listings replaced by newer scrapes reach rebuild_fraction of its size, so adding each batch stays cheap.
+	Parameters
+	----------
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	leaf_size : int -> Default = 40
+		Leaf size of each KD-tree.
+
+	rebuild_fraction : float -> Default = 0.1
+		Share of a tree's size the buffer and replaced listings can reach before the tree is rebuilt.
+
+	version : str -> Default = None
+		Version of the model artifacts the feature vectors come from, as returned by predict.load_artifacts. load_comparables rebuilds a saved index whose version does not match.
+	"""
+
+	def __init__(self, transformation_pipeline, leaf_size=40, rebuild_fraction=0.1, version=None):
+		self.transformation_pipeline = transformation_pipeline
+		self.version = version
+		self.leaf_size = leaf_size
+		self.rebuild_fraction = rebuild_fraction
+		self.partitions = {}
+		# property_id -> (partition key, row in the partition, scrape date)
+		self.positions = {}
+
+	def __getstate__(self):
+		# The pipeline is saved separately, so it is left out of the saved index
+		state = self.__dict__.copy()
+		state['transformation_pipeline'] = None
+		return state
+
+	def add(self, data, rebuild=True):
+		"""
+		Adds listings to the index, replacing any older scrape of the same listing.
+		Parameters
+		----------
+		data : DataFrame
+			Listings with the model's feature columns, listing_type, region_loc and scrape_date, e.g. a batch from scrape_flats or rows of the rentals table.
+
+		rebuild : bool -> Default = True
+			Whether to rebuild trees whose buffer has grown too large. Pass False while loading many batches and call rebuild() at the end.
+		Returns
+		------
+		num_added : int
+			Number of listings added or replaced.
+		"""
+
+		data = data.reset_index(drop=True).assign(
+			property_id=data['property_id'].astype(str).values,
+			_date=pd.to_datetime(data['scrape_date'], format="%d %B %Y", errors='coerce').values)
+		data = data.sort_values('_date', kind='stable').drop_duplicates('property_id', keep='last')
+		newer = [property_id not in self.positions or date >= self.positions[property_id][2] for property_id, date in zip(data['property_id'], data['_date'])]
+		data = data[newer].reset_index(drop=True)
+		if data.empty:
+			return 0
+
+		features = self.transform(data)
+		info = data.reindex(columns=INFO_COLUMNS)
+		keys = data[PARTITION_COLUMNS].astype(object).fillna('unknown').astype(str)
+		for key, rows in keys.groupby(PARTITION_COLUMNS, sort=False).indices.items():
+			partition = self.partitions.setdefault(key, _new_partition(features.shape[1]))
+			for property_id in data['property_id'].values[rows]:
+				self._remove(property_id)
+
+			start = len(partition['active'])
+			partition['buffer_features'] = np.concatenate([partition['buffer_features'], features[rows]])
+			partition['info'] = pd.concat([partition['info'], info.iloc[rows]], ignore_index=True)
+			partition['active'] = np.concatenate([partition['active'], np.ones(len(rows), dtype=bool)])
+			for offset, (property_id, date) in enumerate(zip(data['property_id'].values[rows], data['_date'].values[rows])):
+				self.positions[property_id] = (key, start + offset, date)
+
+			if rebuild and self._needs_rebuild(partition):
+				self._rebuild_partition(key)
+		return len(data)
+
+	def rebuild(self):
+		"""
+		Rebuilds every tree from all listings currently indexed.
+		"""
+
+		for key in self.partitions:
+			self._rebuild_partition(key)
+
+	def similar(self, property_id, k=10):
+		"""
+		Finds the k listings most similar to a listing, of the same listing_type and region_loc.
+		Parameters
+		----------
+		property_id : str
+			Listing to find comparables for. It must be in the index.
+
+		k : int -> Default = 10
+			Number of comparables to return.
+		Returns
+		------
+		comparables : DataFrame
+			The k nearest listings, closest first, with their rents and distance in feature space.
+		"""
+
+		key, row, date = self.positions[str(property_id)]
+		partition = self.partitions[key]
+		num_tree = len(partition['features'])
+		vector = self._vector(partition, row)
+
+		rows, distances = [], []
+		if num_tree:
+			# Ask the tree for more neighbours until enough of them are still active
+			num_query = min(k + 1, num_tree)
+			while True:
+				tree_distances, tree_rows = partition['tree'].query(vector[None, :], k=num_query)
+				active = partition['active'][tree_rows[0]]
+				if active.sum() >= k + 1 or num_query == num_tree:
+					break
+				num_query = min(num_query * 4, num_tree)
+			rows.append(tree_rows[0][active])
+			distances.append(tree_distances[0][active])
+
+		if len(partition['buffer_features']):
+			buffer = partition['buffer_features']
+			buffer_rows = np.arange(num_tree, num_tree + len(buffer))
+			active = partition['active'][buffer_rows]
+			rows.append(buffer_rows[active])
+			distances.append(np.sqrt(((buffer[active] - vector) ** 2).sum(axis=1)))
+
+		rows = np.concatenate(rows)
+		distances = np.concatenate(distances)
+		keep = rows != row
+		order = np.argsort(distances[keep], kind='stable')[:k]
+		comparables = self._info(partition, rows[keep][order])
+		comparables['distance'] = distances[keep][order]
+		return comparables
+
+	def transform(self, data):
+		"""
+		Feature vectors of listings as produced by the transformation pipeline.
+		"""
+
+		features = self.transformation_pipeline.transform(model_input(data, self.transformation_pipeline))
+		if hasattr(features, 'toarray'):
+			features = features.toarray()
+		return np.asarray(features, dtype=np.float32)
+
+	def save(self, path=COMPARABLES_PATH):
+		"""
+		Saves the index, without the transformation pipeline, so the next run can keep adding to it.
+		"""
+
+		dump(self, path + '.tmp')
+		os.replace(path + '.tmp', path)
+
+	def __len__(self):
+		return len(self.positions)
+
+	def _remove(self, property_id):
+		if property_id in self.positions:
+			key, row, date = self.positions.pop(property_id)
+			self.partitions[key]['active'][row] = False
+
+	def _needs_rebuild(self, partition):
+		num_buffer = len(partition['buffer_features'])
+		num_removed = int((~partition['active']).sum())
+		return num_buffer + num_removed > self.rebuild_fraction * max(len(partition['features']), 1000)
+
+	def _rebuild_partition(self, key):
+		partition = self.partitions[key]
+		active = partition['active']
+		features = np.concatenate([partition['features'], partition['buffer_features']])[active]
+		info = partition['info'][active].reset_index(drop=True)
+
+		partition.update({
+			'features': features, 'info': info, 'tree': KDTree(features, leaf_size=self.leaf_size) if len(features) else None,
+			'buffer_features': features[:0], 'active': np.ones(len(features), dtype=bool)})
+		for row, property_id in enumerate(info['property_id'].values):
+			self.positions[property_id] = (key, row, self.positions[property_id][2])
+
+	def _vector(self, partition, row):
+		num_tree = len(partition['features'])
+		if row < num_tree:
+			return partition['features'][row]
+		return partition['buffer_features'][row - num_tree]
+
+	def _info(self, partition, rows):
+		# info holds the rows of the tree followed by those of the buffer, in the same order as active
+		return partition['info'].iloc[rows].reset_index(drop=True)
+
+
+# FUNCTIONS
+def build_comparables(database_path, transformation_pipeline, chunk_size=100000, path=COMPARABLES_PATH, version=None):
+	"""
+	Builds the comparables index from every listing in the rentals table and saves it.
+	The table is read and transformed chunk_size rows at a time and each tree is built once at the end, so the whole multi-year history never has to be held in memory as a DataFrame.
+	Parameters
+	----------
+	database_path : str
+		The path to the database where this data is stored. If in CWD then this is just the database name.
+
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	chunk_size : int -> Default = 100000
+		Number of rows read and transformed at a time.
+
+	path : str -> Default = 'comparables.joblib'
+		Where to save the index. Use None to not save it.
+
+	version : str -> Default = None
+		Version of the model artifacts, saved with the index.
+	Returns
+	------
+	index : ComparablesIndex
+		The built index.
+	"""
+
+	index = ComparablesIndex(transformation_pipeline, version=version)
+	conn = sqlite3.connect(database_path)
+	try:
+		for chunk in pd.read_sql('SELECT * FROM rentals', conn, chunksize=chunk_size):
+			index.add(chunk, rebuild=False)
+	finally:
+		conn.close()
+	index.rebuild()
+	if path is not None:
+		index.save(path)
+	print(f"Comparables index built for {len(index)} listings.")
+	return index
+
+
+def load_comparables(transformation_pipeline, path=COMPARABLES_PATH, database_path=None, version=None):
+	"""
+	Loads a saved comparables index, or builds it from the rentals table if there is none yet or it was built with other model artifacts, e.g. before a retrain.
+	Parameters
+	----------
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline the index was built with.
+
+	path : str -> Default = 'comparables.joblib'
+		Where the index is saved.
+
+	database_path : str -> Default = None
+		Database to build the index from if it has not been saved yet. An empty index is returned if not provided.
+
+	version : str -> Default = None
+		Version of the model artifacts, as returned by predict.load_artifacts.
+	Returns
+	------
+	index : ComparablesIndex
+		The loaded index.
+	"""
+
+	if os.path.exists(path):
+		index = load(path)
+		if getattr(index, 'version', None) == version:
+			index.transformation_pipeline = transformation_pipeline
+			return index
+		# Vectors from another pipeline are not comparable with the new ones, so start again
+		print(f"The comparables index was built with model version {getattr(index, 'version', None)}, not {version}. Rebuilding it.")
+	if database_path is not None:
+		return build_comparables(database_path, transformation_pipeline, path=path, version=version)
+	return ComparablesIndex(transformation_pipeline, version=version)
+
+
+def _new_partition(num_features):
+	return {'features': np.empty((0, num_features), dtype=np.float32), 'info': pd.DataFrame(columns=INFO_COLUMNS), 'tree': None,
+		'buffer_features': np.empty((0, num_features), dtype=np.float32), 'active': np.zeros(0, dtype=bool)}
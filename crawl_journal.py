@@ -0,0 +1,148 @@
+# IMPORTS
+import datetime
+import sqlite3
+import threading
+from html_cache import date_key
+
+JOURNAL_PATH = 'crawl_journal.db'
+
+# CLASSES
+class CrawlJournal:
+	"""
+	SQLite journal of every listing a crawl has to visit and how far it got, so an interrupted crawl can pick up where it stopped.
+	A run is identified by its day and the parameters of the crawl, e.g. the radius and mode, as built by run_id, so a different crawl on the same day starts afresh instead of resuming another one. Each listing is recorded per run as 'pending' when the crawl starts, then 'done' once its batch has been saved or 'failed' with the reason if it could not be downloaded or parsed. Every change is committed straight away, so a crash, Ctrl-C or laptop sleep loses at most the batch being processed.
+	Parameters
+	----------
+	journal_path : str -> Default = 'crawl_journal.db'
+		Path to the journal database.
+	"""
+
+	def __init__(self, journal_path=JOURNAL_PATH):
+		self.journal_path = journal_path
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(journal_path, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS crawl (
+			run_id TEXT NOT NULL, property_id TEXT NOT NULL, property_link TEXT NOT NULL,
+			status TEXT NOT NULL, reason TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated TEXT,
+			PRIMARY KEY (run_id, property_id))''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS idx_crawl_status ON crawl (run_id, status)')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started TEXT NOT NULL, finished TEXT)')
+		self.conn.commit()
+
+	def start(self, run, property_links):
+		"""
+		Records the listings a run has to visit as pending. If the run was interrupted, listings already in the journal keep their status. If it finished, it starts again from scratch.
+		Parameters
+		----------
+		run : str
+			Run ID from run_id.
+
+		property_links : list
+			Links to the listing pages to visit.
+		Returns
+		------
+		"""
+
+		rows = [(run, link.split('/')[-1], link, 'pending', _now()) for link in property_links]
+		with self.lock, self.conn:
+			if self.conn.execute('SELECT 1 FROM runs WHERE run_id = ? AND finished IS NOT NULL', (run,)).fetchone() is not None:
+				self.conn.execute('DELETE FROM crawl WHERE run_id = ?', (run,))
+			self.conn.execute('INSERT OR REPLACE INTO runs (run_id, started, finished) VALUES (?, ?, NULL)', (run, _now()))
+			self.conn.executemany('''INSERT OR IGNORE INTO crawl (run_id, property_id, property_link, status, updated)
+				VALUES (?, ?, ?, ?, ?)''', rows)
+
+	def has_run(self, run):
+		"""
+		Whether a run was started and has not finished yet, so it can be resumed.
+		"""
+
+		with self.lock:
+			return self.conn.execute('SELECT 1 FROM runs WHERE run_id = ? AND finished IS NULL', (run,)).fetchone() is not None
+
+	def finish(self, run):
+		"""
+		Records that a run is complete, so the next run with the same ID starts afresh rather than resuming it.
+		"""
+
+		with self.lock, self.conn:
+			self.conn.execute('UPDATE runs SET finished = ? WHERE run_id = ?', (_now(), run))
+
+	def remaining(self, run, retry_failed=True, max_attempts=3):
+		"""
+		Links still to visit for a run: every pending listing and, if asked, every failed listing that has not used up its attempts.
+		Parameters
+		----------
+		run : str
+			Run ID from run_id.
+
+		retry_failed : bool -> Default = True
+			Whether to include failed listings.
+
+		max_attempts : int -> Default = 3
+			Failed listings that have already been tried this many times are not retried.
+		Returns
+		------
+		property_links : list
+			Links to the listing pages to visit, in the order they were recorded.
+		"""
+
+		with self.lock:
+			rows = self.conn.execute('''SELECT property_link FROM crawl WHERE run_id = ?
+				AND (status = 'pending' OR (? AND status = 'failed' AND attempts < ?)) ORDER BY rowid''',
+				(run, retry_failed, max_attempts)).fetchall()
+		return [row[0] for row in rows]
+
+	def mark_done(self, run, property_ids):
+		"""
+		Marks listings as saved. Called once per batch, after the batch has been written to the database and history store.
+		"""
+
+		rows = [(_now(), run, str(property_id)) for property_id in property_ids]
+		with self.lock, self.conn:
+			self.conn.executemany('''UPDATE crawl SET status = 'done', reason = NULL, attempts = attempts + 1, updated = ?
+				WHERE run_id = ? AND property_id = ?''', rows)
+
+	def mark_failed(self, run, property_link, reason):
+		"""
+		Marks a listing as failed with the reason, e.g. the exception raised while downloading or parsing it.
+		"""
+
+		with self.lock, self.conn:
+			self.conn.execute('''UPDATE crawl SET status = 'failed', reason = ?, attempts = attempts + 1, updated = ?
+				WHERE run_id = ? AND property_id = ?''', (str(reason), _now(), run, property_link.split('/')[-1]))
+
+	def summary(self, run):
+		"""
+		Number of listings in each status for a run, e.g. {'done': 1790, 'failed': 10}.
+		"""
+
+		with self.lock:
+			rows = self.conn.execute('SELECT status, COUNT(*) FROM crawl WHERE run_id = ? GROUP BY status', (run,)).fetchall()
+		return dict(rows)
+
+	def failures(self, run):
+		"""
+		(property_link, reason, attempts) of every failed listing in a run.
+		"""
+
+		with self.lock:
+			return self.conn.execute('''SELECT property_link, reason, attempts FROM crawl WHERE run_id = ? AND status = 'failed'
+				ORDER BY rowid''', (run,)).fetchall()
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
+
+
+# FUNCTIONS
+def run_id(run_date, **params):
+	"""
+	ID of a crawl run from its day and parameters, e.g. run_id('18 October 2026', radius=5, mode='stale') gives '2026-10-18|mode=stale|radius=5'.
+	"""
+
+	return '|'.join([date_key(run_date)] + [f'{name}={value}' for name, value in sorted(params.items())])
+
+
+def _now():
+	return datetime.datetime.now().isoformat(timespec='seconds')
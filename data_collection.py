@@ -1,12 +1,6 @@
+from cli import main
 
-from data_utils import scrape_flats, populate_database, get_existing_properties
-import pandas as pd
-from joblib import load
-
-# Import pre-fit transformation pipeline and tuned ML model
-pipeline = load('full_pipeline.joblib')
-model = load('tuned_model.joblib')
-
-# Scrape data and populate database
-scrape_flats(transformation_pipeline = pipeline, model = model, radius = 5, database_path = 'real_estate.db')
-populate_database(database_path = 'real_estate.db')
\ No newline at end of file
+# Scrape data straight into the database, predicting with the pre-fit transformation pipeline and tuned ML model. Same as `python cli.py scrape --radius 5 --mode stale`.
+# Guarded so the parse processes, which import this script again under the spawn start method, do not start a scrape of their own.
+if __name__ == '__main__':
+	main(['scrape', '--radius', '5', '--mode', 'stale', '--database', 'real_estate.db'])
@@ -1,23 +1,103 @@
 # IMPORTS
 import pandas as pd
-from selenium import webdriver
-from time import sleep
-import random
-import requests
-from bs4 import BeautifulSoup
 import datetime
-import sqlite3
 import os
+from typing import NamedTuple
 from joblib import load
+from history_store import HISTORY_DIR, append_history
+from html_cache import HtmlCache, date_key
+from index_crawler import discover_listings
+from listing_parser import listings_to_frame
+from scrape_pipeline import run_pipeline
+from database import ISO_SCRAPE_DATE, connect, upsert_rentals, populate_database
+from crawl_journal import CrawlJournal, run_id
+from prediction_cache import PredictionCache
+from run_metrics import RunMetrics
+from aggregates import create_aggregate_tables, update_aggregates
+from duplicates import create_duplicate_tables, assign_clusters
+from revisit_scheduler import create_state_table, update_index, due_listings, record_visits
 import warnings
 warnings.filterwarnings('ignore')
 
+# CLASSES
+class ScrapeSettings(NamedTuple):
+	"""
+	Options of a scrape, passed to scrape_flats and store_batch. Every option has a default, so only those that differ need to be given, e.g. ScrapeSettings(radius=5, mode='stale').
+	Parameters
+	----------
+	radius : int -> Default = 2
+		Radius around London in which to expand the search.
+
+	mode : str -> Default = 'full'
+		Which listings to visit. 'full' visits every listing, 'new' skips any listing already in the database and 'stale' skips listings scraped within the last stale_days days. 'scheduled' only visits new listings and those the revisit scheduler says are due. In every mode the search results are used to record which listings are still on the market.
+
+	stale_days : int -> Default = 7
+		Age in days after which a listing is scraped again in 'stale' mode.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site to scrape. Point this at the local fixture server to run offline.
+
+	max_workers : int -> Default = 8
+		Maximum number of listing pages requested at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all fetch threads.
+
+	batch_size : int -> Default = 100
+		Number of listings saved and marked done in the journal at a time. At most this many listings are lost if the crawl is interrupted.
+
+	max_attempts : int -> Default = 3
+		Number of times a failed listing is tried before it is left as failed.
+
+	cache_dir : str -> Default = 'html_cache'
+		Folder of the HTML cache every downloaded page is saved to. Use None to not cache pages.
+
+	cache_max_age_days : int -> Default = 30
+		Pages fetched more than this many days ago are evicted from the HTML cache at the end of the run. Use None to keep every page.
+
+	cache_max_bytes : int -> Default = None
+		If the HTML cache is still larger than this many bytes after that, its oldest days are evicted until it fits.
+
+	journal_path : str -> Default = 'crawl_journal.db'
+		Crawl journal of which listings of a run are pending, done or failed. A run with the same day, radius, mode and base_url that was interrupted, or left failures with attempts to spare, is resumed. Use None to not keep a journal.
+
+	metrics_dir : str -> Default = 'run_metrics'
+		Folder the run report and Prometheus metrics file are written to. Use None to not write them.
+
+	comparables_path : str -> Default = 'comparables.joblib'
+		Comparables index every saved batch is added to. Built from the rentals table the first time. Use None to not keep one.
+
+	prediction_cache_path : str -> Default = 'prediction_cache.db'
+		Cache of predictions keyed by a hash of each listing's model features and the model version, so unchanged listings are not scored again. Use None to score every listing.
+
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store every saved batch is appended to.
+	"""
+
+	radius: int = 2
+	mode: str = 'full'
+	stale_days: int = 7
+	base_url: str = 'https://www.openrent.co.uk/'
+	max_workers: int = 8
+	requests_per_second: float = 2.0
+	batch_size: int = 100
+	max_attempts: int = 3
+	cache_dir: str = 'html_cache'
+	cache_max_age_days: int = 30
+	cache_max_bytes: int = None
+	journal_path: str = 'crawl_journal.db'
+	metrics_dir: str = 'run_metrics'
+	comparables_path: str = 'comparables.joblib'
+	prediction_cache_path: str = 'prediction_cache.db'
+	history_dir: str = HISTORY_DIR
+
+
 # FUNCTIONS
-def scrape_flats(transformation_pipeline, model, database_path, radius=2):
+def scrape_flats(transformation_pipeline, model, database_path, settings=None, model_version=None):
 
 	"""
 	Scrapes Open Rent for flat listings in London, UK with a user-provided radius.
-	This function utilises a headless selenium instance to scroll to the bottom of the web-page before requesting the HTML in BeautifulSoup. This is because Open Rent uses lazy loading, and not all listings are shown when the web-page is loaded. The user needs to scroll all the way to the bottom to view all of the search results.
+	Open Rent uses lazy loading, and not all listings are shown when the web-page is loaded. The batches of results the page loads while scrolling are requested directly over HTTP, with a Selenium instance scrolling to the bottom of the page only used as a fallback.
 	Parameters
 	----------
 	transformation_pipeline : str
@@ -28,278 +108,287 @@ def scrape_flats(transformation_pipeline, model, database_path, radius=2):
 
 	database_path : str
 		Path to database. If in working directory then just name of the database.
-		
-	radius : int -> Default = 2
-		Radius around London in which to expand the search.
-	
+
+	settings : ScrapeSettings -> Default = None
+		Options of the scrape. The defaults of ScrapeSettings are used if not provided.
+
+	model_version : str -> Default = None
+		Version of the model artifacts as returned by predict.load_artifacts. Stored with each prediction so predict.py can find rows scored by an older model.
+
 	Returns
 	------
-	data : DataFrame
-		DataFrame containing all relevant information on scraped flats.
+	num_scraped : int
+		Number of listings scraped and stored.
 	"""
 
-	# Create variables for feedback
-	num_scraped = 0
-	today = datetime.date.today().strftime("%d %B %Y")
+	settings = settings or ScrapeSettings()
+	mode = settings.mode
+	cache = HtmlCache(settings.cache_dir) if settings.cache_dir is not None else None
 
-	""" EXCLUDE FOR NOW TO COLLECT MORE DATA, AND USE MORE IN DEPTH CALCS IN TABLEAU
 	# Check existing listings to avoid dupes
-	# try:
-	# 	existing_ids = get_existing_properties(database_path)
-	# except sqlite3.OperationalError:
-	# 	existing_ids = []
-	"""
-	existing_ids = []
-
-	# Request web page and simulate scrolling to bottom (Lazy Loading)
-	link = f'https://www.openrent.co.uk/properties-to-rent/london?term=London&area={radius}'
-	driver = webdriver.Safari()
-	driver.get(link)
-	sleep(random.randint(4,7))
-
-	lastHeight = driver.execute_script("return document.body.scrollHeight")
-	pause = 1
-	while True:
-		driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-		sleep(pause)
-		newHeight = driver.execute_script("return document.body.scrollHeight")
-		if newHeight == lastHeight:
-			break
-		lastHeight = newHeight
-
-	# Request entire web page source in BeautifulSoup to parse and close browser
-	sleep(random.randint(2,4))
-	html = driver.page_source
-	soup = BeautifulSoup(html, "html.parser")
-	driver.close()
-
-	# Create lists to hold data
-	property_link_list, property_id_list, title_list, description_list, location_list = ([] for i in range(5))
-	bedrooms_list, bathrooms_list, max_tenants_list, deposit_list, rent_list = ([] for i in range(5))
-	bills_included_list, student_list, family_list, pet_list, smoker_list = ([] for i in range(5))
-	avail_from_list, min_tenancy_list, garden_list, parking_list, fireplace_list = ([] for i in range(5))
-	furnishing_list, closest_station_list, closest_station_mins_list, postcode_list = ([] for i in range(4))
-	listing_type_list, region_loc_list, bed_bath_ratio_list = ([] for i in range(3))
-
-	# Scrape each listing
-	listings = soup.find_all(attrs={'class': 'pli clearfix'})
-	print(f'Found a total of {len(listings)} to scrape.')
-
-	for listing in listings:
-		property_link = 'https://www.openrent.co.uk/' + listing['href']
-		property_id = property_link.split('/')[-1]
-
-		# Visit detailed listings; only if not previously scraped
-		if property_id in existing_ids:
-			pass
+	if mode == 'full':
+		existing_ids = set()
+	elif mode == 'new':
+		existing_ids = get_existing_properties(database_path)
+	elif mode == 'stale':
+		existing_ids = get_existing_properties(database_path, max_age_days=settings.stale_days)
+	elif mode == 'scheduled':
+		existing_ids = set()
+	else:
+		raise ValueError(f"mode must be 'full', 'new', 'stale' or 'scheduled', not {mode!r}")
 
-		else:
-			try:
-				sub_soup = BeautifulSoup(requests.get(property_link).text, 'html.parser')
-				title = sub_soup.find(attrs={'class': 'property-title'}).get_text().strip()
-				postcode = title.split(',')[-1].strip()
-				description = sub_soup.find(attrs={'class': 'description'}).get_text().strip()
-
-			# Overview Table
-				table = sub_soup.find(attrs={'class': 'table table-striped intro-stats'})
-				rows = table.find_all('td')
-				location = rows[1].get_text().strip()
-				bedrooms = int(rows[3].get_text().strip())
-				bathrooms = int(rows[5].get_text().strip())
-				max_tenants = int(rows[7].get_text().strip())
-
-			# Price & Bills
-				table = sub_soup.find_all(attrs={'class': 'table table-striped'})[0]
-				rows = table.find_all('td')
-				deposit = int(rows[1].get_text().strip().replace('£', '').replace(',','').split('.')[0])
-				rent_pcm = int(rows[3].get_text().strip().replace('£', '').replace(',','').split('.')[0])
-				bills_included = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-
-			# Tenant Preferences
-				table = sub_soup.find_all(attrs={'class': 'table table-striped'})[1]
-				rows = table.find_all('td')
-				student_friendly = 'Yes' if rows[1].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				family_friendly = 'Yes' if rows[3].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				pet_friendly = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				smoker_friendly = 'Yes' if rows[7].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-
-			# Availability
-				table = sub_soup.find_all(attrs={'class': 'table table-striped'})[2]
-				rows = table.find_all('td')
-				available = rows[1].get_text().strip()
-				avail_from = today if available == 'Today' else available
-				min_tenancy = int(rows[3].get_text().split()[0])
-
-			# Features
-				table = sub_soup.find_all(attrs={'class': 'table table-striped'})[3]
-				rows = table.find_all('td')
-				garden = 'Yes' if rows[1].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				parking = 'Yes' if rows[3].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				fireplace = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
-				furnishing = rows[7].get_text().strip()
-
-			# Transportation
-				table = sub_soup.find(attrs={'class': 'table table-striped mt-1'})
-				data_rows = table.find_all('td')[4:]
-				stations = data_rows[::3]
-				all_stations = [x.get_text().strip() for x in stations]
-				distances = data_rows[1::3]
-				closest_station = all_stations[0]
-				closest_station_mins = int(distances[0].get_text().strip().split()[0])
-
-			# Engineered Features
-				if 'studio' in title.lower():
-					listing_type = 'studio'
-				elif 'shared' in title.lower():
-					listing_type = 'shared'
-				elif 'maisonette' in title.lower():
-					listing_type = 'maisonette'
-				else:
-					listing_type = 'flat'
-				
-				if postcode[0].lower() == 'n':
-					region_loc = 'north'
-				elif postcode[0].lower() == 'e':
-					region_loc = 'east'
-				elif postcode[0].lower() == 's':
-					region_loc = 'south'
-				else:
-					region_loc = 'west'
-
-				bed_bath_ratio = bedrooms/bathrooms
-
-				property_id_list.append(property_id)
-				property_link_list.append(property_link)
-				title_list.append(title)
-				description_list.append(description)
-				location_list.append(location)
-				bedrooms_list.append(bedrooms)
-				bathrooms_list.append(bathrooms)
-				max_tenants_list.append(max_tenants)
-				deposit_list.append(deposit)
-				rent_list.append(rent_pcm)
-				bills_included_list.append(bills_included)
-				student_list.append(student_friendly)
-				family_list.append(family_friendly)
-				pet_list.append(pet_friendly)
-				smoker_list.append(smoker_friendly)
-				avail_from_list.append(avail_from)
-				min_tenancy_list.append(min_tenancy)
-				garden_list.append(garden)
-				parking_list.append(parking)
-				fireplace_list.append(fireplace)
-				furnishing_list.append(furnishing)
-				closest_station_list.append(closest_station)
-				closest_station_mins_list.append(closest_station_mins)
-				postcode_list.append(postcode)
-				listing_type_list.append(listing_type)
-				region_loc_list.append(region_loc)
-				bed_bath_ratio_list.append(bed_bath_ratio)
-
-				# Print feedback
-				num_scraped += 1
-				print(f"{num_scraped} new listings scraped")
-				sleep(random.randint(4,7))
-
-				# REMOVE THIS WHEN I ONLY WANT UNIQUE LISTINGS
-				existing_ids.append(property_id)
-			
-			except:
-				sleep(random.randint(1,2))
-				pass
-
-	# Create DataFrame
-	data_dict = {
-		'property_id':property_id_list, 'property_link':property_link_list, 'listing_title':title_list,
-		'description':description_list, 'location':location_list, 'num_bedrooms':bedrooms_list,
-		'num_bathrooms':bathrooms_list, 'max_tenants':max_tenants_list, 'deposit':deposit_list,
-		'rent_pcm':rent_list, 'bills_included':bills_included_list, 'student_friendly':student_list,
-		'family_friendly':family_list, 'pet_friendly':pet_list, 'smoker_friendly':smoker_list,
-		'available_from':avail_from_list, 'min_tenancy_months':min_tenancy_list, 'garden':garden_list,
-		'parking':parking_list, 'fireplace':fireplace_list, 'furnishing':furnishing_list,
-		'closest_station':closest_station_list, 'closest_station_mins':closest_station_mins_list, 
-		'postcode':postcode_list, 'listing_type':listing_type_list, 'region_loc':region_loc_list, 
-		'bed_bath_ratio':bed_bath_ratio_list}
-	
-	data = pd.DataFrame(data_dict)
-	data['scrape_date'] = today
-
-	# Make predictions
-	if len(data) > 0:
-		transformed_data = transformation_pipeline.transform(data)
-		predictions = model.predict(transformed_data)
-		data['predicted_monthly_rent'] = predictions
+	today = datetime.date.today().strftime("%d %B %Y")
+	metrics = RunMetrics()
+	conn = connect(database_path)
+	create_state_table(conn)
+	create_aggregate_tables(conn)
+	create_duplicate_tables(conn)
+	journal = CrawlJournal(settings.journal_path) if settings.journal_path is not None else None
+	comparables = None
+	if settings.comparables_path is not None and transformation_pipeline is not None:
+		# Imported here as sklearn is slow to import and only needed when scraping with a model
+		from comparables import load_comparables
+		comparables = load_comparables(transformation_pipeline, settings.comparables_path, database_path, version=model_version)
+	prediction_cache = None
+	if settings.prediction_cache_path is not None and model is not None and model_version is not None:
+		prediction_cache = PredictionCache(model_version, settings.prediction_cache_path)
+	run = run_id(today, radius=settings.radius, mode=mode, base_url=settings.base_url)
+	if journal is not None and journal.has_run(run):
+		# Resume today's run: only listings not saved yet and failures with attempts left
+		property_links = journal.remaining(run, max_attempts=settings.max_attempts)
+		print(f"Resuming today's crawl with {len(property_links)} listings left to scrape.")
 	else:
-		print("No new listings to predict.")
+		# Find every listing on the lazily loaded search results
+		hrefs, complete = discover_listings([settings.radius], base_url=settings.base_url, max_workers=settings.max_workers,
+			requests_per_second=settings.requests_per_second, cache=cache, today=today, metrics=metrics)
+		# The search results alone tell which listings are new, still on the market or delisted
+		update_index(conn, listing_links(hrefs, base_url=settings.base_url), today, complete=complete)
+		property_links = listing_links(hrefs, existing_ids, settings.base_url)
+		if mode == 'scheduled':
+			due = set(due_listings(conn, today))
+			property_links = [link for link in property_links if link.split('/')[-1] in due]
+			print(f"{len(property_links)} of the {len(hrefs)} listings are due a visit.")
+		if journal is not None:
+			journal.start(run, property_links)
+
+	def save_batch(batch):
+		store_batch(conn, batch, today, metrics, comparables, settings)
+		# Only mark listings done once they are safely stored
+		if journal is not None:
+			journal.mark_done(run, batch['property_id'])
+
+	def record_failure(property_link, reason):
+		if journal is not None:
+			journal.mark_failed(run, property_link, reason)
+
+	# Scrape each listing, saving each batch as soon as it has been predicted
+	try:
+		num_scraped = run_pipeline(property_links, today, transformation_pipeline=transformation_pipeline, model=model, persist=save_batch,
+			batch_size=settings.batch_size, max_workers=settings.max_workers, requests_per_second=settings.requests_per_second, cache=cache,
+			model_version=model_version, on_failure=record_failure, metrics=metrics, prediction_cache=prediction_cache)
+	finally:
+		metrics.finish()
+		if settings.metrics_dir is not None:
+			metrics.write(settings.metrics_dir)
+		conn.close()
+		if cache is not None:
+			if settings.cache_max_age_days is not None or settings.cache_max_bytes is not None:
+				cache.evict(max_age_days=settings.cache_max_age_days, max_bytes=settings.cache_max_bytes)
+			cache.close()
+		if comparables is not None:
+			comparables.save(settings.comparables_path)
+		if prediction_cache is not None:
+			prediction_cache.close()
+		if journal is not None:
+			failed = journal.summary(run).get('failed', 0)
+			if not journal.remaining(run, max_attempts=settings.max_attempts):
+				journal.finish(run)
+			journal.close()
 
 	# Print feedback
-	print(f"{len(data)} new listings scraped today.")
+	if num_scraped == 0:
+		print("No new listings to predict.")
+	print(f"{num_scraped} new listings scraped today.")
+	if journal is not None and failed:
+		print(f"{failed} listings failed and are recorded in {settings.journal_path}. Run again today to retry them.")
+	return num_scraped
 
-	# Export today's data to be dumped to Database
-	data.to_csv('scraped_data.csv', index=False)
 
-	# Append to existing CSV file to all historical data to be used in Tableau
-	try:
-		existing_data = pd.read_csv('all_rental_data.csv')
-		all_data = pd.concat([existing_data, data])
-		all_data.to_csv('all_rental_data.csv', index=False)
-		print(f"Listings appended to existing CSV file. In total there are {len(all_data)} listings in the Excel file.")
-	
-	except:
-		data.to_csv('all_rental_data.csv', index=False)
-		print("A new file has been created to hold all the listing data.")
+def replay_flats(transformation_pipeline, model, cache, replay_date, model_version=None):
+	"""
+	Rebuilds the listings scraped on one day from the HTML cache, re-running parsing, feature engineering and predictions without any network access. Nothing is saved; the rebuilt listings are returned.
+	Parameters
+	----------
+	transformation_pipeline : str
+		The custom transformation pipeline created while training the ML model.
+
+	model : str
+		The tuned machine learning model that was trained seperately.
 
+	cache : HtmlCache
+		The cache the pages were saved to when they were scraped, e.g. HtmlCache(ScrapeSettings().cache_dir).
 
-def populate_database(database_path):
+	replay_date : str
+		Day to rebuild, as 'YYYY-MM-DD' or '%d %B %Y'.
+
+	model_version : str -> Default = None
+		Version of the model artifacts, stored next to each prediction.
+
+	Returns
+	------
+	data : DataFrame
+		DataFrame containing all relevant information on the listings scraped that day.
 	"""
-	Dumps data scraped from Openrent today into database in current working directory. This step acts as a backup to the CSV file that also contains all of the listing information.
 
+	today = datetime.datetime.strptime(date_key(replay_date), "%Y-%m-%d").strftime("%d %B %Y")
+	frames = []
+	num_replayed = run_pipeline([], today, transformation_pipeline=transformation_pipeline, model=model, persist=frames.append, pages=cache.pages(replay_date), model_version=model_version)
+	cache.close()
+	print(f"{num_replayed} listings rebuilt from the HTML cache for {today}.")
+	if not frames:
+		return listings_to_frame([], today)
+	return pd.concat(frames, ignore_index=True)
+
+
+def scrape_listings(hrefs, existing_ids=None, base_url='https://www.openrent.co.uk/', max_workers=8, requests_per_second=2.0):
+	"""
+	Downloads and parses the detail page of each listing found on the search results page.
+	Pages are fetched concurrently through a shared keep-alive session while a global requests-per-second budget keeps the crawl polite.
 	Parameters
 	----------
-	data : dataframe
-		Data scraped from Openrent. Typically using the scrape_flats function.
-	
-	database_path : str
-		The path to the database where this data is stored. If in CWD then this is just the database name.
+	hrefs : list
+		The href of each 'pli clearfix' element on the search results page.
+
+	existing_ids : set -> Default = None
+		Property ID's to skip. Listings repeated on the results page are only visited once.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site the hrefs are relative to. Point this at a local fixture server to run offline.
+
+	max_workers : int -> Default = 8
+		Maximum number of listing pages requested at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all fetch threads.
+
+	Returns
+	------
+	data : DataFrame
+		DataFrame containing all relevant information on scraped listings.
+	"""
+
+	today = datetime.date.today().strftime("%d %B %Y")
+	frames = []
+	run_pipeline(listing_links(hrefs, existing_ids, base_url), today, persist=frames.append, max_workers=max_workers, requests_per_second=requests_per_second)
+	if not frames:
+		return listings_to_frame([], today)
+	return pd.concat(frames, ignore_index=True)
+
+
+def listing_links(hrefs, existing_ids=None, base_url='https://www.openrent.co.uk/'):
+	"""
+	Turns the hrefs on the search results page into links to each listing's page, skipping listings already held and any repeated on the page.
+	Parameters
+	----------
+	hrefs : list
+		The href of each 'pli clearfix' element on the search results page.
+
+	existing_ids : set -> Default = None
+		Property ID's to skip.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site the hrefs are relative to.
+
+	Returns
+	------
+	property_links : list
+		Links to the listing pages to visit.
+	"""
+
+	existing_ids = set(existing_ids) if existing_ids is not None else set()
+	property_links = []
+	for href in hrefs:
+		property_link = base_url + href
+		property_id = property_link.split('/')[-1]
+		if property_id not in existing_ids:
+			property_links.append(property_link)
+			existing_ids.add(property_id)
+	return property_links
+
+
+def store_batch(conn, batch, today, metrics, comparables=None, settings=None):
+	"""
+	Stores a batch of scraped and predicted listings everywhere they are kept: the rentals table with its revisit schedule, near-duplicate clusters and aggregate tables, the history store and the comparables index.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database, with the revisit, aggregate and near-duplicate tables created.
+
+	batch : DataFrame
+		Listings from run_pipeline.
+
+	today : str
+		Date of the scrape in '%d %B %Y' format.
+
+	metrics : RunMetrics
+		Records the time taken by each step.
+
+	comparables : ComparablesIndex -> Default = None
+		Comparables index to add the listings to.
+
+	settings : ScrapeSettings -> Default = None
+		Options of the scrape, for where the history store is kept. The defaults of ScrapeSettings are used if not provided.
 	Returns
 	------
+	batch : DataFrame
+		The stored listings, with their cluster_id.
 	"""
 
-	# Read in the data scraped from Openrent today
-	data = pd.read_csv('scraped_data.csv')
-
-	conn = sqlite3.connect(database_path)
-	data.to_sql('rentals', conn, if_exists='append', index=False, dtype={
-		'property_id':'text', 'property_link':'text', 'listing_title':'text', 'description':'text',
-		'location':'text', 'num_bedrooms':'integer', 'num_bathrooms':'integer', 'max_tenants':'integer', 
-		'deposit':'real', 'rent_pcm':'real', 'bills_included':'integer', 'student_friendly':'integer', 
-		'family_friendly':'integer', 'pet_friendly':'integer', 'smoker_friendly':'integer', 
-		'available_from':'text', 'min_tenancy_months':'integer', 'garden':'integer', 'parking':'integer',
-		'fireplace':'integer', 'furnishing':'text', 'closest_station':'text', 
-		'closest_station_mins':'integer', 'postcode':'text', 'scrape_date':'text', 'listing_type':'text', 
-		'region_loc':'text', 'bed_bath_ratio':'real', 'predicted_monthly_rent':'real'
-		})
-
-	# Delete data from today only
-	os.remove('scraped_data.csv')
-	print("Today's listings have been added to the SQLite database, and the temporary CSV file with today's listings has been removed.")
-
-def get_existing_properties(database_path):
+	# Group relisted copies of the same flat before the batch is stored
+	with metrics.timer('duplicates'):
+		batch = batch.assign(cluster_id=assign_clusters(conn, batch))
+	# Dump the batch straight into the database
+	with metrics.timer('db_write'):
+		upsert_rentals(conn, batch)
+		record_visits(conn, batch, today)
+	with metrics.timer('aggregates'):
+		update_aggregates(conn, batch)
+	# Append to the history store holding all historical data to be used in Tableau
+	with metrics.timer('history_append'):
+		append_history(batch, (settings or ScrapeSettings()).history_dir)
+	if comparables is not None:
+		with metrics.timer('comparables'):
+			comparables.add(batch)
+	return batch
+
+
+def get_existing_properties(database_path, max_age_days=None):
 	"""
 	Gets the existing property ID's from the database to avoid scraping duplicate listings.
+	With max_age_days, only the rows scraped since the cutoff are read, through the index on database.ISO_SCRAPE_DATE, rather than every row of the rentals table. The IDs are returned as a set so each membership check is constant time.
 	Parameters
 	----------
 	database_path : str
 		The path to the database where this data is stored. If in CWD then this is just the database name.
+
+	max_age_days : int -> Default = None
+		Only return listings last scraped within this many days. Listings older than this are left out so they get scraped again.
 	Returns
 	------
-	ids : list
-		List of the existing propery_id's in the database.
+	ids : set
+		Set of the existing propery_id's in the database.
 	"""
 
-	conn = sqlite3.connect(database_path)
-	conn.row_factory = lambda cursor, row: row[0]
-	c = conn.cursor()
-	ids = c.execute('SELECT property_id FROM rentals').fetchall()
+	conn = connect(database_path)
+	try:
+		if max_age_days is None:
+			ids = {str(row[0]) for row in conn.execute('SELECT DISTINCT property_id FROM rentals')}
+		else:
+			cutoff = (datetime.date.today() - datetime.timedelta(days=max_age_days)).isoformat()
+			# Without DISTINCT, SQLite range-scans the date index rather than scanning the table in property_id order
+			ids = {str(row[0]) for row in conn.execute(f'SELECT property_id FROM rentals WHERE {ISO_SCRAPE_DATE} >= ?', (cutoff,))}
+	finally:
+		conn.close()
+
 	print(f"There are already {len(ids)} listings in the database. Searching for new listings only...")
 	return ids
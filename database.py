@@ -0,0 +1,198 @@
+# IMPORTS
+import os
+import sqlite3
+import time
+import pandas as pd
+from aggregates import create_aggregate_tables, update_aggregates
+from duplicates import assign_clusters, create_duplicate_tables
+
+# Columns of the rentals table and their SQLite types
+RENTALS_COLUMNS = {
+	'property_id':'text', 'property_link':'text', 'listing_title':'text', 'description':'text',
+	'location':'text', 'num_bedrooms':'integer', 'num_bathrooms':'integer', 'max_tenants':'integer',
+	'deposit':'real', 'rent_pcm':'real', 'bills_included':'integer', 'student_friendly':'integer',
+	'family_friendly':'integer', 'pet_friendly':'integer', 'smoker_friendly':'integer',
+	'available_from':'text', 'min_tenancy_months':'integer', 'garden':'integer', 'parking':'integer',
+	'fireplace':'integer', 'furnishing':'text', 'closest_station':'text',
+	'closest_station_mins':'integer', 'postcode':'text', 'scrape_date':'text', 'listing_type':'text',
+	'region_loc':'text', 'bed_bath_ratio':'real', 'predicted_monthly_rent':'real', 'model_version':'text', 'cluster_id':'text'}
+
+# A listing is stored once per scrape date so its history is kept
+RENTALS_KEY = ('property_id', 'scrape_date')
+RENTALS_INDEXES = ['property_id', 'scrape_date', 'postcode', 'region_loc', 'cluster_id']
+
+# scrape_date is stored as '%d %B %Y' text, which does not sort by date. This expression turns it into 'YYYY-MM-DD' and is indexed, so date ranges are answered from the index.
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+ISO_SCRAPE_DATE = ("substr(scrape_date, -4) || '-' || CASE substr(scrape_date, 4, length(scrape_date) - 8) "
+	+ ' '.join(f"WHEN '{month}' THEN '{i:02d}'" for i, month in enumerate(MONTHS, 1)) + " END || '-' || substr(scrape_date, 1, 2)")
+
+# FUNCTIONS
+def connect(database_path):
+	"""
+	Opens the database in WAL mode and makes sure the rentals table has its primary key and indexes.
+	WAL lets Tableau and other readers keep reading while a scrape is writing.
+	Parameters
+	----------
+	database_path : str
+		The path to the database where this data is stored. If in CWD then this is just the database name.
+	Returns
+	------
+	conn : sqlite3.Connection
+		Open connection to the database.
+	"""
+
+	conn = sqlite3.connect(database_path)
+	conn.execute('PRAGMA journal_mode=WAL')
+	conn.execute('PRAGMA synchronous=NORMAL')
+	create_schema(conn)
+	return conn
+
+
+def create_schema(conn):
+	"""
+	Creates the rentals table with a primary key on (property_id, scrape_date) and indexes on the columns used for lookups.
+	Tables created by the old DataFrame.to_sql code have no primary key. They are rebuilt once, keeping the first copy of any listing stored twice on the same day.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+	Returns
+	------
+	"""
+
+	columns = ',\n\t\t'.join(f'{column} {sql_type}' + (' NOT NULL' if column in RENTALS_KEY else '') for column, sql_type in RENTALS_COLUMNS.items())
+	create_table = f'''CREATE TABLE IF NOT EXISTS {{table}} (
+		{columns},
+		PRIMARY KEY ({', '.join(RENTALS_KEY)}))'''
+
+	existing = {row[1]: row[5] for row in conn.execute('PRAGMA table_info(rentals)')}
+	with conn:
+		if existing and not any(existing.values()):
+			# Rebuild a table without a primary key
+			shared = ', '.join(column for column in RENTALS_COLUMNS if column in existing)
+			conn.execute(create_table.format(table='rentals_new'))
+			conn.execute(f'''INSERT OR IGNORE INTO rentals_new ({shared}) SELECT {shared} FROM rentals
+				WHERE property_id IS NOT NULL AND scrape_date IS NOT NULL ORDER BY rowid''')
+			conn.execute('DROP TABLE rentals')
+			conn.execute('ALTER TABLE rentals_new RENAME TO rentals')
+			print("The rentals table has been rebuilt with a primary key on (property_id, scrape_date).")
+		else:
+			conn.execute(create_table.format(table='rentals'))
+			add_missing_columns(conn, 'rentals', RENTALS_COLUMNS)
+
+		for column in RENTALS_INDEXES:
+			conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rentals_{column} ON rentals ({column})')
+		conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rentals_iso_scrape_date ON rentals ({ISO_SCRAPE_DATE}, property_id)')
+
+
+def populate_database(database_path, data=None):
+	"""
+	Dumps data scraped from Openrent into the database. This step acts as a backup to the history store that also contains all of the listing information.
+	Listings are upserted on (property_id, scrape_date) inside a single transaction, so running this twice on the same day never stores a listing twice.
+
+	Parameters
+	----------
+	database_path : str
+		The path to the database where this data is stored. If in CWD then this is just the database name.
+
+	data : dataframe -> Default = None
+		Data scraped from Openrent. Typically using the scrape_flats function. If not provided, the temporary scraped_data.csv file is loaded and removed afterwards.
+	Returns
+	------
+	rows_per_second : float
+		Write throughput of the upsert.
+	"""
+
+	# Read in the data scraped from Openrent today
+	from_csv = data is None
+	if from_csv:
+		data = pd.read_csv('scraped_data.csv')
+
+	conn = connect(database_path)
+	try:
+		create_duplicate_tables(conn)
+		data = data.assign(cluster_id=assign_clusters(conn, data))
+		rows_per_second = upsert_rentals(conn, data)
+		# Keep the tables dashboards read up to date with the new listings
+		create_aggregate_tables(conn)
+		update_aggregates(conn, data)
+	finally:
+		conn.close()
+
+	# Delete data from today only
+	if from_csv:
+		os.remove('scraped_data.csv')
+		print("Today's listings have been added to the SQLite database, and the temporary CSV file with today's listings has been removed.")
+	return rows_per_second
+
+
+def upsert_rentals(conn, data, batch_size=10000, replace=True):
+	"""
+	Writes listings into the rentals table, replacing any listing already stored for the same scrape date.
+	All rows are written with batched executemany calls inside a single transaction, so either the whole frame is stored or none of it is.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	data : DataFrame
+		Listings to store. Columns that are not part of the rentals table are ignored.
+
+	batch_size : int -> Default = 10000
+		Number of rows passed to each executemany call.
+
+	replace : bool -> Default = True
+		Replace listings already stored for the same scrape date. Otherwise the stored copy is kept and the new one skipped, e.g. when importing old history.
+	Returns
+	------
+	rows_per_second : float
+		Write throughput, to check the writer keeps up as the table grows.
+	"""
+
+	columns = [column for column in RENTALS_COLUMNS if column in data.columns]
+	updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column not in RENTALS_KEY)
+	on_conflict = f'DO UPDATE SET {updates}' if replace else 'DO NOTHING'
+	sql = f'''INSERT INTO rentals ({', '.join(columns)}) VALUES ({', '.join('?' for column in columns)})
+		ON CONFLICT ({', '.join(RENTALS_KEY)}) {on_conflict}'''
+
+	# Convert to plain Python values, with missing values as NULL
+	values = data[columns].astype(object).where(data[columns].notna(), None)
+	values['property_id'] = values['property_id'].astype(str)
+
+	start = time.perf_counter()
+	changes = conn.total_changes
+	with conn:
+		for batch_start in range(0, len(values), batch_size):
+			conn.executemany(sql, values.iloc[batch_start:batch_start + batch_size].itertuples(index=False, name=None))
+	elapsed = time.perf_counter() - start
+
+	# Listings skipped as already stored are not changes, so only count the rows actually written
+	num_written = conn.total_changes - changes
+	rows_per_second = len(values) / elapsed if elapsed > 0 else float('inf')
+	skipped = f", {len(values) - num_written} already stored were skipped" if num_written < len(values) else ''
+	print(f"{num_written} listings written to the rentals table{skipped} ({rows_per_second:,.0f} rows/s).")
+	return rows_per_second
+
+
+def add_missing_columns(conn, table, columns):
+	"""
+	Adds any of the given columns that a table does not have yet.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	table : str
+		Name of the table.
+
+	columns : dict
+		Column names mapped to their SQLite type.
+	Returns
+	------
+	"""
+
+	existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+	for column, sql_type in columns.items():
+		if existing and column not in existing:
+			conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {sql_type}')
+	conn.commit()
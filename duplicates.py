@@ -0,0 +1,259 @@
+# IMPORTS
+import re
+import zlib
+import numpy as np
+import pandas as pd
+
+# MinHash signature length and how it is split into bands for LSH. With 16 bands of 8 rows, two listings whose descriptions have a Jaccard similarity of 0.7 share a bucket with probability 1 - (1 - 0.7^8)^16, about 61%, rising to 95% at 0.8, while listings below 0.4 share one about 1% of the time.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Descriptions are compared as sets of overlapping runs of this many words
+SHINGLE_WORDS = 3
+
+# Multiply-shift hash functions h(x) = (a * x + b) >> 32 on 64 bit integers. The seed is fixed so signatures stored by earlier runs stay comparable.
+_state = np.random.RandomState(20240101)
+_A = _state.randint(0, 1 << 62, NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _state.randint(0, 1 << 62, NUM_PERM, dtype=np.int64).astype(np.uint64)
+_ROW_WEIGHTS = np.array([pow(1000003, i, 1 << 64) for i in range(ROWS)], dtype=np.uint64)
+
+# FUNCTIONS
+def create_duplicate_tables(conn):
+	"""
+	Creates the tables the near-duplicate index is kept in, and the cluster_market view of days on the market per cluster.
+	* listing_signature: one row per listing with its MinHash signature, rent, the day it was first seen and the ID of the cluster of relisted copies it belongs to.
+	* lsh_buckets: the LSH buckets of each band of the signatures, so candidates are found with an index lookup instead of comparing every pair of listings. A bucket holds one listing per cluster, as a copy in the same bucket adds nothing to compare against.
+	If the tables are new they are filled from the listings already in the rentals table.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database, as returned by database.connect.
+	Returns
+	------
+	"""
+
+	exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listing_signature'").fetchone() is not None
+	with conn:
+		conn.execute('''CREATE TABLE IF NOT EXISTS listing_signature (
+			property_id TEXT PRIMARY KEY, cluster_id TEXT NOT NULL, first_seen TEXT, rent_pcm REAL, signature BLOB NOT NULL)''')
+		conn.execute('CREATE INDEX IF NOT EXISTS idx_listing_signature_cluster_id ON listing_signature (cluster_id)')
+		conn.execute('''CREATE TABLE IF NOT EXISTS lsh_buckets (
+			bucket INTEGER NOT NULL, property_id TEXT NOT NULL, PRIMARY KEY (bucket, property_id)) WITHOUT ROWID''')
+		if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listing_state'").fetchone() is not None:
+			conn.execute('''CREATE VIEW IF NOT EXISTS cluster_market AS SELECT s.cluster_id, COUNT(*) AS listings,
+				MIN(m.first_seen) AS first_seen, MAX(m.last_seen) AS last_seen,
+				CAST(julianday(MAX(m.last_seen)) - julianday(MIN(m.first_seen)) + 1 AS INTEGER) AS days_on_market,
+				MAX(m.delisted_on IS NULL) AS on_market
+				FROM listing_state m JOIN listing_signature s ON s.property_id = m.property_id GROUP BY s.cluster_id''')
+
+	if not exists:
+		_backfill(conn)
+
+
+def assign_clusters(conn, data, threshold=0.7, rent_tolerance=0.15):
+	"""
+	Finds the cluster of relisted copies each listing belongs to, adding new listings to the near-duplicate index.
+	Two listings are copies of each other if they are in the same postcode district, have the same number of bedrooms, rents within rent_tolerance of each other and an estimated Jaccard similarity of their title and description shingles of at least threshold. Candidates are only looked up in the LSH buckets of each new listing, and each bucket keeps one listing per cluster, so the cost depends on the size of the batch and the number of clusters sharing its buckets, rather than the size of the history or of the clusters.
+	A cluster's ID is the property_id of the first listing in it, and a listing keeps its cluster on every later scrape. When a new listing joins two clusters, the newer cluster is merged into the older one and its rows in the rentals table are updated.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database. The tables must have been created with create_duplicate_tables.
+
+	data : DataFrame
+		Listings with property_id, listing_title, description, postcode, num_bedrooms, rent_pcm and scrape_date columns.
+
+	threshold : float -> Default = 0.7
+		Lowest estimated Jaccard similarity of two listings that are copies.
+
+	rent_tolerance : float -> Default = 0.15
+		Largest difference in rent of two listings that are copies, as a fraction of the higher rent.
+	Returns
+	------
+	cluster_ids : Series
+		Cluster ID of each listing, with the same index as data.
+	"""
+
+	ids = data['property_id'].astype(str)
+	listings = pd.DataFrame({
+		'property_id': ids.values,
+		'text': (data['listing_title'].astype(object).fillna('') + ' ' + data['description'].astype(object).fillna('')).values,
+		'block': _blocks(data).values,
+		'rent_pcm': pd.to_numeric(data['rent_pcm'], errors='coerce').astype('float64').values,
+		'first_seen': pd.to_datetime(data['scrape_date'], format="%d %B %Y", errors='coerce').dt.strftime("%Y-%m-%d").values})
+	listings = listings.sort_values('first_seen', kind='stable').drop_duplicates('property_id')
+
+	known = {}
+	for chunk in _chunks(listings['property_id'].tolist()):
+		known.update(conn.execute(f"SELECT property_id, cluster_id FROM listing_signature WHERE property_id IN ({', '.join('?' for i in chunk)})", chunk))
+	new = listings[~listings['property_id'].isin(known.keys())].reset_index(drop=True)
+	if new.empty:
+		return ids.map(known)
+
+	signatures = np.vstack([minhash(text) for text in new['text']])
+	buckets = bucket_keys(signatures, new['block']).tolist()
+
+	# Listings already indexed that share a bucket with a new listing
+	candidates = {}
+	for chunk in _chunks(sorted({bucket for row in buckets for bucket in row})):
+		for bucket, property_id in conn.execute(f"SELECT bucket, property_id FROM lsh_buckets WHERE bucket IN ({', '.join('?' for i in chunk)})", chunk):
+			candidates.setdefault(bucket, []).append(property_id)
+	indexed = {}
+	for chunk in _chunks(sorted({property_id for members in candidates.values() for property_id in members})):
+		for property_id, cluster_id, first_seen, rent_pcm, signature in conn.execute(
+			f"SELECT property_id, cluster_id, first_seen, rent_pcm, signature FROM listing_signature WHERE property_id IN ({', '.join('?' for i in chunk)})", chunk):
+			indexed[property_id] = (cluster_id, np.frombuffer(signature, dtype=np.uint32), rent_pcm)
+	cluster_start = {}
+	for chunk in _chunks(sorted({cluster_id for cluster_id, signature, rent_pcm in indexed.values()})):
+		cluster_start.update(conn.execute(
+			f"SELECT cluster_id, MIN(first_seen) FROM listing_signature WHERE cluster_id IN ({', '.join('?' for i in chunk)}) GROUP BY cluster_id", chunk))
+
+	merged = {}
+	def find(cluster_id):
+		while cluster_id in merged:
+			cluster_id = merged[cluster_id]
+		return cluster_id
+
+	# New listings are added oldest first, so each can match the new listings before it
+	new_buckets = []
+	for row, listing in enumerate(new.itertuples(index=False)):
+		signature = signatures[row].astype(np.uint32)
+		matched = set()
+		for other in {property_id for bucket in buckets[row] for property_id in candidates.get(bucket, ())}:
+			cluster_id, other_signature, other_rent = indexed[other]
+			# One match is enough to join a cluster, so skip the other members of clusters already matched
+			if find(cluster_id) not in matched and np.mean(signature == other_signature) >= threshold and _similar_rent(listing.rent_pcm, other_rent, rent_tolerance):
+				matched.add(find(cluster_id))
+
+		if matched:
+			cluster_id = min(matched, key=lambda cluster: (cluster_start.get(cluster) or '', cluster))
+			for other_cluster in matched - {cluster_id}:
+				merged[other_cluster] = cluster_id
+		else:
+			cluster_id = listing.property_id
+			cluster_start[cluster_id] = listing.first_seen
+		indexed[listing.property_id] = (cluster_id, signature, listing.rent_pcm)
+		# Only index the buckets no member of the cluster is in yet, so buckets do not grow with the size of the clusters
+		new_buckets.append([bucket for bucket in buckets[row] if not any(find(indexed[other][0]) == cluster_id for other in candidates.get(bucket, ()))])
+		for bucket in new_buckets[-1]:
+			candidates.setdefault(bucket, []).append(listing.property_id)
+
+	clusters = {property_id: find(cluster_id) for property_id, cluster_id in known.items()}
+	clusters.update((property_id, find(indexed[property_id][0])) for property_id in new['property_id'])
+	merges = [(find(cluster_id), cluster_id) for cluster_id in merged]
+	with conn:
+		conn.executemany('INSERT INTO listing_signature VALUES (?, ?, ?, ?, ?)', [
+			(listing.property_id, clusters[listing.property_id], listing.first_seen, None if pd.isna(listing.rent_pcm) else float(listing.rent_pcm),
+			signatures[row].astype(np.uint32).tobytes()) for row, listing in enumerate(new.itertuples(index=False))])
+		conn.executemany('INSERT OR IGNORE INTO lsh_buckets VALUES (?, ?)',
+			[(bucket, property_id) for property_id, row in zip(new['property_id'], new_buckets) for bucket in row])
+		conn.executemany('UPDATE listing_signature SET cluster_id = ? WHERE cluster_id = ?', merges)
+		conn.executemany('UPDATE rentals SET cluster_id = ? WHERE cluster_id = ?', merges)
+
+	num_copies = sum(clusters[property_id] != property_id for property_id in new['property_id'])
+	if num_copies or merges:
+		print(f"{num_copies} of the {len(new)} new listings are relisted copies of other listings. {len(merges)} clusters merged.")
+	return ids.map(clusters)
+
+
+def rebuild_clusters(conn, chunk_size=50000):
+	"""
+	Rebuilds the near-duplicate index and the cluster_id of every row in the rentals table from scratch, e.g. after changing the threshold.
+	Listings are read and indexed chunk_size rows at a time in the order they were stored, so memory use does not depend on the size of the history.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	chunk_size : int -> Default = 50000
+		Number of rows of the rentals table indexed at a time.
+	Returns
+	------
+	"""
+
+	create_duplicate_tables(conn)
+	with conn:
+		conn.execute('DELETE FROM listing_signature')
+		conn.execute('DELETE FROM lsh_buckets')
+	_backfill(conn, chunk_size)
+
+
+def minhash(text):
+	"""
+	MinHash signature of the word shingles of a text.
+	Text is lower cased and split into words, ignoring punctuation, so small edits like reformatting or a changed sentence only change a few shingles.
+	Parameters
+	----------
+	text : str
+		Listing title and description.
+	Returns
+	------
+	signature : ndarray
+		NUM_PERM minimum hashes.
+	"""
+
+	words = re.findall(r'[a-z0-9]+', text.lower())
+	shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+	hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+	return ((_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+def bucket_keys(signatures, blocks):
+	"""
+	LSH bucket of each band of each signature.
+	Each band's bucket also depends on the listing's block of postcode district and number of bedrooms, so only listings of the same flat size in the same area are ever compared.
+	Parameters
+	----------
+	signatures : ndarray
+		MinHash signatures, one row per listing.
+
+	blocks : Series
+		Postcode district and number of bedrooms of each listing.
+	Returns
+	------
+	buckets : ndarray
+		BANDS signed 64 bit bucket keys per listing.
+	"""
+
+	block_hashes = np.array([zlib.crc32(block.encode('utf-8')) for block in blocks], dtype=np.uint64)
+	bands = signatures.astype(np.uint64).reshape(len(signatures), BANDS, ROWS)
+	keys = (bands * _ROW_WEIGHTS).sum(axis=2, dtype=np.uint64)
+	keys ^= block_hashes[:, None] * np.uint64(0x9E3779B97F4A7C15)
+	keys += np.arange(BANDS, dtype=np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+	return keys.view(np.int64)
+
+
+def _blocks(data):
+	districts = data['postcode'].astype(object).fillna('').astype(str).str.strip().str.upper().str.split(' ').str[0]
+	bedrooms = pd.to_numeric(data['num_bedrooms'], errors='coerce').astype('Int64').astype(str)
+	return districts + '|' + bedrooms
+
+
+def _similar_rent(rent, other_rent, rent_tolerance):
+	if rent is None or other_rent is None or pd.isna(rent) or pd.isna(other_rent):
+		return True
+	return abs(rent - other_rent) <= rent_tolerance * max(rent, other_rent)
+
+
+def _backfill(conn, chunk_size=50000):
+	# Index the listings already stored, then copy their clusters onto the rentals table
+	columns = 'rowid, property_id, listing_title, description, postcode, num_bedrooms, rent_pcm, scrape_date'
+	last_rowid = 0
+	while True:
+		chunk = pd.read_sql(f'SELECT {columns} FROM rentals WHERE rowid > ? ORDER BY rowid LIMIT ?', conn, params=(last_rowid, chunk_size))
+		if chunk.empty:
+			break
+		assign_clusters(conn, chunk)
+		last_rowid = int(chunk['rowid'].iloc[-1])
+
+	if last_rowid:
+		with conn:
+			conn.execute('UPDATE rentals SET cluster_id = (SELECT cluster_id FROM listing_signature s WHERE s.property_id = rentals.property_id)')
+		num_listings, num_clusters = conn.execute('SELECT COUNT(*), COUNT(DISTINCT cluster_id) FROM listing_signature').fetchone()
+		print(f"Near-duplicate index built for the {num_listings} listings already in the rentals table, in {num_clusters} clusters.")
+
+
+def _chunks(values, size=500):
+	for start in range(0, len(values), size):
+		yield values[start:start + size]
@@ -0,0 +1,114 @@
+# IMPORTS
+import numpy as np
+import pandas as pd
+
+# FUNCTIONS
+def engineer_features(data):
+	"""
+	Adds the engineered features used by the model to a whole DataFrame of listings at once.
+	Used both for freshly scraped listings and for re-featurizing stored history.
+	Parameters
+	----------
+	data : DataFrame
+		Listings with listing_title, postcode, num_bedrooms and num_bathrooms columns.
+
+	Returns
+	------
+	data : DataFrame
+		The same DataFrame with listing_type, region_loc and bed_bath_ratio columns added.
+	"""
+
+	data['listing_type'] = listing_type(data['listing_title'])
+	data['region_loc'] = region_loc(data['postcode'])
+	data['bed_bath_ratio'] = bed_bath_ratio(data['num_bedrooms'], data['num_bathrooms'])
+	return data
+
+
+def listing_type(titles):
+	"""
+	Groups listings into studio, shared, maisonette or flat based on the words in their title. The first match in that order wins.
+	"""
+
+	titles = titles.astype(str).str.lower()
+	conditions = [titles.str.contains('studio', regex=False), titles.str.contains('shared', regex=False), titles.str.contains('maisonette', regex=False)]
+	return pd.Series(np.select(conditions, ['studio', 'shared', 'maisonette'], default='flat'), index=titles.index)
+
+
+def region_loc(postcodes):
+	"""
+	Maps each postcode to north, east or south London from its first letter. Anything else is west.
+	"""
+
+	first_letter = postcodes.astype(str).str[:1].str.lower()
+	conditions = [first_letter == 'n', first_letter == 'e', first_letter == 's']
+	return pd.Series(np.select(conditions, ['north', 'east', 'south'], default='west'), index=postcodes.index)
+
+
+def bed_bath_ratio(bedrooms, bathrooms):
+	"""
+	Number of bedrooms per bathroom. Listings with 0 bathrooms get NaN rather than a division by zero, which the model pipeline's imputer fills in.
+	"""
+
+	bedrooms = pd.to_numeric(bedrooms, errors='coerce').astype('float64')
+	bathrooms = pd.to_numeric(bathrooms, errors='coerce').astype('float64')
+	return bedrooms / bathrooms.where(bathrooms > 0)
+
+
+def parse_price(prices):
+	"""
+	Strips the pound sign and thousands separators from prices such as '£1,850.00'.
+	Parameters
+	----------
+	prices : Series
+		Prices as text. Values that are already numbers are kept.
+
+	Returns
+	------
+	prices : Series
+		Cleaned prices.
+	"""
+
+	text = prices.astype(str).str.replace('£', '', regex=False).str.replace(',', '', regex=False).str.strip()
+	return pd.to_numeric(text.str.split('.').str[0], errors='coerce').astype('Int64')
+
+
+def first_number(values):
+	"""
+	Takes the leading number from text such as '12 Months' or '5 mins walk'.
+	"""
+
+	return pd.to_numeric(values.astype(str).str.strip().str.split().str[0], errors='coerce').astype('Int64')
+
+
+def postcode_from_title(titles):
+	"""
+	Takes the postcode from the end of a listing title such as '2 Bed Flat, Rotherhithe Street, SE16'.
+	"""
+
+	return titles.astype(str).str.split(',').str[-1].str.strip()
+
+
+def fill_today(available_from, scrape_dates):
+	"""
+	Replaces an available from date of 'Today' with the date the listing was scraped.
+	"""
+
+	return available_from.where(available_from.astype(str).str.strip() != 'Today', scrape_dates)
+
+
+def yes_no(flags):
+	"""
+	Normalises flags stored as booleans, 0/1 or text to the 'Yes'/'No' strings the model pipeline was trained on.
+	"""
+
+	return pd.Series(np.where(to_bool(flags).fillna(False), 'Yes', 'No'), index=flags.index).where(flags.notna())
+
+
+def to_bool(flags):
+	"""
+	Converts flags stored as 'Yes'/'No' text, 0/1 or booleans to a nullable boolean Series. Missing flags stay missing.
+	"""
+
+	text = flags.astype(str).str.strip().str.lower()
+	yes = text.isin(['yes', 'true', '1', '1.0', 'fa-check'])
+	return pd.Series(yes, index=flags.index, dtype='boolean').where(flags.notna())
@@ -0,0 +1,174 @@
+# IMPORTS
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# CLASSES
+class RateLimiter:
+	"""
+	Global requests-per-second budget shared by every fetch thread.
+	Each call to wait() reserves the next free time slot and sleeps until it arrives, so the combined request rate across all threads never exceeds the budget no matter how many workers are running.
+	Parameters
+	----------
+	requests_per_second : float
+		Maximum number of requests to start per second. A value of 0 or None disables the limit.
+	"""
+
+	def __init__(self, requests_per_second):
+		self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+		self.next_slot = time.monotonic()
+		self.lock = threading.Lock()
+
+	def wait(self):
+		if not self.interval:
+			return
+
+		with self.lock:
+			now = time.monotonic()
+			slot = max(self.next_slot, now)
+			self.next_slot = slot + self.interval
+
+		if slot > now:
+			time.sleep(slot - now)
+
+
+# FUNCTIONS
+def create_session(pool_size=8, retries=2):
+	"""
+	Creates a requests Session that keeps connections alive and can hold one pooled connection per fetch thread.
+	Requests refused with 429 or a 5xx error, or whose connection fails, are retried with an exponential back off, honouring any Retry-After header.
+	Parameters
+	----------
+	pool_size : int -> Default = 8
+		Number of connections to keep open per host. Should match the number of fetch threads.
+
+	retries : int -> Default = 2
+		Number of times a request is retried before it counts as failed.
+
+	Returns
+	------
+	session : requests.Session
+		Session to share between all fetch threads.
+	"""
+
+	session = requests.Session()
+	retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',), raise_on_status=False)
+	adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	return session
+
+
+def fetch_pages(links, max_workers=8, requests_per_second=2.0, session=None, timeout=30):
+	"""
+	Downloads listing pages concurrently through a shared keep-alive session.
+	Replaces the sequential requests.get + sleep loop. The number of requests in flight is bounded by max_workers and the overall request rate is bounded by requests_per_second.
+	Parameters
+	----------
+	links : list
+		Links to the pages to download.
+
+	max_workers : int -> Default = 8
+		Maximum number of requests in flight at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all workers. Use 0 to disable (only against a local fixture server).
+
+	session : requests.Session -> Default = None
+		Session to reuse. A new pooled session is created and closed if not provided.
+
+	timeout : int -> Default = 30
+		Seconds to wait for each response.
+
+	Returns
+	------
+	pages : list
+		List of (link, html) tuples in the same order as links. html is None if the request failed.
+	"""
+
+	return list(iter_pages(links, max_workers=max_workers, requests_per_second=requests_per_second, session=session, timeout=timeout))
+
+
+def iter_pages(links, max_workers=8, requests_per_second=2.0, session=None, timeout=30, on_error=None, metrics=None):
+	"""
+	Generator version of fetch_pages that yields each page as soon as it and every page before it have arrived.
+	At most 2 * max_workers pages are requested ahead of the consumer, so a slow consumer slows down fetching instead of letting downloaded pages pile up in memory.
+	Parameters
+	----------
+	links : iterable
+		Links to the pages to download.
+
+	max_workers : int -> Default = 8
+		Maximum number of requests in flight at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all workers.
+
+	session : requests.Session -> Default = None
+		Session to reuse. A new pooled session is created and closed if not provided.
+
+	timeout : int -> Default = 30
+		Seconds to wait for each response.
+
+	on_error : callable -> Default = None
+		Called with the link and the exception whenever a request fails.
+
+	metrics : RunMetrics -> Default = None
+		Records the latency, size and retries of each request under the 'fetch' stage, and failures by exception type.
+
+	Returns
+	------
+	pages : generator
+		(link, html) tuples in the same order as links. html is None if the request failed.
+	"""
+
+	own_session = session is None
+	if own_session:
+		session = create_session(pool_size=max_workers)
+	limiter = RateLimiter(requests_per_second)
+
+	def fetch(link):
+		limiter.wait()
+		start = time.perf_counter()
+		try:
+			response = session.get(link, timeout=timeout)
+			response.raise_for_status()
+		except requests.RequestException as e:
+			if metrics is not None:
+				metrics.observe('fetch', time.perf_counter() - start)
+				metrics.failure('fetch', e)
+			if on_error is not None:
+				on_error(link, e)
+			return link, None
+		if metrics is not None:
+			record_response(metrics, 'fetch', response, time.perf_counter() - start)
+		return link, response.text
+
+	try:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			pending = deque()
+			for link in links:
+				pending.append(executor.submit(fetch, link))
+				if len(pending) >= 2 * max_workers:
+					yield pending.popleft().result()
+			while pending:
+				yield pending.popleft().result()
+	finally:
+		if own_session:
+			session.close()
+
+
+def record_response(metrics, stage, response, seconds):
+	"""
+	Records the latency, size and number of retries of a successful response.
+	"""
+
+	metrics.observe(stage, seconds)
+	metrics.add_bytes(len(response.content))
+	retries = getattr(response.raw, 'retries', None)
+	if retries is not None and retries.history:
+		metrics.retry(stage, len(retries.history))
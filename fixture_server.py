@@ -0,0 +1,160 @@
+# IMPORTS
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# CLASSES
+class FixtureHandler(BaseHTTPRequestHandler):
+	"""
+	Serves saved OpenRent HTML, after waiting server.latency seconds to mimic a real round trip.
+	The search results page mimics Open Rent's lazy loading: each request returns the next server.batch_size 'pli clearfix' links starting at the skip query parameter. Every numeric path is answered with one of the saved listing pages. The path of every request is recorded in server.requests.
+	"""
+
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		url = urlsplit(self.path)
+		path = url.path.strip('/')
+		self.server.requests.append(self.path)
+		time.sleep(self.server.latency)
+
+		if path.startswith('properties-to-rent'):
+			skip = int(parse_qs(url.query).get('skip', ['0'])[0])
+			num_links = max(0, min(self.server.batch_size, self.server.num_listings - skip))
+			body = build_index_page(num_links, first_id=1000000 + skip).encode('utf-8')
+		elif path.isdigit():
+			pages = self.server.listing_pages
+			body = pages[int(path) % len(pages)]
+		else:
+			self.send_error(404)
+			return
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+# FUNCTIONS
+def build_index_page(num_listings, first_id=1000000):
+	"""
+	Builds a search results page, or one lazily loaded batch of it, containing num_listings 'pli clearfix' links.
+	Parameters
+	----------
+	num_listings : int
+		Number of listings on the page.
+
+	first_id : int -> Default = 1000000
+		Property ID of the first listing. Following listings count up from here.
+
+	Returns
+	------
+	html : str
+		Search results page HTML.
+	"""
+
+	links = '\n'.join(f'<a class="pli clearfix" href="/{first_id + i}"><div class="listing-title">Listing {i}</div></a>' for i in range(num_listings))
+	return f'<!DOCTYPE html><html><body><div id="property-data">\n{links}\n</div></body></html>'
+
+
+def serve_fixtures(num_listings=100, latency=0.2, port=0, fixture_dir=FIXTURE_DIR, batch_size=20):
+	"""
+	Starts a local HTTP server in a background thread that stands in for OpenRent.
+	Parameters
+	----------
+	num_listings : int -> Default = 100
+		Number of listings on the search results page.
+
+	latency : float -> Default = 0.2
+		Seconds each response is delayed by, to mimic the round trip to the real site.
+
+	port : int -> Default = 0
+		Port to listen on. 0 picks a free port.
+
+	fixture_dir : str -> Default = FIXTURE_DIR
+		Directory containing the saved listing_*.html pages.
+
+	batch_size : int -> Default = 20
+		Number of listings returned by each lazily loaded batch of search results.
+
+	Returns
+	------
+	server : ThreadingHTTPServer
+		The running server. Call server.shutdown() when finished.
+
+	base_url : str
+		URL to pass as base_url to scrape_flats, scrape_listings or discover_listings.
+	"""
+
+	server = ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler)
+	server.daemon_threads = True
+	server.latency = latency
+	server.num_listings = num_listings
+	server.batch_size = batch_size
+	server.requests = []
+	server.listing_pages = []
+	for name in sorted(os.listdir(fixture_dir)):
+		if name.startswith('listing_') and name.endswith('.html'):
+			with open(os.path.join(fixture_dir, name), 'rb') as f:
+				server.listing_pages.append(f.read())
+
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def measure_throughput(num_listings=100, latency=0.2, max_workers=8):
+	"""
+	Scrapes the fixture server once sequentially and once concurrently, checks both runs produce the same DataFrame and reports the speed-up.
+	Parameters
+	----------
+	num_listings : int -> Default = 100
+		Number of listings to scrape in each run.
+
+	latency : float -> Default = 0.2
+		Simulated round trip time per request in seconds.
+
+	max_workers : int -> Default = 8
+		Number of concurrent requests for the concurrent run.
+
+	Returns
+	------
+	results : dict
+		Listings per second for each run and the speed-up between them.
+	"""
+
+	from data_utils import scrape_listings
+
+	server, base_url = serve_fixtures(num_listings=num_listings, latency=latency)
+	hrefs = [f'/{1000000 + i}' for i in range(num_listings)]
+	try:
+		start = time.perf_counter()
+		sequential = scrape_listings(hrefs, base_url=base_url, max_workers=1, requests_per_second=0)
+		sequential_time = time.perf_counter() - start
+
+		start = time.perf_counter()
+		concurrent = scrape_listings(hrefs, base_url=base_url, max_workers=max_workers, requests_per_second=0)
+		concurrent_time = time.perf_counter() - start
+	finally:
+		server.shutdown()
+
+	assert sequential.equals(concurrent), 'Concurrent fetch produced a different DataFrame'
+
+	results = {
+		'listings': num_listings, 'latency': latency, 'max_workers': max_workers,
+		'sequential_per_sec': num_listings / sequential_time,
+		'concurrent_per_sec': num_listings / concurrent_time,
+		'speed_up': sequential_time / concurrent_time}
+	print(f"Sequential: {results['sequential_per_sec']:.1f} listings/s, concurrent: {results['concurrent_per_sec']:.1f} listings/s ({results['speed_up']:.1f}x)")
+	return results
+
+
+if __name__ == '__main__':
+	measure_throughput()
@@ -0,0 +1,238 @@
+# IMPORTS
+import datetime
+import json
+import os
+import uuid
+import pandas as pd
+import pyarrow.parquet as pq
+from listing_schema import apply_schema
+
+HISTORY_DIR = 'rental_history'
+MANIFEST = 'manifest.json'
+
+# FUNCTIONS
+def append_history(data, history_dir=HISTORY_DIR):
+	"""
+	Appends scraped listings to the history store used for Tableau and analysis.
+	Rows are written as new Parquet files in one folder per scrape date, each folder with its own small manifest, so the cost of each write depends on the size of the day rather than the whole history. A listing is stored once per scrape date, like in the rentals table: storing it again the same day, e.g. from a second run or after a crash before the crawl journal was updated, replaces the earlier copy. Files are written under a temporary name and renamed into place, then recorded in the manifest, so a crash mid-write never damages data that is already stored. Passing in an old all_rental_data.csv migrates it, as rows are split by their scrape_date.
+	Parameters
+	----------
+	data : DataFrame
+		Listings to store. Must contain a scrape_date column in '%d %B %Y' format.
+
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store.
+	Returns
+	------
+	files : list
+		Paths of the Parquet files written.
+	"""
+
+	os.makedirs(history_dir, exist_ok=True)
+	data = apply_schema(data).drop_duplicates(['property_id', 'scrape_date'], keep='last')
+	partition_dates = pd.to_datetime(data['scrape_date'], format="%d %B %Y").dt.strftime("%Y-%m-%d")
+
+	files = []
+	num_replaced = 0
+	for partition_date, partition in data.groupby(partition_dates):
+		partition_name = f'scrape_date={partition_date}'
+		os.makedirs(os.path.join(history_dir, partition_name), exist_ok=True)
+		manifest = _read_partition_manifest(history_dir, partition_name)
+		file_name = f'part-{uuid.uuid4().hex[:12]}.parquet'
+		path = os.path.join(history_dir, partition_name, file_name)
+		partition.to_parquet(path + '.tmp', index=False)
+		os.replace(path + '.tmp', path)
+
+		# The new copy is recorded before older copies are removed, so a crash in between leaves a listing twice rather than not at all
+		ids = set(partition['property_id'].astype(str))
+		old_entries = list(manifest['files'])
+		manifest['files'].append({
+			'path': os.path.relpath(path, history_dir), 'scrape_date': partition_date, 'rows': len(partition),
+			'postcodes': sorted(partition['postcode'].dropna().astype(str).unique().tolist()), 'property_ids': sorted(ids)})
+		_write_partition_manifest(history_dir, partition_name, manifest)
+		num_replaced += _remove_listings(history_dir, partition_name, manifest, old_entries, ids)
+		files.append(path)
+
+	replaced = f", replacing {num_replaced} copies stored earlier the same day" if num_replaced else ''
+	print(f"{len(data)} listings appended to the history store{replaced}.")
+	return files
+
+
+def read_history(history_dir=HISTORY_DIR, start_date=None, end_date=None, postcodes=None, columns=None):
+	"""
+	Reads listings back from the history store.
+	Date and postcode filters are checked against the manifest first so that files which cannot match are never opened, and the postcode filter is then pushed down into the Parquet reader.
+	Parameters
+	----------
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store.
+
+	start_date : str or date -> Default = None
+		Earliest scrape date to include.
+
+	end_date : str or date -> Default = None
+		Latest scrape date to include.
+
+	postcodes : list -> Default = None
+		Postcodes to include, e.g. ['E13', 'SE16'].
+
+	columns : list -> Default = None
+		Columns to read. All columns are read if not provided.
+	Returns
+	------
+	data : DataFrame
+		Matching listings in the order they were stored.
+	"""
+
+	start_date = str(pd.Timestamp(start_date).date()) if start_date is not None else None
+	end_date = str(pd.Timestamp(end_date).date()) if end_date is not None else None
+	manifest = _read_manifest(history_dir, start_date, end_date)
+	postcodes = set(postcodes) if postcodes is not None else None
+	filters = [('postcode', 'in', sorted(postcodes))] if postcodes is not None else None
+
+	frames = []
+	for entry in manifest['files']:
+		if start_date is not None and entry['scrape_date'] < start_date:
+			continue
+		if end_date is not None and entry['scrape_date'] > end_date:
+			continue
+		if postcodes is not None and postcodes.isdisjoint(entry['postcodes']):
+			continue
+		table = pq.read_table(os.path.join(history_dir, entry['path']), columns=columns, filters=filters)
+		frames.append(table.to_pandas())
+
+	if not frames:
+		return pd.DataFrame(columns=columns)
+	return apply_schema(pd.concat(frames, ignore_index=True))
+
+
+def rewrite_history(update, history_dir=HISTORY_DIR, version_key='model_version', version=None):
+	"""
+	Applies update to every file in the history store that is not already at the given version, such as re-scoring stored listings after a retrain.
+	This is the one case where stored files are changed. Each file is rewritten under a temporary name and renamed over the original, so a crash leaves every file either fully old or fully updated, and the manifest records the version each file is at.
+	Parameters
+	----------
+	update : callable
+		Takes the DataFrame of one file and returns the DataFrame to store in its place.
+
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store.
+
+	version_key : str -> Default = 'model_version'
+		Manifest field recording which version a file is at.
+
+	version : str -> Default = None
+		Version the files are updated to. Files already at this version are skipped.
+	Returns
+	------
+	num_rows : int
+		Number of rows rewritten.
+	"""
+
+	num_rows = 0
+	for partition_name in _partitions(history_dir):
+		manifest = _read_partition_manifest(history_dir, partition_name)
+		for entry in manifest['files']:
+			if version is not None and entry.get(version_key) == version:
+				continue
+			path = os.path.join(history_dir, entry['path'])
+			data = update(pd.read_parquet(path))
+			data.to_parquet(path + '.tmp', index=False)
+			os.replace(path + '.tmp', path)
+			entry[version_key] = version
+			num_rows += len(data)
+			_write_partition_manifest(history_dir, partition_name, manifest)
+
+	return num_rows
+
+
+def outdated_files(history_dir=HISTORY_DIR, version_key='model_version', version=None):
+	"""
+	Number of files in the history store that rewrite_history would update, read from the manifest without opening any file.
+	"""
+
+	return sum(version is None or entry.get(version_key) != version for entry in _read_manifest(history_dir)['files'])
+
+
+def scrape_dates(history_dir=HISTORY_DIR):
+	"""
+	Every scrape date held in the history store as 'YYYY-MM-DD', oldest first, read from the manifest.
+	"""
+
+	return [partition_name.split('=', 1)[1] for partition_name in _partitions(history_dir)
+		if _read_partition_manifest(history_dir, partition_name)['files']]
+
+
+def export_history_csv(history_dir=HISTORY_DIR, csv_path='all_rental_data.csv'):
+	"""
+	Writes the whole history store out to a single CSV file for tools that cannot read Parquet.
+	Parameters
+	----------
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store.
+
+	csv_path : str -> Default = 'all_rental_data.csv'
+		Path of the CSV file to write.
+	Returns
+	------
+	"""
+
+	data = read_history(history_dir)
+	data.to_csv(csv_path + '.tmp', index=False)
+	os.replace(csv_path + '.tmp', csv_path)
+	print(f"{len(data)} listings exported to {csv_path}.")
+
+
+def _read_manifest(history_dir, start_date=None, end_date=None):
+	# The files of every partition between the two dates, oldest partition first
+	files = []
+	for partition_name in _partitions(history_dir):
+		partition_date = partition_name.split('=', 1)[1]
+		if (start_date is None or partition_date >= start_date) and (end_date is None or partition_date <= end_date):
+			files += _read_partition_manifest(history_dir, partition_name)['files']
+	return {'files': files}
+
+
+def _partitions(history_dir):
+	if not os.path.isdir(history_dir):
+		return []
+	return sorted(name for name in os.listdir(history_dir) if name.startswith('scrape_date='))
+
+
+def _read_partition_manifest(history_dir, partition_name):
+	path = os.path.join(history_dir, partition_name, MANIFEST)
+	if not os.path.exists(path):
+		return {'files': []}
+	with open(path) as f:
+		return json.load(f)
+
+
+def _write_partition_manifest(history_dir, partition_name, manifest):
+	manifest['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+	path = os.path.join(history_dir, partition_name, MANIFEST)
+	with open(path + '.tmp', 'w') as f:
+		json.dump(manifest, f, indent=1)
+	os.replace(path + '.tmp', path)
+
+
+def _remove_listings(history_dir, partition_name, manifest, entries, ids):
+	# Rewrite the given files of a partition without the listings in ids, dropping files left empty
+	num_removed = 0
+	for entry in entries:
+		path = os.path.join(history_dir, entry['path'])
+		if ids.isdisjoint(entry['property_ids']):
+			continue
+		data = pd.read_parquet(path)
+		keep = ~data['property_id'].astype(str).isin(ids)
+		num_removed += int((~keep).sum())
+		if keep.any():
+			data = data[keep]
+			data.to_parquet(path + '.tmp', index=False)
+			os.replace(path + '.tmp', path)
+			entry.update(rows=len(data), property_ids=sorted(data['property_id'].astype(str).unique()),
+				postcodes=sorted(data['postcode'].dropna().astype(str).unique().tolist()))
+		else:
+			manifest['files'].remove(entry)
+			os.remove(path)
+		_write_partition_manifest(history_dir, partition_name, manifest)
+	return num_removed
@@ -0,0 +1,189 @@
+# IMPORTS
+import datetime
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+
+CACHE_DIR = 'html_cache'
+
+# CLASSES
+class HtmlCache:
+	"""
+	On-disk cache of every search results page and listing page downloaded, so old scrapes can be parsed again without re-crawling.
+	Pages are stored gzip compressed under the SHA-256 of their content, so a listing that has not changed between two days is only stored once. A small SQLite index maps each (key, fetch date) to the page stored for it; the key is the property ID for listing pages and 'search-<radius>' for search results pages.
+	Parameters
+	----------
+	cache_dir : str -> Default = 'html_cache'
+		Folder holding the cache.
+	"""
+
+	def __init__(self, cache_dir=CACHE_DIR):
+		self.cache_dir = cache_dir
+		os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+			key TEXT NOT NULL, fetch_date TEXT NOT NULL, url TEXT, digest TEXT NOT NULL, size INTEGER NOT NULL,
+			PRIMARY KEY (key, fetch_date))''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_fetch_date ON pages (fetch_date)')
+		self.conn.commit()
+
+	def put(self, key, html, fetch_date, url=None):
+		"""
+		Stores a page. Storing the same key twice on one day replaces the earlier page.
+		Parameters
+		----------
+		key : str
+			Property ID, or 'search-<radius>' for a search results page.
+
+		html : str
+			The page HTML.
+
+		fetch_date : str or date
+			Day the page was downloaded, as a date, 'YYYY-MM-DD' or '%d %B %Y'.
+
+		url : str -> Default = None
+			Link the page was downloaded from.
+		Returns
+		------
+		digest : str
+			SHA-256 of the page, which is also its address in the cache.
+		"""
+
+		content = html.encode('utf-8')
+		digest = hashlib.sha256(content).hexdigest()
+		path = self._object_path(digest)
+		if not os.path.exists(path):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			tmp_path = f'{path}.{threading.get_ident()}.tmp'
+			with gzip.open(tmp_path, 'wb') as f:
+				f.write(content)
+			os.replace(tmp_path, path)
+		size = os.path.getsize(path)
+
+		with self.lock:
+			self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)', (str(key), date_key(fetch_date), url, digest, size))
+			self.conn.commit()
+		return digest
+
+	def get(self, key, fetch_date=None):
+		"""
+		Reads a page back from the cache.
+		Parameters
+		----------
+		key : str
+			Property ID, or 'search-<radius>' for a search results page.
+
+		fetch_date : str or date -> Default = None
+			Day the page was downloaded. The most recent copy is returned if not provided.
+		Returns
+		------
+		html : str
+			The page HTML, or None if it is not in the cache.
+		"""
+
+		with self.lock:
+			if fetch_date is None:
+				row = self.conn.execute('SELECT digest FROM pages WHERE key = ? ORDER BY fetch_date DESC LIMIT 1', (str(key),)).fetchone()
+			else:
+				row = self.conn.execute('SELECT digest FROM pages WHERE key = ? AND fetch_date = ?', (str(key), date_key(fetch_date))).fetchone()
+		if row is None:
+			return None
+		with gzip.open(self._object_path(row[0]), 'rb') as f:
+			return f.read().decode('utf-8')
+
+	def pages(self, fetch_date, exclude_prefix='search-'):
+		"""
+		Reads back every listing page downloaded on one day.
+		Parameters
+		----------
+		fetch_date : str or date
+			Day the pages were downloaded.
+
+		exclude_prefix : str -> Default = 'search-'
+			Keys starting with this prefix are skipped, so search results pages are left out.
+		Returns
+		------
+		pages : generator
+			(url, html) tuples in the order the pages were stored.
+		"""
+
+		with self.lock:
+			rows = self.conn.execute('SELECT key, url, digest FROM pages WHERE fetch_date = ? ORDER BY rowid', (date_key(fetch_date),)).fetchall()
+		for key, url, digest in rows:
+			if exclude_prefix and key.startswith(exclude_prefix):
+				continue
+			with gzip.open(self._object_path(digest), 'rb') as f:
+				yield url, f.read().decode('utf-8')
+
+	def fetch_dates(self):
+		"""
+		Returns every day that has pages in the cache, oldest first, as 'YYYY-MM-DD' strings.
+		"""
+
+		with self.lock:
+			return [row[0] for row in self.conn.execute('SELECT DISTINCT fetch_date FROM pages ORDER BY fetch_date')]
+
+	def evict(self, max_age_days=None, max_bytes=None):
+		"""
+		Removes old pages from the cache.
+		Pages fetched more than max_age_days ago are dropped first. If the cache is still larger than max_bytes, whole days are then dropped oldest first until it fits. Stored files no longer used by any remaining page are deleted.
+		Parameters
+		----------
+		max_age_days : int -> Default = None
+			Maximum age of a page in days.
+
+		max_bytes : int -> Default = None
+			Maximum size of the stored files in bytes.
+		Returns
+		------
+		removed : int
+			Number of stored files deleted.
+		"""
+
+		with self.lock:
+			if max_age_days is not None:
+				cutoff = (datetime.date.today() - datetime.timedelta(days=max_age_days)).isoformat()
+				self.conn.execute('DELETE FROM pages WHERE fetch_date < ?', (cutoff,))
+
+			if max_bytes is not None:
+				total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)').fetchone()[0]
+				for fetch_date, in self.conn.execute('SELECT DISTINCT fetch_date FROM pages ORDER BY fetch_date').fetchall():
+					if total <= max_bytes:
+						break
+					self.conn.execute('DELETE FROM pages WHERE fetch_date = ?', (fetch_date,))
+					total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)').fetchone()[0]
+			self.conn.commit()
+			in_use = {row[0] for row in self.conn.execute('SELECT DISTINCT digest FROM pages')}
+
+		removed = 0
+		objects_dir = os.path.join(self.cache_dir, 'objects')
+		for prefix in os.listdir(objects_dir):
+			for name in os.listdir(os.path.join(objects_dir, prefix)):
+				if name.endswith('.html.gz') and name[:-len('.html.gz')] not in in_use:
+					os.remove(os.path.join(objects_dir, prefix, name))
+					removed += 1
+		print(f"{removed} pages evicted from the HTML cache.")
+		return removed
+
+	def close(self):
+		self.conn.close()
+
+	def _object_path(self, digest):
+		return os.path.join(self.cache_dir, 'objects', digest[:2], digest + '.html.gz')
+
+
+# FUNCTIONS
+def date_key(value):
+	"""
+	Converts a date, or a date string in 'YYYY-MM-DD' or '%d %B %Y' format, to the 'YYYY-MM-DD' string used as the cache's date key so dates sort correctly.
+	"""
+
+	if isinstance(value, (datetime.date, datetime.datetime)):
+		return value.strftime("%Y-%m-%d")
+	try:
+		return datetime.datetime.strptime(value, "%d %B %Y").strftime("%Y-%m-%d")
+	except ValueError:
+		return datetime.datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
@@ -0,0 +1,207 @@
+# IMPORTS
+import random
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+import time
+from fetcher import RateLimiter, create_session, record_response
+
+BASE_URL = 'https://www.openrent.co.uk/'
+
+# Search results page. Open Rent lazy loads further listings by requesting the same page with a growing skip.
+INDEX_URL = '{base_url}properties-to-rent/london?term={term}&area={area}&skip={skip}'
+
+# FUNCTIONS
+def discover_listings(areas, term='London', base_url=BASE_URL, max_workers=4, requests_per_second=2.0, cache=None, today=None,
+		selenium_fallback=True, metrics=None):
+	"""
+	Finds the href of every listing on the search results for each area, without a browser.
+	Each area is crawled in its own thread by requesting the lazily loaded batches of results directly over HTTP until a batch adds no new listings. Listings found by more than one area are only returned once. If no listings at all are found over HTTP, the Selenium crawler is used instead. If a results page of any area fails to load, the listings found are still returned but marked incomplete, so callers do not take a listing missing from them as delisted.
+	Parameters
+	----------
+	areas : list
+		Search radiuses around London, e.g. [2, 5].
+
+	term : str -> Default = 'London'
+		Search term.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site to crawl. Point this at the local fixture server to run offline.
+
+	max_workers : int -> Default = 4
+		Number of areas crawled at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all areas.
+
+	cache : HtmlCache -> Default = None
+		Cache to store each results page in.
+
+	today : str -> Default = None
+		Date of the scrape, used as the cache date.
+
+	selenium_fallback : bool -> Default = True
+		Whether to fall back to scrolling the page in Safari if nothing is found over HTTP.
+
+	metrics : RunMetrics -> Default = None
+		Records each results page request under the 'discover' stage.
+
+	Returns
+	------
+	hrefs : list
+		The href of each 'pli clearfix' element, in the order the listings were found.
+
+	complete : bool
+		Whether the search results of every area were crawled to the end.
+	"""
+
+	session = create_session(pool_size=max_workers)
+	limiter = RateLimiter(requests_per_second)
+	try:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			results = list(executor.map(lambda area: crawl_area(session, limiter, area, term, base_url, cache, today, metrics), areas))
+	finally:
+		session.close()
+
+	hrefs = []
+	seen = set()
+	complete = all(area_complete for area_hrefs, area_complete in results)
+	for area_hrefs, area_complete in results:
+		for href in area_hrefs:
+			if href not in seen:
+				seen.add(href)
+				hrefs.append(href)
+
+	if not hrefs and selenium_fallback:
+		print("No listings found over HTTP, falling back to Selenium.")
+		for area in areas:
+			for href in selenium_listing_hrefs(area, cache=cache, today=today):
+				if href not in seen:
+					seen.add(href)
+					hrefs.append(href)
+		complete = True
+
+	print(f'Found a total of {len(hrefs)} to scrape.')
+	if not complete:
+		print("The search results did not load in full, so listings may be missing.")
+	return hrefs, complete
+
+
+def crawl_area(session, limiter, area, term='London', base_url=BASE_URL, cache=None, today=None, metrics=None):
+	"""
+	Requests the batches of search results for one area until a batch adds no new listings.
+	Parameters
+	----------
+	session : requests.Session
+		Keep-alive session shared with the other areas.
+
+	limiter : RateLimiter
+		Request budget shared with the other areas.
+
+	area : int
+		Search radius around London.
+
+	term : str -> Default = 'London'
+		Search term.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site to crawl.
+
+	cache : HtmlCache -> Default = None
+		Cache to store each results page in.
+
+	today : str -> Default = None
+		Date of the scrape, used as the cache date.
+
+	metrics : RunMetrics -> Default = None
+		Records each request under the 'discover' stage.
+
+	Returns
+	------
+	hrefs : list
+		The href of each listing found, in order.
+
+	complete : bool
+		Whether every batch loaded. False if a request failed, in which case hrefs only holds the listings found before it.
+	"""
+
+	strainer = SoupStrainer(attrs={'class': 'pli clearfix'})
+	hrefs = []
+	seen = set()
+	skip = 0
+	while True:
+		link = INDEX_URL.format(base_url=base_url, term=term, area=area, skip=skip)
+		limiter.wait()
+		start = time.perf_counter()
+		try:
+			response = session.get(link, timeout=30)
+			response.raise_for_status()
+		except requests.RequestException as e:
+			if metrics is not None:
+				metrics.failure('discover', e)
+			return hrefs, False
+		if metrics is not None:
+			record_response(metrics, 'discover', response, time.perf_counter() - start)
+		if cache is not None:
+			cache.put(f'search-{area}-{skip}', response.text, today, url=link)
+
+		batch = [listing['href'] for listing in BeautifulSoup(response.text, 'html.parser', parse_only=strainer).find_all(attrs={'class': 'pli clearfix'})]
+		new = [href for href in batch if href not in seen]
+		if not new:
+			break
+		seen.update(new)
+		hrefs.extend(new)
+		skip += len(batch)
+
+	return hrefs, True
+
+
+def selenium_listing_hrefs(radius, cache=None, today=None):
+	"""
+	Finds listings by scrolling the search results to the bottom in Safari until lazy loading stops adding listings.
+	Only used when crawling over HTTP finds nothing, e.g. if Open Rent changes how results are loaded.
+	Parameters
+	----------
+	radius : int
+		Radius around London in which to expand the search.
+
+	cache : HtmlCache -> Default = None
+		Cache to store the results page in.
+
+	today : str -> Default = None
+		Date of the scrape, used as the cache date.
+
+	Returns
+	------
+	hrefs : list
+		The href of each 'pli clearfix' element.
+	"""
+
+	from selenium import webdriver
+
+	# Request web page and simulate scrolling to bottom (Lazy Loading)
+	link = f'{BASE_URL}properties-to-rent/london?term=London&area={radius}'
+	driver = webdriver.Safari()
+	driver.get(link)
+	sleep(random.randint(4,7))
+
+	lastHeight = driver.execute_script("return document.body.scrollHeight")
+	pause = 1
+	while True:
+		driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+		sleep(pause)
+		newHeight = driver.execute_script("return document.body.scrollHeight")
+		if newHeight == lastHeight:
+			break
+		lastHeight = newHeight
+
+	# Request entire web page source in BeautifulSoup to parse and close browser
+	sleep(random.randint(2,4))
+	html = driver.page_source
+	soup = BeautifulSoup(html, "html.parser")
+	driver.close()
+	if cache is not None:
+		cache.put(f'search-{radius}', html, today, url=link)
+
+	return [listing['href'] for listing in soup.find_all(attrs={'class': 'pli clearfix'})]
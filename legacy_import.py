@@ -0,0 +1,202 @@
+# IMPORTS
+import argparse
+import ast
+import datetime
+import os
+import time
+import pandas as pd
+from openpyxl import load_workbook
+from aggregates import rebuild_aggregates
+from database import RENTALS_COLUMNS, RENTALS_KEY, connect, upsert_rentals
+from duplicates import assign_clusters, create_duplicate_tables
+from features import engineer_features, fill_today, first_number, parse_price, postcode_from_title
+from listing_schema import apply_schema
+from revisit_scheduler import add_history
+
+# Every file the history used to be kept in, oldest first
+LEGACY_SOURCES = ['archive/raw_data.xlsx', 'archive/clean_data.xlsx', 'archive/test.csv', 'all_rental_data.csv']
+
+# Column names of the workbooks written by archive/data_collection.py, mapped to the rentals table
+WORKBOOK_COLUMNS = {
+	'title':'listing_title', 'summary':'description', 'beds':'num_bedrooms', 'baths':'num_bathrooms',
+	'price':'rent_pcm', 'avail_from':'available_from', 'link':'property_link', 'scraped':'scrape_date'}
+
+# Section heading the old scraper sometimes read instead of the furnishing, when the table on the page was laid out differently
+MISREAD_FURNISHING = 'Prices & Availability'
+
+# FUNCTIONS
+def import_legacy(database_path, paths=LEGACY_SOURCES, chunk_size=50000, scrape_date=None, base_url='https://www.openrent.co.uk/'):
+	"""
+	Bulk loads the history kept in the old Excel workbooks and CSV files into the rentals table.
+	Files are read chunk_size rows at a time, so memory use does not depend on the size of the history. Each chunk is mapped onto the rentals columns with the cleaning rules of CleanListings and scrape_flats, then written in one transaction. The aggregate tables are recomputed once at the end, for the scrape dates that gained listings, rather than after every chunk. A listing already stored for the same scrape date is kept and the legacy copy skipped, so importing a file twice, or a file that overlaps the database, never stores a listing twice. If the revisit schedule has been started, the imported listings are added to it without marking any listing as delisted.
+	Parameters
+	----------
+	database_path : str
+		The path to the database where this data is stored. If in CWD then this is just the database name.
+
+	paths : list -> Default = LEGACY_SOURCES
+		Excel or CSV files to import, in the raw_data.xlsx/clean_data.xlsx, test.csv or all_rental_data.csv layout. Files that do not exist are skipped.
+
+	chunk_size : int -> Default = 50000
+		Number of rows read and written at a time.
+
+	scrape_date : str -> Default = None
+		Scrape date in '%d %B %Y' format given to listings in files that do not record one, such as test.csv. If not provided, the date the file was last modified is used.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Used to build the link of listings stored without one.
+	Returns
+	------
+	counts : dict
+		Number of rows read and inserted from each file.
+	"""
+
+	conn = connect(database_path)
+	counts = {}
+	imported_dates = set()
+	try:
+		create_duplicate_tables(conn)
+		# Without a revisit schedule there is nothing to update, it is started from the rentals table when first needed
+		has_schedule = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listing_state'").fetchone() is not None
+		for path in paths:
+			if not os.path.exists(path):
+				print(f"{path} not found, skipped.")
+				continue
+			start = time.perf_counter()
+			counts[path] = {'read': 0, 'inserted': 0}
+			for chunk in read_legacy(path, chunk_size, scrape_date=scrape_date, base_url=base_url):
+				chunk = chunk.dropna(subset=list(RENTALS_KEY)).drop_duplicates(list(RENTALS_KEY))
+				counts[path]['read'] += len(chunk)
+				if chunk.empty:
+					continue
+				chunk = chunk.assign(cluster_id=assign_clusters(conn, chunk))
+				changes = conn.total_changes
+				upsert_rentals(conn, chunk, replace=False)
+				if conn.total_changes > changes:
+					counts[path]['inserted'] += conn.total_changes - changes
+					imported_dates.update(chunk['scrape_date'].astype(str).unique())
+				if has_schedule:
+					add_history(conn, chunk)
+			print(f"{path}: {counts[path]['inserted']} of {counts[path]['read']} listings imported in {time.perf_counter() - start:.1f}s, the rest were already stored.")
+		if imported_dates:
+			rebuild_aggregates(conn, scrape_dates=imported_dates)
+	finally:
+		conn.close()
+	return counts
+
+
+def read_legacy(path, chunk_size=50000, scrape_date=None, base_url='https://www.openrent.co.uk/'):
+	"""
+	Reads an old Excel or CSV file of listings chunk_size rows at a time, mapped onto the rentals columns.
+	The layout is recognised from the columns: the workbooks of archive/data_collection.py have a scraped column, the old exports such as test.csv have nearby_stations, and anything else is taken to already use the rentals columns, like all_rental_data.csv.
+	Parameters
+	----------
+	path : str
+		Excel or CSV file.
+
+	chunk_size : int -> Default = 50000
+		Number of rows in each chunk.
+
+	scrape_date : str -> Default = None
+		Scrape date given to listings in files that do not record one. If not provided, the date the file was last modified is used.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Used to build the link of listings stored without one.
+	Returns
+	------
+	chunks : generator
+		DataFrames of listings with the LISTING_SCHEMA dtypes.
+	"""
+
+	if path.endswith(('.xlsx', '.xlsm')):
+		chunks = _excel_chunks(path, chunk_size)
+	else:
+		chunks = pd.read_csv(path, chunksize=chunk_size, dtype={'property_id': str})
+
+	for chunk in chunks:
+		if 'scraped' in chunk.columns:
+			data = map_workbook(chunk, base_url)
+		elif 'nearby_stations' in chunk.columns:
+			data = map_export(chunk, scrape_date or _file_date(path))
+		else:
+			data = chunk
+		if 'listing_type' not in data.columns:
+			data = engineer_features(data)
+		yield apply_schema(data[[column for column in RENTALS_COLUMNS if column in data.columns]])
+
+
+def map_workbook(data, base_url='https://www.openrent.co.uk/'):
+	"""
+	Maps listings in the layout of raw_data.xlsx and clean_data.xlsx onto the rentals columns, cleaning them as CleanListings does.
+	Prices keep whole pounds only, as scrape_flats stores them.
+	"""
+
+	data = data.rename(columns=WORKBOOK_COLUMNS)
+	data['property_id'] = data['property_id'].astype(str)
+	data['property_link'] = data['property_link'].where(data['property_link'].notna(), base_url + '/' + data['property_id'])
+	data['location'] = 'London'
+	data['available_from'] = fill_today(data['available_from'], data['scrape_date'])
+	data['min_tenancy_months'] = first_number(data['min_tenancy'])
+	data['closest_station_mins'] = first_number(data['dist_to_station'])
+	data['deposit'] = parse_price(data['deposit'])
+	data['rent_pcm'] = parse_price(data['rent_pcm'])
+	data['postcode'] = postcode_from_title(data['listing_title'])
+	return data
+
+
+def map_export(data, scrape_date):
+	"""
+	Maps listings in the layout of the old exports such as test.csv onto the rentals columns.
+	These files list the nearby stations instead of the closest one, and have no scrape date. Rows where the old scraper read the rent into available_from and a section heading into furnishing keep those fields missing.
+	"""
+
+	data = data.drop(columns=[column for column in data.columns if column.startswith('Unnamed:')])
+	data['property_id'] = data['property_id'].astype(str)
+	data['closest_station'] = data['nearby_stations'].map(_first_station)
+	data['available_from'] = data['available_from'].where(~data['available_from'].astype(str).str.contains('£', regex=False))
+	data['furnishing'] = data['furnishing'].where(data['furnishing'] != MISREAD_FURNISHING)
+	data['deposit'] = parse_price(data['deposit'])
+	data['rent_pcm'] = parse_price(data['rent_pcm'])
+	data['postcode'] = postcode_from_title(data['listing_title'])
+	data['scrape_date'] = scrape_date
+	return data
+
+
+def _excel_chunks(path, chunk_size):
+	# Stream the first sheet row by row instead of loading the whole workbook
+	workbook = load_workbook(path, read_only=True)
+	try:
+		rows = workbook.worksheets[0].iter_rows(values_only=True)
+		header = next(rows, None)
+		chunk = []
+		for row in rows:
+			chunk.append(row)
+			if len(chunk) == chunk_size:
+				yield pd.DataFrame(chunk, columns=header)
+				chunk = []
+		if chunk:
+			yield pd.DataFrame(chunk, columns=header)
+	finally:
+		workbook.close()
+
+
+def _first_station(stations):
+	try:
+		stations = ast.literal_eval(stations)
+	except (ValueError, SyntaxError):
+		return None
+	return stations[0] if isinstance(stations, list) and stations else None
+
+
+def _file_date(path):
+	return datetime.datetime.fromtimestamp(os.path.getmtime(path)).strftime("%d %B %Y")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Import the history kept in the old Excel workbooks and CSV files into the database.')
+	parser.add_argument('paths', nargs='*', default=LEGACY_SOURCES)
+	parser.add_argument('--database', default='real_estate.db')
+	parser.add_argument('--chunk-size', type=int, default=50000)
+	parser.add_argument('--scrape-date', help="Scrape date of files that do not record one, e.g. '01 October 2020'")
+	args = parser.parse_args()
+	import_legacy(args.database, args.paths, chunk_size=args.chunk_size, scrape_date=args.scrape_date)
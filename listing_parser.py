@@ -0,0 +1,221 @@
+# IMPORTS
+from typing import NamedTuple
+import pandas as pd
+from features import engineer_features
+from listing_schema import apply_schema
+from bs4 import BeautifulSoup, SoupStrainer
+try:
+	from lxml import html as lxml_html
+except ImportError:
+	lxml_html = None
+
+# Class attributes of the elements read from a listing page. Tables are matched on their full class string, as BeautifulSoup does.
+TITLE_CLASS = 'property-title'
+DESCRIPTION_CLASS = 'description'
+OVERVIEW_TABLE = 'table table-striped intro-stats'
+DETAIL_TABLE = 'table table-striped'
+TRANSPORT_TABLE = 'table table-striped mt-1'
+
+# XPath returning every element needed, in document order, in one pass over the tree
+LISTING_XPATH = (
+	f'//*[contains(concat(" ", normalize-space(@class), " "), " {TITLE_CLASS} ")'
+	f' or contains(concat(" ", normalize-space(@class), " "), " {DESCRIPTION_CLASS} ")'
+	f' or @class="{OVERVIEW_TABLE}" or @class="{DETAIL_TABLE}" or @class="{TRANSPORT_TABLE}"]')
+
+# CLASSES
+class Listing(NamedTuple):
+	"""
+	Fields parsed from a single listing page. Tick/cross flags are stored as booleans and counts as ints, so a record holds no text it does not need.
+	"""
+
+	property_id: str
+	property_link: str
+	listing_title: str
+	description: str
+	location: str
+	num_bedrooms: int
+	num_bathrooms: int
+	max_tenants: int
+	deposit: int
+	rent_pcm: int
+	bills_included: bool
+	student_friendly: bool
+	family_friendly: bool
+	pet_friendly: bool
+	smoker_friendly: bool
+	available_from: str
+	min_tenancy_months: int
+	garden: bool
+	parking: bool
+	fireplace: bool
+	furnishing: str
+	closest_station: str
+	closest_station_mins: int
+	postcode: str
+
+
+# FUNCTIONS
+def parse_listing(html, property_link, today):
+	"""
+	Parses the detail page of a single listing.
+	Only the title, description and the six listing tables are located, with a single XPath query over an lxml tree. If lxml is not installed a SoupStrainer is used so that BeautifulSoup only builds those elements.
+	Parameters
+	----------
+	html : str
+		HTML of the listing page.
+
+	property_link : str
+		Link the page was downloaded from. The property ID is the last part of the link.
+
+	today : str
+		Date of the scrape in '%d %B %Y' format. Used when a listing is available from 'Today'.
+
+	Returns
+	------
+	listing : Listing
+		The parsed listing.
+	"""
+
+	if lxml_html is not None:
+		elements = _find_elements_lxml(html)
+	else:
+		elements = _find_elements_soup(html)
+
+	title = elements['title'].strip()
+	detail_tables = elements['detail']
+	if len(detail_tables) < 4:
+		raise ValueError(f'Expected 4 detail tables, found {len(detail_tables)}')
+
+	# Overview Table
+	rows = elements['overview']
+	overview = [text.strip() for text, checked in rows]
+
+	# Price & Bills, Tenant Preferences, Availability, Features
+	price, preferences, availability, features = detail_tables[:4]
+
+	# Transportation
+	data_rows = elements['transport'][4:]
+	closest_station = data_rows[0][0].strip()
+	closest_station_mins = int(data_rows[1][0].strip().split()[0])
+
+	available = availability[1][0].strip()
+
+	return Listing(
+		property_id=property_link.split('/')[-1],
+		property_link=property_link,
+		listing_title=title,
+		description=elements['description'].strip(),
+		location=overview[1],
+		num_bedrooms=int(overview[3]),
+		num_bathrooms=int(overview[5]),
+		max_tenants=int(overview[7]),
+		deposit=_parse_price(price[1][0]),
+		rent_pcm=_parse_price(price[3][0]),
+		bills_included=price[5][1],
+		student_friendly=preferences[1][1],
+		family_friendly=preferences[3][1],
+		pet_friendly=preferences[5][1],
+		smoker_friendly=preferences[7][1],
+		available_from=today if available == 'Today' else available,
+		min_tenancy_months=int(availability[3][0].split()[0]),
+		garden=features[1][1],
+		parking=features[3][1],
+		fireplace=features[5][1],
+		furnishing=features[7][0].strip(),
+		closest_station=closest_station,
+		closest_station_mins=closest_station_mins,
+		postcode=title.split(',')[-1].strip())
+
+
+def listings_to_frame(listings, today):
+	"""
+	Builds the DataFrame that scrape_flats saves from parsed listings, adding the engineered features.
+	Columns are converted to the compact LISTING_SCHEMA dtypes: booleans for flags, categoricals for repeated labels and small ints for counts.
+	Parameters
+	----------
+	listings : list
+		Listing records returned by parse_listing.
+
+	today : str
+		Date of the scrape in '%d %B %Y' format.
+
+	Returns
+	------
+	data : DataFrame
+		DataFrame containing all relevant information on the listings.
+	"""
+
+	data = pd.DataFrame.from_records(listings, columns=Listing._fields)
+	data = engineer_features(data)
+	data['scrape_date'] = today
+	return apply_schema(data)
+
+
+def _parse_price(text):
+	return int(text.strip().replace('£', '').replace(',', '').split('.')[0])
+
+
+def _find_elements_lxml(html):
+	# Collect the text and tick/cross icon of every cell in a single walk over the matched elements
+	tree = lxml_html.fromstring(html)
+	elements = {'title': None, 'description': None, 'overview': None, 'detail': [], 'transport': None}
+
+	for element in tree.xpath(LISTING_XPATH):
+		css_class = element.get('class')
+		if element.tag == 'table':
+			cells = [(td.text_content(), _icon_lxml(td)) for td in element.iter('td')]
+			if css_class == OVERVIEW_TABLE:
+				elements['overview'] = cells
+			elif css_class == TRANSPORT_TABLE:
+				elements['transport'] = cells
+			else:
+				elements['detail'].append(cells)
+		else:
+			classes = css_class.split()
+			if TITLE_CLASS in classes and elements['title'] is None:
+				elements['title'] = element.text_content()
+			elif DESCRIPTION_CLASS in classes and elements['description'] is None:
+				elements['description'] = element.text_content()
+
+	return elements
+
+
+def _icon_lxml(td):
+	icon = next(td.iter('i'), None)
+	if icon is None:
+		return None
+	return icon.get('class', '').split()[-1] == 'fa-check'
+
+
+def _find_elements_soup(html):
+	# Only build the elements needed rather than the whole page
+	strainer = SoupStrainer(attrs={'class': lambda value: value is not None and (
+		value in (OVERVIEW_TABLE, DETAIL_TABLE, TRANSPORT_TABLE) or TITLE_CLASS in value.split() or DESCRIPTION_CLASS in value.split())})
+	soup = BeautifulSoup(html, 'html.parser', parse_only=strainer)
+	elements = {'title': None, 'description': None, 'overview': None, 'detail': [], 'transport': None}
+
+	for element in soup.find_all(True, recursive=False):
+		css_class = ' '.join(element.get('class', []))
+		if element.name == 'table':
+			cells = [(td.get_text(), _icon_soup(td)) for td in element.find_all('td')]
+			if css_class == OVERVIEW_TABLE:
+				elements['overview'] = cells
+			elif css_class == TRANSPORT_TABLE:
+				elements['transport'] = cells
+			else:
+				elements['detail'].append(cells)
+		else:
+			classes = element.get('class', [])
+			if TITLE_CLASS in classes and elements['title'] is None:
+				elements['title'] = element.get_text()
+			elif DESCRIPTION_CLASS in classes and elements['description'] is None:
+				elements['description'] = element.get_text()
+
+	return elements
+
+
+def _icon_soup(td):
+	icon = td.find('i')
+	if icon is None:
+		return None
+	return icon.attrs['class'][-1] == 'fa-check'
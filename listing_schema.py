@@ -0,0 +1,92 @@
+# IMPORTS
+import pandas as pd
+from features import to_bool
+
+# Pandas dtype of every listing column. Flags are booleans, repeated labels are categoricals and counts use the smallest integer type that fits.
+# Nullable types are used so history with missing values can be loaded with the same schema.
+LISTING_SCHEMA = {
+	'property_id':'string', 'property_link':'string', 'listing_title':'string', 'description':'string',
+	'location':'category', 'num_bedrooms':'Int8', 'num_bathrooms':'Int8', 'max_tenants':'Int8',
+	'deposit':'Int32', 'rent_pcm':'Int32', 'bills_included':'boolean', 'student_friendly':'boolean',
+	'family_friendly':'boolean', 'pet_friendly':'boolean', 'smoker_friendly':'boolean',
+	'available_from':'string', 'min_tenancy_months':'Int8', 'garden':'boolean', 'parking':'boolean',
+	'fireplace':'boolean', 'furnishing':'category', 'closest_station':'category',
+	'closest_station_mins':'Int16', 'postcode':'category', 'listing_type':'category',
+	'region_loc':'category', 'bed_bath_ratio':'float64', 'scrape_date':'category',
+	'predicted_monthly_rent':'float64', 'model_version':'category', 'cluster_id':'string'}
+
+FLAG_COLUMNS = [column for column, dtype in LISTING_SCHEMA.items() if dtype == 'boolean']
+
+# FUNCTIONS
+def apply_schema(data):
+	"""
+	Converts a DataFrame of listings to the compact LISTING_SCHEMA dtypes.
+	Flags stored as 'Yes'/'No' text, 0/1 or booleans are all converted to booleans, so frames loaded from old CSV files, the database or the history store end up identical. Columns not in the schema are left as they are.
+	Parameters
+	----------
+	data : DataFrame
+		Listings to convert.
+
+	Returns
+	------
+	data : DataFrame
+		The converted listings.
+	"""
+
+	data = data.copy()
+	for column, dtype in LISTING_SCHEMA.items():
+		if column not in data.columns:
+			continue
+		if dtype == 'boolean':
+			data[column] = to_bool(data[column])
+		elif dtype.startswith('Int'):
+			data[column] = pd.to_numeric(data[column], errors='coerce').round().astype(dtype)
+		elif dtype == 'float64':
+			data[column] = pd.to_numeric(data[column], errors='coerce')
+		else:
+			data[column] = data[column].astype(dtype)
+	return data
+
+
+def memory_benchmark(num_listings=100000):
+	"""
+	Compares the memory used by a DataFrame of listings in the old layout (Python objects, 'Yes'/'No' text and 64-bit integers) against LISTING_SCHEMA.
+	Parameters
+	----------
+	num_listings : int -> Default = 100000
+		Number of listings in each DataFrame. The saved fixture listings are repeated to reach this.
+
+	Returns
+	------
+	results : dict
+		Deep memory usage of each layout in bytes and the ratio between them.
+	"""
+
+	import os
+	from fixture_server import FIXTURE_DIR
+	from listing_parser import parse_listing, listings_to_frame
+
+	listings = []
+	for name in sorted(os.listdir(FIXTURE_DIR)):
+		if name.startswith('listing_') and name.endswith('.html'):
+			with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as f:
+				listings.append(parse_listing(f.read(), f'https://www.openrent.co.uk//{len(listings)}', '01 January 2022'))
+
+	compact = listings_to_frame((listings * (num_listings // len(listings) + 1))[:num_listings], '01 January 2022')
+	compact['predicted_monthly_rent'] = 0.0
+
+	legacy = compact.astype(object)
+	for column in FLAG_COLUMNS:
+		legacy[column] = compact[column].map({True: 'Yes', False: 'No'}).astype(object)
+	for column, dtype in LISTING_SCHEMA.items():
+		if dtype.startswith('Int'):
+			legacy[column] = compact[column].astype('int64')
+
+	results = {'listings': num_listings, 'legacy_bytes': int(legacy.memory_usage(deep=True).sum()), 'compact_bytes': int(compact.memory_usage(deep=True).sum())}
+	results['ratio'] = results['legacy_bytes'] / results['compact_bytes']
+	print(f"Legacy: {results['legacy_bytes'] / 1e6:.1f} MB, compact: {results['compact_bytes'] / 1e6:.1f} MB ({results['ratio']:.1f}x smaller)")
+	return results
+
+
+if __name__ == '__main__':
+	memory_benchmark()
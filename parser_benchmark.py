@@ -0,0 +1,114 @@
+# IMPORTS
+import os
+import time
+from bs4 import BeautifulSoup
+from fixture_server import FIXTURE_DIR
+from listing_parser import Listing, parse_listing
+from listing_schema import FLAG_COLUMNS
+
+# FUNCTIONS
+def legacy_parse_listing(html, property_link, today):
+	"""
+	The listing page parser as it was written inline in scrape_flats: a full html.parser soup, with the detail tables looked up again for each section.
+	Kept only as the baseline for benchmark_parsers.
+	"""
+
+	sub_soup = BeautifulSoup(html, 'html.parser')
+	title = sub_soup.find(attrs={'class': 'property-title'}).get_text().strip()
+	postcode = title.split(',')[-1].strip()
+	description = sub_soup.find(attrs={'class': 'description'}).get_text().strip()
+
+	table = sub_soup.find(attrs={'class': 'table table-striped intro-stats'})
+	rows = table.find_all('td')
+	location = rows[1].get_text().strip()
+	bedrooms = int(rows[3].get_text().strip())
+	bathrooms = int(rows[5].get_text().strip())
+	max_tenants = int(rows[7].get_text().strip())
+
+	table = sub_soup.find_all(attrs={'class': 'table table-striped'})[0]
+	rows = table.find_all('td')
+	deposit = int(rows[1].get_text().strip().replace('£', '').replace(',','').split('.')[0])
+	rent_pcm = int(rows[3].get_text().strip().replace('£', '').replace(',','').split('.')[0])
+	bills_included = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+
+	table = sub_soup.find_all(attrs={'class': 'table table-striped'})[1]
+	rows = table.find_all('td')
+	student_friendly = 'Yes' if rows[1].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	family_friendly = 'Yes' if rows[3].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	pet_friendly = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	smoker_friendly = 'Yes' if rows[7].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+
+	table = sub_soup.find_all(attrs={'class': 'table table-striped'})[2]
+	rows = table.find_all('td')
+	available = rows[1].get_text().strip()
+	avail_from = today if available == 'Today' else available
+	min_tenancy = int(rows[3].get_text().split()[0])
+
+	table = sub_soup.find_all(attrs={'class': 'table table-striped'})[3]
+	rows = table.find_all('td')
+	garden = 'Yes' if rows[1].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	parking = 'Yes' if rows[3].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	fireplace = 'Yes' if rows[5].find('i').attrs['class'][-1] == 'fa-check' else 'No'
+	furnishing = rows[7].get_text().strip()
+
+	table = sub_soup.find(attrs={'class': 'table table-striped mt-1'})
+	data_rows = table.find_all('td')[4:]
+	stations = data_rows[::3]
+	all_stations = [x.get_text().strip() for x in stations]
+	distances = data_rows[1::3]
+	closest_station = all_stations[0]
+	closest_station_mins = int(distances[0].get_text().strip().split()[0])
+
+	return Listing(
+		property_link.split('/')[-1], property_link, title, description, location, bedrooms, bathrooms,
+		max_tenants, deposit, rent_pcm, bills_included, student_friendly, family_friendly, pet_friendly,
+		smoker_friendly, avail_from, min_tenancy, garden, parking, fireplace, furnishing, closest_station,
+		closest_station_mins, postcode)
+
+
+def benchmark_parsers(fixture_dir=FIXTURE_DIR, repeat=200):
+	"""
+	Times the legacy parser against parse_listing over the saved listing pages and checks both return the same records.
+	Parameters
+	----------
+	fixture_dir : str -> Default = FIXTURE_DIR
+		Directory containing the saved listing_*.html pages.
+
+	repeat : int -> Default = 200
+		Number of times each page is parsed by each parser.
+
+	Returns
+	------
+	results : dict
+		Pages parsed per second by each parser and the speed-up between them.
+	"""
+
+	pages = []
+	for name in sorted(os.listdir(fixture_dir)):
+		if name.startswith('listing_') and name.endswith('.html'):
+			with open(os.path.join(fixture_dir, name), encoding='utf-8') as f:
+				pages.append(f.read())
+
+	today = '01 January 2022'
+	link = 'https://www.openrent.co.uk//1000000'
+	for html in pages:
+		# The legacy parser returns flags as 'Yes'/'No' text
+		legacy = legacy_parse_listing(html, link, today)
+		legacy = legacy._replace(**{column: getattr(legacy, column) == 'Yes' for column in FLAG_COLUMNS})
+		assert legacy == parse_listing(html, link, today), 'Parsers disagree'
+
+	results = {'pages': len(pages) * repeat}
+	for name, parser in (('legacy', legacy_parse_listing), ('fast', parse_listing)):
+		start = time.perf_counter()
+		for i in range(repeat):
+			for html in pages:
+				parser(html, link, today)
+		results[f'{name}_per_sec'] = results['pages'] / (time.perf_counter() - start)
+
+	results['speed_up'] = results['fast_per_sec'] / results['legacy_per_sec']
+	print(f"Legacy: {results['legacy_per_sec']:.0f} pages/s, fast: {results['fast_per_sec']:.0f} pages/s ({results['speed_up']:.1f}x)")
+	return results
+
+
+if __name__ == '__main__':
+	benchmark_parsers()
@@ -0,0 +1,257 @@
+# IMPORTS
+import argparse
+import hashlib
+import os
+import time
+from functools import lru_cache
+import pandas as pd
+from joblib import Parallel, delayed, load
+from database import connect
+from features import yes_no
+from listing_schema import FLAG_COLUMNS
+
+PIPELINE_PATH = 'full_pipeline.joblib'
+MODEL_PATH = 'tuned_model.joblib'
+
+# Columns used by full_pipeline.joblib
+CATEGORICAL_FEATURES = ['bills_included', 'student_friendly', 'family_friendly', 'pet_friendly',
+	'smoker_friendly', 'garden', 'parking', 'fireplace', 'furnishing', 'listing_type', 'region_loc']
+NUMERIC_FEATURES = ['num_bedrooms', 'num_bathrooms', 'max_tenants', 'deposit',
+	'min_tenancy_months', 'closest_station_mins', 'bed_bath_ratio']
+FEATURE_COLUMNS = CATEGORICAL_FEATURES + NUMERIC_FEATURES
+
+# FUNCTIONS
+@lru_cache(maxsize=None)
+def load_artifacts(pipeline_path=PIPELINE_PATH, model_path=MODEL_PATH, mmap_mode='r'):
+	"""
+	Loads the transformation pipeline and tuned model once per process.
+	The large arrays inside the Random Forest are memory-mapped from disk rather than copied into memory when the artifacts were saved uncompressed.
+	Parameters
+	----------
+	pipeline_path : str -> Default = 'full_pipeline.joblib'
+		Path to the fitted transformation pipeline.
+
+	model_path : str -> Default = 'tuned_model.joblib'
+		Path to the tuned model.
+
+	mmap_mode : str -> Default = 'r'
+		Passed to joblib.load. Use None to load everything into memory.
+
+	Returns
+	------
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	model : estimator
+		The tuned model.
+
+	model_version : str
+		Short hash of both artifact files, stored next to every prediction so out of date scores can be found after a retrain.
+	"""
+
+	transformation_pipeline = load(pipeline_path, mmap_mode=mmap_mode)
+	model = load(model_path, mmap_mode=mmap_mode)
+	return transformation_pipeline, model, artifact_version(pipeline_path, model_path)
+
+
+def artifact_version(*paths):
+	"""
+	Hashes the contents of the given files into a short version string.
+	"""
+
+	digest = hashlib.sha256()
+	for path in paths:
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b''):
+				digest.update(block)
+	return digest.hexdigest()[:12]
+
+
+def predict_rent(data, transformation_pipeline, model, batch_size=5000, n_jobs=None):
+	"""
+	Predicts the monthly rent of each listing in fixed-size batches, scoring batches in parallel.
+	Parameters
+	----------
+	data : DataFrame
+		Listings containing at least the FEATURE_COLUMNS.
+
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	model : estimator
+		The tuned model.
+
+	batch_size : int -> Default = 5000
+		Number of listings transformed and predicted at a time.
+
+	n_jobs : int -> Default = None
+		Number of batches scored at once. -1 uses every core.
+
+	Returns
+	------
+	predictions : Series
+		Predicted monthly rent, with the same index as data.
+	"""
+
+	if len(data) == 0:
+		return pd.Series([], index=data.index, dtype='float64')
+
+	batches = [data.iloc[start:start + batch_size] for start in range(0, len(data), batch_size)]
+	results = Parallel(n_jobs=n_jobs, prefer='threads')(
+		delayed(_predict_batch)(batch, transformation_pipeline, model) for batch in batches)
+	return pd.concat(results)
+
+
+def _predict_batch(batch, transformation_pipeline, model):
+	return pd.Series(model.predict(transformation_pipeline.transform(model_input(batch, transformation_pipeline))), index=batch.index)
+
+
+def model_input(data, transformation_pipeline=None):
+	"""
+	Selects the columns used by full_pipeline.joblib and converts them back to the types it was fitted on.
+	Flags are stored as booleans (or 0/1 in the database) but the pipeline's one hot encoder expects 'Yes'/'No', and the nullable integer columns are turned into floats so missing values reach the imputer as NaN.
+	The pipeline was fitted on the whole training DataFrame and checks it is given the same columns, even though it drops all but FEATURE_COLUMNS, so empty columns are added to make up the rest.
+	Parameters
+	----------
+	data : DataFrame
+		Listings from listings_to_frame, the database or the history store.
+
+	transformation_pipeline : ColumnTransformer -> Default = None
+		The pipeline the features are for. Used to find how many columns it expects.
+
+	Returns
+	------
+	features : DataFrame
+		The FEATURE_COLUMNS of data, ready for transformation_pipeline.transform.
+	"""
+
+	features = data[FEATURE_COLUMNS].copy()
+	for column in CATEGORICAL_FEATURES:
+		if column in FLAG_COLUMNS:
+			features[column] = yes_no(features[column])
+		features[column] = features[column].astype(object)
+	for column in NUMERIC_FEATURES:
+		features[column] = pd.to_numeric(features[column], errors='coerce').astype('float64')
+	names = getattr(transformation_pipeline, 'feature_names_in_', None)
+	if names is not None:
+		return features.reindex(columns=names)
+	n_features = getattr(transformation_pipeline, 'n_features_in_', len(FEATURE_COLUMNS))
+	for i in range(n_features - len(FEATURE_COLUMNS)):
+		features[f'unused_{i}'] = float('nan')
+	return features
+
+
+def rescore_database(database_path, transformation_pipeline, model, model_version, batch_size=5000, n_jobs=None):
+	"""
+	Scores every row of the rentals table that has no prediction yet or was scored by a different model version.
+	Rows are read, scored and written back one batch at a time, each batch in its own transaction, so memory use does not depend on the size of the table and an interrupted run keeps the batches it finished.
+	Parameters
+	----------
+	database_path : str
+		The path to the database where this data is stored. If in CWD then this is just the database name.
+
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	model : estimator
+		The tuned model.
+
+	model_version : str
+		Version of the artifacts, as returned by load_artifacts.
+
+	batch_size : int -> Default = 5000
+		Number of rows scored at a time.
+
+	n_jobs : int -> Default = None
+		Number of batches scored at once. -1 uses every core.
+
+	Returns
+	------
+	num_scored : int
+		Number of rows scored.
+	"""
+
+	conn = connect(database_path)
+	columns = ', '.join(FEATURE_COLUMNS)
+	query = f'''SELECT rowid, {columns} FROM rentals
+		WHERE rowid > ? AND (predicted_monthly_rent IS NULL OR model_version IS NULL OR model_version != ?)
+		ORDER BY rowid LIMIT ?'''
+
+	start = time.perf_counter()
+	num_scored = 0
+	last_rowid = 0
+	chunk_size = batch_size * max(1, os.cpu_count() if n_jobs == -1 else (n_jobs or 1))
+	while True:
+		data = pd.read_sql(query, conn, params=(last_rowid, model_version, chunk_size), index_col='rowid')
+		if len(data) == 0:
+			break
+		predictions = predict_rent(data, transformation_pipeline, model, batch_size=batch_size, n_jobs=n_jobs)
+		with conn:
+			conn.executemany('UPDATE rentals SET predicted_monthly_rent = ?, model_version = ? WHERE rowid = ?',
+				[(float(prediction), model_version, int(rowid)) for rowid, prediction in predictions.items()])
+		num_scored += len(data)
+		last_rowid = int(data.index[-1])
+
+	conn.close()
+	print(f"{num_scored} rows in the rentals table scored with model version {model_version} in {time.perf_counter() - start:.1f}s.")
+	return num_scored
+
+
+def rescore_history(transformation_pipeline, model, model_version, history_dir='rental_history', batch_size=5000, n_jobs=None):
+	"""
+	Scores every file in the history store that was scored by a different model version.
+	Files are updated through rewrite_history, so the manifest records the model version each file was scored with.
+	Parameters
+	----------
+	transformation_pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	model : estimator
+		The tuned model.
+
+	model_version : str
+		Version of the artifacts, as returned by load_artifacts.
+
+	history_dir : str -> Default = 'rental_history'
+		Folder holding the history store.
+
+	batch_size : int -> Default = 5000
+		Number of rows scored at a time.
+
+	n_jobs : int -> Default = None
+		Number of batches scored at once. -1 uses every core.
+
+	Returns
+	------
+	num_scored : int
+		Number of rows scored.
+	"""
+
+	from history_store import rewrite_history
+
+	def score(data):
+		data['predicted_monthly_rent'] = predict_rent(data, transformation_pipeline, model, batch_size=batch_size, n_jobs=n_jobs)
+		data['model_version'] = model_version
+		return data
+
+	start = time.perf_counter()
+	num_scored = rewrite_history(score, history_dir=history_dir, version_key='model_version', version=model_version)
+	print(f"{num_scored} rows in the history store scored with model version {model_version} in {time.perf_counter() - start:.1f}s.")
+	return num_scored
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Score stored listings that have no prediction or were scored by an older model.')
+	parser.add_argument('--database', default='real_estate.db', help='SQLite database holding the rentals table.')
+	parser.add_argument('--history', default='rental_history', help='History store folder. Use "" to skip.')
+	parser.add_argument('--pipeline', default=PIPELINE_PATH)
+	parser.add_argument('--model', default=MODEL_PATH)
+	parser.add_argument('--batch-size', type=int, default=5000)
+	parser.add_argument('--n-jobs', type=int, default=-1)
+	args = parser.parse_args()
+
+	pipeline, model, version = load_artifacts(args.pipeline, args.model)
+	if os.path.exists(args.database):
+		rescore_database(args.database, pipeline, model, version, batch_size=args.batch_size, n_jobs=args.n_jobs)
+	if args.history and os.path.exists(args.history):
+		rescore_history(pipeline, model, version, history_dir=args.history, batch_size=args.batch_size, n_jobs=args.n_jobs)
@@ -0,0 +1,156 @@
+# IMPORTS
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from predict import model_input
+
+CACHE_PATH = 'prediction_cache.db'
+
+# CLASSES
+class PredictionCache:
+	"""
+	SQLite cache of predicted rents keyed by a hash of each listing's model features and the version of the model artifacts.
+	Most listings are unchanged from one scrape to the next, so only listings whose features have not been scored by this model before are transformed and predicted. Predictions of every other model version are evicted when the cache is opened, so a retrain never serves stale scores and the cache only ever holds one model's predictions.
+	Parameters
+	----------
+	model_version : str
+		Version of the model artifacts as returned by predict.load_artifacts.
+
+	cache_path : str -> Default = 'prediction_cache.db'
+		Path to the cache database.
+	"""
+
+	def __init__(self, model_version, cache_path=CACHE_PATH):
+		self.model_version = model_version
+		self.cache_path = cache_path
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS predictions (
+			feature_hash INTEGER NOT NULL, model_version TEXT NOT NULL, predicted_monthly_rent REAL NOT NULL,
+			PRIMARY KEY (feature_hash, model_version)) WITHOUT ROWID''')
+		self.conn.commit()
+		self.evict()
+
+	def evict(self):
+		"""
+		Deletes the predictions of every model version other than the current one.
+		Returns
+		------
+		num_evicted : int
+			Number of predictions deleted.
+		"""
+
+		with self.lock, self.conn:
+			num_evicted = self.conn.execute('DELETE FROM predictions WHERE model_version != ?', (self.model_version,)).rowcount
+		if num_evicted:
+			print(f"{num_evicted} cached predictions from older model versions evicted.")
+		return num_evicted
+
+	def predict(self, data, transformation_pipeline, model, metrics=None):
+		"""
+		Predicts the monthly rent of each listing, only sending listings not found in the cache through the pipeline and model.
+		Listings with the same features share one cache entry and are scored once.
+		Parameters
+		----------
+		data : DataFrame
+			Listings containing at least the FEATURE_COLUMNS.
+
+		transformation_pipeline : ColumnTransformer
+			The fitted transformation pipeline.
+
+		model : estimator
+			The tuned model.
+
+		metrics : RunMetrics -> Default = None
+			Records the number of listings found in and missing from the cache.
+		Returns
+		------
+		predictions : Series
+			Predicted monthly rent, with the same index as data.
+		"""
+
+		hashes = feature_hashes(data)
+		cached = self.lookup(hashes.unique())
+		missing = ~hashes.isin(cached.keys())
+		num_hits, num_misses = int((~missing).sum()), int(missing.sum())
+
+		if num_misses:
+			# Score each distinct set of features once
+			new = missing & ~hashes.duplicated()
+			new_hashes = hashes[new]
+			new_predictions = model.predict(transformation_pipeline.transform(model_input(data[new.values], transformation_pipeline)))
+			self.store(new_hashes, new_predictions)
+			cached.update(zip(new_hashes.tolist(), new_predictions.tolist()))
+
+		with self.lock:
+			self.hits += num_hits
+			self.misses += num_misses
+		if metrics is not None:
+			metrics.cache_lookup(num_hits, num_misses)
+		return pd.Series(hashes.map(cached).values, index=data.index, dtype='float64')
+
+	def lookup(self, hashes):
+		"""
+		Cached predictions of the current model for the given feature hashes.
+		Returns
+		------
+		predictions : dict
+			Feature hash mapped to its predicted rent, for the hashes found.
+		"""
+
+		hashes = [int(feature_hash) for feature_hash in hashes]
+		predictions = {}
+		with self.lock:
+			for start in range(0, len(hashes), 500):
+				chunk = hashes[start:start + 500]
+				predictions.update(self.conn.execute(f'''SELECT feature_hash, predicted_monthly_rent FROM predictions
+					WHERE model_version = ? AND feature_hash IN ({', '.join('?' for i in chunk)})''', [self.model_version] + chunk))
+		return predictions
+
+	def store(self, hashes, predictions):
+		"""
+		Adds predictions of the current model to the cache.
+		"""
+
+		rows = [(int(feature_hash), self.model_version, float(prediction)) for feature_hash, prediction in zip(hashes, predictions)]
+		with self.lock, self.conn:
+			self.conn.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)', rows)
+
+	def summary(self):
+		"""
+		Hits and misses since the cache was opened.
+		"""
+
+		with self.lock:
+			lookups = self.hits + self.misses
+			return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else None}
+
+	def close(self):
+		summary = self.summary()
+		if summary['hit_rate'] is not None:
+			print(f"Prediction cache: {summary['hits']} hits, {summary['misses']} misses ({summary['hit_rate']:.0%} hit rate).")
+		with self.lock:
+			self.conn.close()
+
+
+# FUNCTIONS
+def feature_hashes(data):
+	"""
+	Stable 64 bit hash of the model features of each listing.
+	Features are normalised with predict.model_input first, so the same listing hashes the same whether it comes from listings_to_frame, the database or the history store. pandas hashes with a fixed key, so hashes are the same in every process and run.
+	Parameters
+	----------
+	data : DataFrame
+		Listings containing at least the FEATURE_COLUMNS.
+	Returns
+	------
+	hashes : Series
+		Signed 64 bit hash of each listing, as stored by SQLite, with the same index as data.
+	"""
+
+	hashes = pd.util.hash_pandas_object(model_input(data), index=False)
+	return pd.Series(hashes.values.view(np.int64), index=data.index)
@@ -0,0 +1,423 @@
+# IMPORTS
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from joblib import Memory, dump
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import GridSearchCV
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from predict import CATEGORICAL_FEATURES, NUMERIC_FEATURES, FEATURE_COLUMNS, PIPELINE_PATH, MODEL_PATH, artifact_version, model_input
+
+MODELS_DIR = 'models'
+CACHE_DIR = 'retrain_cache'
+TARGET = 'rent_pcm'
+
+# Same search as the notebook. 'auto' and 'None' are both all features, which newer sklearn calls 1.0.
+PARAM_GRID = {'n_estimators': [25, 50, 100, 150], 'max_features': [1.0, 'sqrt', 'log2']}
+
+# FUNCTIONS
+def retrain(database_path=None, history_dir=None, param_grid=PARAM_GRID, chunk_size=50000, sample_size=200000, search_rows=200000,
+		cv=5, n_jobs=-1, models_dir=MODELS_DIR, cache_dir=CACHE_DIR, publish=False, seed=42, trace_memory=False):
+	"""
+	Retrains the transformation pipeline and Random Forest on every listing stored so far, without loading the history into memory.
+	1. Scan: the latest scrape of each listing is streamed from the rentals table or the history store chunk_size rows at a time, collecting every category seen and a random sample of sample_size listings.
+	2. Fit pipeline: the same ColumnTransformer as the notebook is fitted on the sample, with the one hot encoders given every category from the scan.
+	3. Transform: each chunk is transformed into an on-disk feature matrix. Transformed chunks are cached with joblib Memory, so running again on the same data, e.g. with a different param_grid, skips this stage.
+	4. Search: a cross validated grid search over param_grid on up to search_rows listings, running one fit per core in a process pool.
+	5. Refit: the best parameters are fitted on every listing.
+	6. Save: the pipeline and model are saved uncompressed, so load_artifacts can memory-map them, in a folder of models_dir named after the date and artifact version, with a metadata.json of the scores, parameters and timings.
+	The wall time of each stage and the peak resident memory of the process and its workers while the stage ran, sampled every 0.1 seconds from /proc, are printed and saved in the metadata. The lifetime peak of the process by the end of each stage is saved as well, and is all that is recorded where there is no /proc, e.g. on macOS.
+	Parameters
+	----------
+	database_path : str -> Default = None
+		Database to train from. Either this or history_dir must be given.
+
+	history_dir : str -> Default = None
+		History store to train from instead of the database.
+
+	param_grid : dict -> Default = PARAM_GRID
+		Random Forest parameters to search.
+
+	chunk_size : int -> Default = 50000
+		Number of listings read and transformed at a time.
+
+	sample_size : int -> Default = 200000
+		Number of listings the transformation pipeline is fitted on.
+
+	search_rows : int -> Default = 200000
+		Number of listings the grid search is run on. Use None to search on every listing.
+
+	cv : int -> Default = 5
+		Number of cross validation folds.
+
+	n_jobs : int -> Default = -1
+		Number of processes the grid search and final fit use. -1 uses every core.
+
+	models_dir : str -> Default = 'models'
+		Folder the versioned artifacts are saved in.
+
+	cache_dir : str -> Default = 'retrain_cache'
+		Folder of the cached feature matrices.
+
+	publish : bool -> Default = False
+		Whether to also copy the new artifacts over full_pipeline.joblib and tuned_model.joblib, so scrape_flats and cli.py use them.
+
+	seed : int -> Default = 42
+		Seed for the sample, search subset and models.
+
+	trace_memory : bool -> Default = False
+		Whether to also measure the peak memory allocated within each stage with tracemalloc. This is exact per stage but makes the pandas heavy stages several times slower.
+	Returns
+	------
+	report : dict
+		Version, folder, number of listings, best parameters, cross validated RMSE and the wall time and memory of each stage.
+	"""
+
+	if database_path is None and history_dir is None:
+		raise ValueError('Either database_path or history_dir must be given.')
+	chunks = lambda: iter_training_chunks(database_path, history_dir, chunk_size)
+	os.makedirs(cache_dir, exist_ok=True)
+	memory = Memory(os.path.join(cache_dir, 'joblib'), verbose=0)
+	stages = {}
+	if trace_memory:
+		tracemalloc.start()
+	try:
+		with _stage(stages, 'scan'):
+			categories, sample, num_rows = scan_training_data(chunks(), sample_size, seed)
+		if num_rows == 0:
+			raise ValueError('No listings with a rent to train on.')
+		print(f"{num_rows} listings to train on.")
+
+		with _stage(stages, 'fit_pipeline'):
+			pipeline = build_pipeline(categories)
+			pipeline.fit(model_input(sample))
+			del sample
+
+		with _stage(stages, 'transform'):
+			X, y = transform_chunks(pipeline, chunks(), num_rows, memory, os.path.join(cache_dir, 'features.npy'))
+
+		with _stage(stages, 'search'):
+			rows = np.arange(num_rows)
+			if search_rows is not None and num_rows > search_rows:
+				rows = np.sort(np.random.default_rng(seed).choice(num_rows, search_rows, replace=False))
+			grid = GridSearchCV(RandomForestRegressor(random_state=4), param_grid, cv=cv, scoring='neg_mean_squared_error', n_jobs=n_jobs, refit=False)
+			grid.fit(X[rows], y[rows])
+			rmse = float(np.sqrt(-grid.best_score_))
+
+		with _stage(stages, 'refit'):
+			model = RandomForestRegressor(random_state=4, n_jobs=n_jobs, **grid.best_params_)
+			model.fit(X, y)
+
+		with _stage(stages, 'save'):
+			report = {'trained': datetime.datetime.now().isoformat(timespec='seconds'), 'source': database_path or history_dir,
+				'listings': num_rows, 'search_listings': len(rows), 'best_params': grid.best_params_, 'cv_rmse': rmse, 'stages': stages}
+			report.update(save_artifacts(pipeline, model, report, models_dir, publish))
+	finally:
+		if trace_memory:
+			tracemalloc.stop()
+
+	# The save stage finished after metadata.json was written, so it is written again with every stage
+	with open(os.path.join(report['path'], 'metadata.json'), 'w') as f:
+		json.dump(report, f, indent=2, default=str)
+	print(f"{'stage':<14}{'seconds':>10}{'stage MB':>10}{'total MB':>10}" + (f"{'traced MB':>11}" if trace_memory else ''))
+	for name, stage in stages.items():
+		print(f"{name:<14}{stage['seconds']:>10.1f}{stage['peak_rss_mb'] or 0:>10.0f}{stage['cumulative_max_rss_mb'] or 0:>10.0f}"
+			+ (f"{stage['traced_mb']:>11.0f}" if trace_memory else ''))
+	print('stage MB is the peak resident memory during the stage, total MB the peak of the process since it started.')
+	print(f"Model version {report['version']} trained on {num_rows} listings with {grid.best_params_} (cross validated RMSE {rmse:.0f}). Saved to {report['path']}.")
+	return report
+
+
+def iter_training_chunks(database_path=None, history_dir=None, chunk_size=50000):
+	"""
+	Streams the latest scrape of every listing with a rent, chunk_size listings at a time.
+	Parameters
+	----------
+	database_path : str -> Default = None
+		Database to read the rentals table from.
+
+	history_dir : str -> Default = None
+		History store to read from if database_path is not given. Newest scrape dates are read first, so older scrapes of a listing already read are skipped.
+
+	chunk_size : int -> Default = 50000
+		Number of listings per chunk.
+	Returns
+	------
+	chunks : generator
+		DataFrames with the FEATURE_COLUMNS and rent_pcm.
+	"""
+
+	columns = FEATURE_COLUMNS + [TARGET]
+	if database_path is not None:
+		conn = sqlite3.connect(database_path)
+		try:
+			# rowids of the latest row of each listing, so the table can be read in rowid ranges
+			conn.execute('CREATE TEMP TABLE latest_rows (id INTEGER PRIMARY KEY)')
+			conn.execute(f'INSERT INTO latest_rows SELECT MAX(rowid) FROM rentals WHERE {TARGET} IS NOT NULL GROUP BY property_id')
+			last_rowid = 0
+			while True:
+				chunk = pd.read_sql(f'''SELECT latest_rows.id, {', '.join(columns)} FROM latest_rows JOIN rentals ON rentals.rowid = latest_rows.id
+					WHERE latest_rows.id > ? ORDER BY latest_rows.id LIMIT ?''', conn, params=(last_rowid, chunk_size))
+				if chunk.empty:
+					break
+				last_rowid = int(chunk['id'].iloc[-1])
+				yield chunk[columns]
+		finally:
+			conn.close()
+		return
+
+	from history_store import read_history, scrape_dates
+	seen = set()
+	buffered = []
+	for scrape_date in reversed(scrape_dates(history_dir)):
+		data = read_history(history_dir, start_date=scrape_date, end_date=scrape_date, columns=['property_id'] + columns)
+		data = data[data[TARGET].notna()]
+		data = data[~data['property_id'].astype(str).isin(seen)].drop_duplicates('property_id', keep='last')
+		seen.update(data['property_id'].astype(str))
+		buffered.append(data[columns])
+		if sum(len(frame) for frame in buffered) >= chunk_size:
+			data = pd.concat(buffered, ignore_index=True)
+			for start in range(0, len(data) - len(data) % chunk_size, chunk_size):
+				yield data.iloc[start:start + chunk_size]
+			buffered = [data.iloc[len(data) - len(data) % chunk_size:]]
+	if buffered and sum(len(frame) for frame in buffered):
+		yield pd.concat(buffered, ignore_index=True)
+
+
+def scan_training_data(chunks, sample_size=200000, seed=42):
+	"""
+	Makes one pass over the training data, collecting every category of each categorical feature and a uniform random sample of listings.
+	Only the sample and the categories are kept in memory. Each listing is given a random key and the sample_size listings with the smallest keys are kept.
+	Parameters
+	----------
+	chunks : iterable
+		DataFrames from iter_training_chunks.
+
+	sample_size : int -> Default = 200000
+		Number of listings to sample.
+
+	seed : int -> Default = 42
+		Seed for the random keys.
+	Returns
+	------
+	categories : dict
+		Sorted categories of each of the CATEGORICAL_FEATURES, as the pipeline sees them.
+
+	sample : DataFrame
+		The sampled listings.
+
+	num_rows : int
+		Number of listings in all chunks.
+	"""
+
+	rng = np.random.default_rng(seed)
+	categories = {column: set() for column in CATEGORICAL_FEATURES}
+	sample = None
+	num_rows = 0
+	for chunk in chunks:
+		features = model_input(chunk)
+		for column in CATEGORICAL_FEATURES:
+			categories[column].update(features[column].dropna().unique())
+		chunk = chunk.assign(_key=rng.random(len(chunk)))
+		sample = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+		sample = sample.nsmallest(sample_size, '_key')
+		num_rows += len(chunk)
+
+	categories = {column: sorted(values, key=str) for column, values in categories.items()}
+	sample = sample.drop(columns='_key').reset_index(drop=True) if sample is not None else None
+	return categories, sample, num_rows
+
+
+def build_pipeline(categories):
+	"""
+	The notebook's transformation pipeline: categorical features one hot encoded, numeric features median imputed and standardised.
+	The one hot encoders are given every category found in the training data, as the pipeline is fitted on a sample that may not contain them all, and ignore categories first seen after training.
+	"""
+
+	categorical_pipe = Pipeline(steps=[
+		('one_hot_encode', OneHotEncoder(categories=[categories[column] for column in CATEGORICAL_FEATURES], handle_unknown='ignore', sparse_output=False))])
+	numerical_pipe = Pipeline(steps=[
+		('imputer', SimpleImputer(strategy='median')),
+		('std_scaler', StandardScaler())])
+	return ColumnTransformer([
+		('cat_pipeline', categorical_pipe, CATEGORICAL_FEATURES),
+		('num_pipeline', numerical_pipe, NUMERIC_FEATURES)])
+
+
+def transform_chunks(pipeline, chunks, num_rows, memory, path):
+	"""
+	Transforms the training data chunk by chunk into a float32 feature matrix memory-mapped from disk.
+	Parameters
+	----------
+	pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	chunks : iterable
+		DataFrames from iter_training_chunks.
+
+	num_rows : int
+		Number of listings in all chunks.
+
+	memory : joblib.Memory
+		Cache of transformed chunks.
+
+	path : str
+		Where to save the feature matrix.
+	Returns
+	------
+	X : ndarray
+		Memory-mapped feature matrix.
+
+	y : ndarray
+		Rent of each listing.
+	"""
+
+	transform = memory.cache(_transform_chunk)
+	X = None
+	y = np.empty(num_rows, dtype=np.float64)
+	start = 0
+	for chunk in chunks:
+		features = transform(pipeline, chunk)
+		if X is None:
+			X = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(num_rows, features.shape[1]))
+		X[start:start + len(chunk)] = features
+		y[start:start + len(chunk)] = pd.to_numeric(chunk[TARGET], errors='coerce').values
+		start += len(chunk)
+	X.flush()
+	return X, y
+
+
+def save_artifacts(pipeline, model, metadata, models_dir=MODELS_DIR, publish=False):
+	"""
+	Saves a retrained pipeline and model in their own versioned folder.
+	The version is the same hash of both files that load_artifacts returns, so predictions stored with a model_version can be traced to the folder of the model that made them.
+	Parameters
+	----------
+	pipeline : ColumnTransformer
+		The fitted transformation pipeline.
+
+	model : estimator
+		The fitted model.
+
+	metadata : dict
+		Saved next to the artifacts as metadata.json.
+
+	models_dir : str -> Default = 'models'
+		Folder holding one folder per version.
+
+	publish : bool -> Default = False
+		Whether to also copy the artifacts over full_pipeline.joblib and tuned_model.joblib.
+	Returns
+	------
+	saved : dict
+		The version and the folder it was saved to.
+	"""
+
+	work_dir = os.path.join(models_dir, f'tmp-{os.getpid()}')
+	os.makedirs(work_dir, exist_ok=True)
+	pipeline_path = os.path.join(work_dir, PIPELINE_PATH)
+	model_path = os.path.join(work_dir, MODEL_PATH)
+	dump(pipeline, pipeline_path)
+	dump(model, model_path)
+	version = artifact_version(pipeline_path, model_path)
+
+	path = os.path.join(models_dir, f"{datetime.date.today():%Y-%m-%d}-{version}")
+	with open(os.path.join(work_dir, 'metadata.json'), 'w') as f:
+		json.dump(dict(metadata, version=version, path=path), f, indent=2, default=str)
+	if os.path.exists(path):
+		shutil.rmtree(path)
+	os.replace(work_dir, path)
+
+	if publish:
+		for name in [PIPELINE_PATH, MODEL_PATH]:
+			shutil.copyfile(os.path.join(path, name), name + '.tmp')
+			os.replace(name + '.tmp', name)
+		print(f"Model version {version} published to {PIPELINE_PATH} and {MODEL_PATH}.")
+	return {'version': version, 'path': path}
+
+
+@contextmanager
+def _stage(stages, name):
+	tracing = tracemalloc.is_tracing()
+	if tracing:
+		tracemalloc.reset_peak()
+	peak = [_rss_mb()]
+	stopped = threading.Event()
+	def sample():
+		while not stopped.wait(0.1):
+			peak.append(max(peak[-1], _rss_mb()))
+	sampler = threading.Thread(target=sample, daemon=True)
+	if peak[0] is not None:
+		sampler.start()
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		seconds = time.perf_counter() - start
+		stopped.set()
+		if peak[0] is not None:
+			sampler.join()
+			peak.append(max(peak[-1], _rss_mb()))
+		stages[name] = {'seconds': seconds, 'peak_rss_mb': peak[-1], 'cumulative_max_rss_mb': _max_rss_mb()}
+		if tracing:
+			stages[name]['traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+
+
+def _rss_mb(pid='self'):
+	# Current resident memory of a process and every process below it, e.g. the grid search workers. None without /proc
+	try:
+		with open(f'/proc/{pid}/status') as f:
+			rss_kb = next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+	except OSError:
+		return None
+	pid = os.getpid() if pid == 'self' else pid
+	try:
+		with open(f'/proc/{pid}/task/{pid}/children') as f:
+			children = f.read().split()
+	except OSError:
+		children = []
+	return rss_kb / 2 ** 10 + sum(_rss_mb(child) or 0 for child in children)
+
+
+def _max_rss_mb():
+	# Lifetime peak of the process or its largest finished child, so it never drops from one stage to the next
+	try:
+		import resource
+	except ImportError:
+		return None
+	# ru_maxrss is in bytes on macOS and kilobytes on Linux
+	max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+	return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+
+
+def _transform_chunk(pipeline, chunk):
+	return np.asarray(pipeline.transform(model_input(chunk, pipeline)), dtype=np.float32)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Retrain the transformation pipeline and Random Forest on every stored listing.')
+	parser.add_argument('--database', help='SQLite database holding the rentals table.')
+	parser.add_argument('--history', help='History store folder to train from instead of the database.')
+	parser.add_argument('--chunk-size', type=int, default=50000)
+	parser.add_argument('--search-rows', type=int, default=200000)
+	parser.add_argument('--n-jobs', type=int, default=-1)
+	parser.add_argument('--models-dir', default=MODELS_DIR)
+	parser.add_argument('--publish', action='store_true', help='Copy the new artifacts over full_pipeline.joblib and tuned_model.joblib')
+	parser.add_argument('--trace-memory', action='store_true', help='Also measure the memory allocated within each stage (slower)')
+	args = parser.parse_args()
+
+	retrain(args.database, args.history, chunk_size=args.chunk_size, search_rows=args.search_rows, n_jobs=args.n_jobs,
+		models_dir=args.models_dir, publish=args.publish, trace_memory=args.trace_memory)
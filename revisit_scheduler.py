@@ -0,0 +1,231 @@
+# IMPORTS
+import datetime
+import zlib
+import pandas as pd
+from html_cache import date_key
+
+# A new listing, or one whose rent just changed, is revisited after FIRST_REVISIT_DAYS. Every visit without a change multiplies the wait by BACKOFF, up to MAX_INTERVAL_DAYS.
+FIRST_REVISIT_DAYS = 3
+BACKOFF = 3
+MAX_INTERVAL_DAYS = 28
+
+# FUNCTIONS
+def create_state_table(conn):
+	"""
+	Creates the listing_state table the scheduler keeps next to the rentals table, and the listing_market view of days on the market for Tableau.
+	listing_state holds one row per listing: when it was first and last seen on the search results, when it was delisted, the rent at the last visit and when its page is due to be visited again. If the table is new it is seeded from the listings already in the rentals table.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database, as returned by database.connect.
+	Returns
+	------
+	"""
+
+	exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listing_state'").fetchone() is not None
+	with conn:
+		conn.execute('''CREATE TABLE IF NOT EXISTS listing_state (
+			property_id TEXT PRIMARY KEY, property_link TEXT, first_seen TEXT NOT NULL, last_seen TEXT NOT NULL,
+			delisted_on TEXT, last_visited TEXT, last_rent REAL, last_change TEXT,
+			stable_visits INTEGER NOT NULL DEFAULT 0, next_visit TEXT NOT NULL)''')
+		conn.execute('CREATE INDEX IF NOT EXISTS idx_listing_state_next_visit ON listing_state (next_visit)')
+		conn.execute('''CREATE VIEW IF NOT EXISTS listing_market AS SELECT property_id, first_seen, last_seen, delisted_on,
+			CAST(julianday(last_seen) - julianday(first_seen) + 1 AS INTEGER) AS days_on_market, delisted_on IS NULL AS on_market
+			FROM listing_state''')
+
+	if not exists:
+		_seed_from_rentals(conn)
+
+
+def update_index(conn, property_links, today, min_coverage=0.5, complete=True):
+	"""
+	Updates which listings are on the market from the search results alone, without visiting any listing page.
+	Listings seen for the first time are added and due straight away. Listings no longer on the search results are marked as delisted on this day, and delisted listings that reappear are due again. If the search results hold fewer than min_coverage of the listings on the market, nothing is marked as delisted, as the crawl probably failed part way or used a smaller radius.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	property_links : list
+		Links to every listing on today's search results.
+
+	today : str or date
+		Date of the scrape.
+
+	min_coverage : float -> Default = 0.5
+		Fraction of the listings on the market that must be found before any are marked as delisted.
+
+	complete : bool -> Default = True
+		Whether the search results were crawled in full. If not, new and relisted listings are still recorded but nothing is marked as delisted.
+	Returns
+	------
+	changes : dict
+		Number of new, delisted and relisted listings.
+	"""
+
+	today = date_key(today)
+	present = {link.split('/')[-1]: link for link in property_links}
+	known = dict(conn.execute('SELECT property_id, delisted_on FROM listing_state'))
+	on_market = [property_id for property_id, delisted_on in known.items() if delisted_on is None]
+
+	new = [property_id for property_id in present if property_id not in known]
+	relisted = [property_id for property_id in present if property_id in known and known[property_id] is not None]
+	delisted = [property_id for property_id in on_market if property_id not in present]
+	if not complete:
+		print("The search results were not crawled in full. No listings are marked as delisted this run.")
+		delisted = []
+	elif on_market and len(set(on_market) & present.keys()) < min_coverage * len(on_market):
+		print(f"Only {len(set(on_market) & present.keys())} of the {len(on_market)} listings on the market were found. No listings are marked as delisted this run.")
+		delisted = []
+
+	with conn:
+		conn.executemany('''INSERT INTO listing_state (property_id, property_link, first_seen, last_seen, next_visit) VALUES (?, ?, ?, ?, ?)''',
+			[(property_id, present[property_id], today, today, today) for property_id in new])
+		conn.executemany('UPDATE listing_state SET last_seen = ?, property_link = ? WHERE property_id = ?',
+			[(today, link, property_id) for property_id, link in present.items() if property_id in known])
+		conn.executemany('UPDATE listing_state SET delisted_on = NULL, next_visit = ? WHERE property_id = ?', [(today, property_id) for property_id in relisted])
+		conn.executemany('UPDATE listing_state SET delisted_on = ? WHERE property_id = ?', [(today, property_id) for property_id in delisted])
+
+	changes = {'new': len(new), 'delisted': len(delisted), 'relisted': len(relisted)}
+	print(f"{len(present)} listings on the market: {changes['new']} new, {changes['delisted']} delisted and {changes['relisted']} relisted since the last run.")
+	return changes
+
+
+def due_listings(conn, today, limit=None):
+	"""
+	Property ID's of the listings on the market whose page is due to be visited.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	today : str or date
+		Date of the scrape.
+
+	limit : int -> Default = None
+		Maximum number of listings to return. The most overdue listings, then those with the fewest visits without a rent change, come first.
+	Returns
+	------
+	ids : list
+		Property ID's of the listings to visit, in priority order.
+	"""
+
+	sql = '''SELECT property_id FROM listing_state WHERE delisted_on IS NULL AND next_visit <= ?
+		ORDER BY next_visit, stable_visits'''
+	params = (date_key(today),)
+	if limit is not None:
+		sql += ' LIMIT ?'
+		params += (limit,)
+	return [row[0] for row in conn.execute(sql, params)]
+
+
+def record_visits(conn, data, today, max_interval_days=MAX_INTERVAL_DAYS):
+	"""
+	Schedules the next visit of every listing whose page was just scraped.
+	A listing seen for the first time, or whose rent changed since the last visit, is visited again after FIRST_REVISIT_DAYS. Each visit without a change multiplies the wait by BACKOFF (3, 9, 27 days), up to max_interval_days. Each wait is shortened by up to half by an amount fixed per listing, so listings first seen on the same day do not all fall due on the same later day.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	data : DataFrame
+		Scraped listings with property_id, property_link and rent_pcm columns.
+
+	today : str or date
+		Date of the scrape.
+
+	max_interval_days : int -> Default = 28
+		Longest wait between two visits of a listing.
+	Returns
+	------
+	"""
+
+	today = date_key(today)
+	ids = data['property_id'].astype(str).tolist()
+	state = {}
+	for start in range(0, len(ids), 500):
+		chunk = ids[start:start + 500]
+		state.update((row[0], row[1:]) for row in conn.execute(
+			f"SELECT property_id, last_rent, stable_visits FROM listing_state WHERE property_id IN ({', '.join('?' for i in chunk)})", chunk))
+
+	rows = []
+	for property_id, property_link, rent in zip(ids, data['property_link'], data['rent_pcm']):
+		last_rent, stable_visits = state.get(property_id, (None, 0))
+		rent = None if pd.isna(rent) else float(rent)
+		changed = last_rent is not None and rent != last_rent
+		stable_visits = stable_visits + 1 if last_rent is not None and not changed else 0
+		next_visit = datetime.date.fromisoformat(today) + datetime.timedelta(days=_interval(property_id, stable_visits, max_interval_days))
+		rows.append((property_id, property_link, today, today, today, rent, today if changed else None, stable_visits, next_visit.isoformat()))
+
+	with conn:
+		conn.executemany('''INSERT INTO listing_state (property_id, property_link, first_seen, last_seen, last_visited, last_rent, last_change, stable_visits, next_visit)
+			VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+			ON CONFLICT (property_id) DO UPDATE SET last_visited = excluded.last_visited, last_rent = excluded.last_rent,
+			last_change = COALESCE(excluded.last_change, last_change), stable_visits = excluded.stable_visits, next_visit = excluded.next_visit''', rows)
+
+
+def add_history(conn, data):
+	"""
+	Adds listings scraped on earlier dates to listing_state, e.g. history imported from old files.
+	Unlike update_index and record_visits, the listings are not taken as today's search results or visits: nothing is marked as delisted, and listings already known only have their first_seen moved earlier and last_seen later. New listings are due FIRST_REVISIT_DAYS or so after their last scrape.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+
+	data : DataFrame
+		Listings with property_id, property_link, rent_pcm and scrape_date columns, scrape_date in '%d %B %Y' format.
+	Returns
+	------
+	num_listings : int
+		Number of distinct listings in data.
+	"""
+
+	data = data[['property_id', 'property_link', 'rent_pcm', 'scrape_date']].copy()
+	data['scrape_date'] = pd.to_datetime(data['scrape_date'], format="%d %B %Y", errors='coerce').dt.date
+	data = data.dropna(subset=['scrape_date']).sort_values('scrape_date')
+	if data.empty:
+		return 0
+	data['property_id'] = data['property_id'].astype(str)
+	grouped = data.groupby('property_id')
+	state = grouped.last()
+	state['first_seen'] = grouped['scrape_date'].min()
+
+	rows = [(property_id, row.property_link, row.first_seen.isoformat(), row.scrape_date.isoformat(), row.scrape_date.isoformat(),
+		None if pd.isna(row.rent_pcm) else float(row.rent_pcm),
+		(row.scrape_date + datetime.timedelta(days=_interval(property_id, 0, MAX_INTERVAL_DAYS))).isoformat())
+		for property_id, row in state.iterrows()]
+	with conn:
+		conn.executemany('''INSERT INTO listing_state (property_id, property_link, first_seen, last_seen, last_visited, last_rent, next_visit)
+			VALUES (?, ?, ?, ?, ?, ?, ?)
+			ON CONFLICT (property_id) DO UPDATE SET first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)''', rows)
+	return len(rows)
+
+
+def market_status(conn):
+	"""
+	Days on the market and whether each listing is still on the market, from the listing_market view.
+	Parameters
+	----------
+	conn : sqlite3.Connection
+		Open connection to the database.
+	Returns
+	------
+	data : DataFrame
+		One row per listing with first_seen, last_seen, delisted_on, days_on_market and on_market.
+	"""
+
+	return pd.read_sql('SELECT * FROM listing_market', conn)
+
+
+def _interval(property_id, stable_visits, max_interval_days):
+	interval = min(FIRST_REVISIT_DAYS * BACKOFF ** stable_visits, max_interval_days)
+	spread = zlib.crc32(property_id.encode('utf-8')) % 1000 / 1000
+	return max(1, round(interval * (1 - spread / 2)))
+
+
+def _seed_from_rentals(conn):
+	# Start from what is already known: first and last scrape of each listing and its latest rent
+	num_listings = add_history(conn, pd.read_sql('SELECT property_id, property_link, rent_pcm, scrape_date FROM rentals', conn))
+	if num_listings:
+		print(f"Revisit schedule started from the {num_listings} listings already in the rentals table.")
@@ -0,0 +1,201 @@
+# IMPORTS
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+METRICS_DIR = 'run_metrics'
+PROMETHEUS_FILE = 'openrent_scrape.prom'
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# CLASSES
+class RunMetrics:
+	"""
+	Collects timings, latency histograms, bytes downloaded, retries, failures and prediction cache hits for one scrape run.
+	Every stage records each unit of work it does with observe() or timer(): a request for discover and fetch, a page for parse and a batch for features, predict, db_write and history_append. Failures are counted by stage and exception type. Safe to share between the fetch, parse and main threads.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.run_id = uuid.uuid4().hex[:8]
+		self.start = time.perf_counter()
+		self.finished = None
+		self.stage_seconds = defaultdict(float)
+		self.stage_counts = Counter()
+		self.histograms = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+		self.failures = Counter()
+		self.retries = Counter()
+		self.bytes_downloaded = 0
+		self.listings = 0
+		self.cache_hits = 0
+		self.cache_misses = 0
+
+	def observe(self, stage, seconds):
+		"""
+		Records one unit of work done by a stage and how long it took.
+		"""
+
+		bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+		with self.lock:
+			self.stage_seconds[stage] += seconds
+			self.stage_counts[stage] += 1
+			self.histograms[stage][bucket] += 1
+
+	@contextmanager
+	def timer(self, stage):
+		"""
+		Times the body of a with block as one unit of work of a stage.
+		"""
+
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(stage, time.perf_counter() - start)
+
+	def failure(self, stage, error):
+		"""
+		Counts a failure of a stage by the type of exception raised.
+		"""
+
+		with self.lock:
+			self.failures[(stage, type(error).__name__)] += 1
+
+	def retry(self, stage, count=1):
+		with self.lock:
+			self.retries[stage] += count
+
+	def add_bytes(self, num_bytes):
+		with self.lock:
+			self.bytes_downloaded += num_bytes
+
+	def add_listings(self, num_listings):
+		with self.lock:
+			self.listings += num_listings
+
+	def cache_lookup(self, hits, misses):
+		"""
+		Counts listings whose prediction was found in the prediction cache and those that had to be scored.
+		"""
+
+		with self.lock:
+			self.cache_hits += hits
+			self.cache_misses += misses
+
+	def finish(self):
+		"""
+		Marks the end of the run. Wall time and listings per minute are measured up to here.
+		"""
+
+		self.finished = time.perf_counter()
+
+	def report(self):
+		"""
+		Summary of the run.
+		Returns
+		------
+		report : dict
+			Run ID, wall time, listings per minute, bytes downloaded, prediction cache hits and misses, and the total time, count, latency histogram, retries and failures by exception type of each stage. A stage's share_of_wall_time adds up the time of all its threads, so it is above 1 for stages doing work concurrently, like fetch.
+		"""
+
+		with self.lock:
+			wall_seconds = (self.finished or time.perf_counter()) - self.start
+			stages = {}
+			for stage in self.stage_counts:
+				stages[stage] = {
+					'seconds': self.stage_seconds[stage], 'count': self.stage_counts[stage],
+					'mean_seconds': self.stage_seconds[stage] / self.stage_counts[stage],
+					'share_of_wall_time': self.stage_seconds[stage] / wall_seconds if wall_seconds > 0 else None,
+					'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.histograms[stage]))}
+			for stage, count in self.retries.items():
+				stages.setdefault(stage, {})['retries'] = count
+			for (stage, error), count in self.failures.items():
+				stages.setdefault(stage, {}).setdefault('failures', {})[error] = count
+
+			return {
+				'run_id': self.run_id, 'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+				'wall_seconds': wall_seconds, 'listings': self.listings,
+				'listings_per_minute': self.listings / wall_seconds * 60 if wall_seconds > 0 else None,
+				'bytes_downloaded': self.bytes_downloaded, 'stages': stages,
+				'prediction_cache': {'hits': self.cache_hits, 'misses': self.cache_misses}}
+
+	def write(self, metrics_dir=METRICS_DIR):
+		"""
+		Writes the run report as JSON and the metrics in Prometheus text format.
+		The JSON report is kept for every run, named after the microsecond the run started and a random run ID so runs started together, e.g. shard workers, never overwrite each other's report. The Prometheus file is replaced by each run, so a node-exporter textfile collector pointed at metrics_dir always sees the latest run.
+		Parameters
+		----------
+		metrics_dir : str -> Default = 'run_metrics'
+			Folder to write both files to.
+		Returns
+		------
+		report_path : str
+			Path of the JSON run report.
+		"""
+
+		os.makedirs(metrics_dir, exist_ok=True)
+		report = self.report()
+		report_path = os.path.join(metrics_dir, f"run-{datetime.datetime.fromtimestamp(self.started):%Y-%m-%d-%H%M%S-%f}-{self.run_id}.json")
+		with open(report_path, 'w') as f:
+			json.dump(report, f, indent=2)
+
+		# Written under a temporary name so the collector never reads a half written file
+		prometheus_path = os.path.join(metrics_dir, PROMETHEUS_FILE)
+		with open(prometheus_path + '.tmp', 'w') as f:
+			f.write(self.prometheus())
+		os.replace(prometheus_path + '.tmp', prometheus_path)
+
+		print(f"{report['listings']} listings in {report['wall_seconds']:.0f}s ({report['listings_per_minute'] or 0:.0f} listings/min). Run report saved to {report_path}.")
+		return report_path
+
+	def prometheus(self):
+		"""
+		The metrics in Prometheus text exposition format.
+		"""
+
+		report = self.report()
+		lines = [
+			'# HELP openrent_scrape_last_run_timestamp_seconds Time the last scrape run started.',
+			'# TYPE openrent_scrape_last_run_timestamp_seconds gauge',
+			f'openrent_scrape_last_run_timestamp_seconds {self.started:.0f}',
+			'# HELP openrent_scrape_wall_seconds Wall clock duration of the last scrape run.',
+			'# TYPE openrent_scrape_wall_seconds gauge',
+			f"openrent_scrape_wall_seconds {report['wall_seconds']:.3f}",
+			'# HELP openrent_scrape_listings Listings scraped in the last run.',
+			'# TYPE openrent_scrape_listings gauge',
+			f"openrent_scrape_listings {report['listings']}",
+			'# HELP openrent_scrape_listings_per_minute Listings scraped per minute in the last run.',
+			'# TYPE openrent_scrape_listings_per_minute gauge',
+			f"openrent_scrape_listings_per_minute {report['listings_per_minute'] or 0:.3f}",
+			'# HELP openrent_scrape_bytes_downloaded Bytes downloaded in the last run.',
+			'# TYPE openrent_scrape_bytes_downloaded gauge',
+			f"openrent_scrape_bytes_downloaded {report['bytes_downloaded']}",
+			'# HELP openrent_scrape_prediction_cache_lookups Listings looked up in the prediction cache in the last run.',
+			'# TYPE openrent_scrape_prediction_cache_lookups gauge',
+			f"openrent_scrape_prediction_cache_lookups{{result=\"hit\"}} {report['prediction_cache']['hits']}",
+			f"openrent_scrape_prediction_cache_lookups{{result=\"miss\"}} {report['prediction_cache']['misses']}",
+			'# HELP openrent_scrape_stage_duration_seconds Time taken by each unit of work of a stage.',
+			'# TYPE openrent_scrape_stage_duration_seconds histogram']
+
+		with self.lock:
+			for stage in sorted(self.stage_counts):
+				cumulative = 0
+				for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.histograms[stage]):
+					cumulative += count
+					lines.append(f'openrent_scrape_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+				lines.append(f'openrent_scrape_stage_duration_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+				lines.append(f'openrent_scrape_stage_duration_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+
+			lines += ['# HELP openrent_scrape_retries Requests retried in the last run.', '# TYPE openrent_scrape_retries gauge']
+			lines += [f'openrent_scrape_retries{{stage="{stage}"}} {count}' for stage, count in sorted(self.retries.items())]
+			lines += ['# HELP openrent_scrape_failures Failures in the last run by stage and exception type.', '# TYPE openrent_scrape_failures gauge']
+			lines += [f'openrent_scrape_failures{{stage="{stage}",exception="{error}"}} {count}' for (stage, error), count in sorted(self.failures.items())]
+
+		return '\n'.join(lines) + '\n'
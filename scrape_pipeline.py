@@ -0,0 +1,255 @@
+# IMPORTS
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fetcher import iter_pages
+from listing_parser import parse_listing, listings_to_frame
+from predict import model_input
+
+# Marks the end of a stage's output
+DONE = object()
+
+# FUNCTIONS
+def run_pipeline(property_links, today, transformation_pipeline=None, model=None, persist=None, batch_size=500,
+		max_workers=8, requests_per_second=2.0, parse_workers=None, queue_size=200, pages=None, cache=None, model_version=None,
+		on_failure=None, metrics=None, prediction_cache=None):
+	"""
+	Scrapes listing pages through a streaming pipeline of separate stages joined by bounded queues.
+	1. Fetch: a thread downloads pages with a pool of max_workers connections.
+	2. Parse: a thread hands each page to a pool of parse_workers processes, so parsing is not held back by the GIL.
+	3. Features, predict and persist: the calling thread groups parsed listings into batches of batch_size, builds the DataFrame with engineered features, adds predictions and passes the batch to persist.
+	Every queue holds at most queue_size items, so a slow stage makes the stages before it wait. Only a handful of batches are ever in memory, however many listings are scraped. Listings come out in the same order as property_links.
+	Parameters
+	----------
+	property_links : iterable
+		Links to the listing pages to scrape.
+
+	today : str
+		Date of the scrape in '%d %B %Y' format.
+
+	transformation_pipeline : ColumnTransformer -> Default = None
+		The custom transformation pipeline created while training the ML model. No predictions are made if not provided.
+
+	model : estimator -> Default = None
+		The tuned machine learning model that was trained seperately.
+
+	persist : callable -> Default = None
+		Called with each finished batch DataFrame, e.g. to write it to disk.
+
+	batch_size : int -> Default = 500
+		Number of listings per batch for the feature, prediction and persist stage.
+
+	max_workers : int -> Default = 8
+		Maximum number of listing pages requested at once.
+
+	requests_per_second : float -> Default = 2.0
+		Global request budget shared by all fetch threads.
+
+	parse_workers : int -> Default = None
+		Number of parse processes. Defaults to the number of CPU cores. Use 0 to parse in the parse thread instead.
+
+	queue_size : int -> Default = 200
+		Maximum number of items waiting between two stages.
+
+	pages : iterable -> Default = None
+		(link, html) tuples to use instead of downloading property_links, e.g. pages read back from the HTML cache.
+
+	cache : HtmlCache -> Default = None
+		Cache to store every downloaded listing page in.
+
+	model_version : str -> Default = None
+		Version of the model artifacts, stored next to each prediction.
+
+	on_failure : callable -> Default = None
+		Called with the link and the reason whenever a listing cannot be downloaded or parsed. The listing is skipped either way.
+
+	metrics : RunMetrics -> Default = None
+		Records the time spent in each stage: every request under 'fetch', every page under 'parse' and every batch under 'features' and 'predict'.
+
+	prediction_cache : PredictionCache -> Default = None
+		Cache of predictions by listing features. Only listings it has no prediction for are sent through the pipeline and model.
+
+	Returns
+	------
+	num_listings : int
+		Number of listings that made it through every stage.
+	"""
+
+	if parse_workers is None:
+		parse_workers = os.cpu_count() or 1
+
+	if pages is None:
+		on_error = None if on_failure is None else lambda link, e: on_failure(link, _reason(e))
+		pages = iter_pages(property_links, max_workers=max_workers, requests_per_second=requests_per_second, on_error=on_error,
+			metrics=metrics)
+
+	fetched = queue.Queue(maxsize=queue_size)
+	records = queue.Queue(maxsize=queue_size)
+	stop = threading.Event()
+	errors = []
+
+	fetch_thread = threading.Thread(target=_fetch_stage, args=(pages, fetched, stop, errors, cache, today), daemon=True)
+	parse_thread = threading.Thread(target=_parse_stage, args=(fetched, records, stop, errors, today, parse_workers, on_failure, metrics), daemon=True)
+	fetch_thread.start()
+	parse_thread.start()
+
+	num_listings = 0
+	batch = []
+	try:
+		while True:
+			listing = records.get()
+			if listing is not DONE:
+				batch.append(listing)
+			if len(batch) >= batch_size or (listing is DONE and batch):
+				num_listings += _process_batch(batch, today, transformation_pipeline, model, model_version, persist, metrics, prediction_cache)
+				print(f"{num_listings} new listings scraped")
+				batch = []
+			if listing is DONE:
+				break
+	finally:
+		# Let the earlier stages exit if this stage failed
+		stop.set()
+		fetch_thread.join()
+		parse_thread.join()
+
+	if errors:
+		raise errors[0]
+	return num_listings
+
+
+def _put(stage_queue, item, stop):
+	# Blocks while the next stage is busy, unless the pipeline is being stopped
+	while not stop.is_set():
+		try:
+			stage_queue.put(item, timeout=0.1)
+			return True
+		except queue.Full:
+			pass
+	return False
+
+
+def _get(stage_queue, stop):
+	while not stop.is_set():
+		try:
+			return stage_queue.get(timeout=0.1)
+		except queue.Empty:
+			pass
+	return DONE
+
+
+def _fetch_stage(pages, fetched, stop, errors, cache, today):
+	try:
+		for page in pages:
+			property_link, html = page
+			if cache is not None and html is not None:
+				cache.put(property_link.split('/')[-1], html, today, url=property_link)
+			if not _put(fetched, page, stop):
+				break
+	except Exception as e:
+		errors.append(e)
+	finally:
+		_put(fetched, DONE, stop)
+
+
+def _parse_stage(pages, records, stop, errors, today, parse_workers, on_failure, metrics):
+	# Keep up to twice as many pages in the process pool as there are processes, and pass results on in order
+	executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers else None
+	pending = deque()
+	try:
+		while True:
+			page = _get(pages, stop)
+			if page is DONE:
+				break
+			property_link, html = page
+			if html is None:
+				continue
+			if executor is not None:
+				try:
+					pending.append((property_link, html, executor.submit(_timed_parse, html, property_link, today)))
+				except BrokenProcessPool:
+					# The pool's processes died, e.g. a script without a __main__ guard re-ran itself in them under spawn
+					print("The parse processes stopped unexpectedly. Parsing the rest of the listings in this process instead.")
+					executor.shutdown(wait=False)
+					executor = None
+			if executor is None:
+				while pending and not stop.is_set():
+					_put_pending(pending, records, stop, on_failure, metrics, today)
+				_put_result(records, stop, on_failure, metrics, property_link, _timed_parse, html, property_link, today)
+				continue
+			if len(pending) >= 2 * parse_workers:
+				_put_pending(pending, records, stop, on_failure, metrics, today)
+		while pending and not stop.is_set():
+			_put_pending(pending, records, stop, on_failure, metrics, today)
+	except Exception as e:
+		errors.append(e)
+	finally:
+		if executor is not None:
+			executor.shutdown()
+		_put(records, DONE, stop)
+
+
+def _put_pending(pending, records, stop, on_failure, metrics, today):
+	property_link, html, future = pending.popleft()
+	_put_result(records, stop, on_failure, metrics, property_link, _pool_result, future, html, property_link, today)
+
+
+def _pool_result(future, html, property_link, today):
+	# A page lost with a broken pool is not a parse failure, so parse it here instead
+	try:
+		return future.result()
+	except BrokenProcessPool:
+		return _timed_parse(html, property_link, today)
+
+
+def _put_result(records, stop, on_failure, metrics, property_link, parse, *args):
+	# Listings that fail to parse are skipped, as they always have been, but the reason is passed on
+	try:
+		listing, seconds = parse(*args)
+	except Exception as e:
+		if metrics is not None:
+			metrics.failure('parse', e)
+		if on_failure is not None:
+			on_failure(property_link, _reason(e))
+		return
+	if metrics is not None:
+		metrics.observe('parse', seconds)
+	_put(records, listing, stop)
+
+
+def _timed_parse(html, property_link, today):
+	# Timed inside the parse process so the time spent waiting in the pool is not counted
+	start = time.perf_counter()
+	listing = parse_listing(html, property_link, today)
+	return listing, time.perf_counter() - start
+
+
+def _reason(e):
+	return f'{type(e).__name__}: {e}'
+
+
+def _process_batch(batch, today, transformation_pipeline, model, model_version, persist, metrics=None, prediction_cache=None):
+	with _stage_timer(metrics, 'features'):
+		data = listings_to_frame(batch, today)
+	if len(data) > 0 and model is not None:
+		with _stage_timer(metrics, 'predict'):
+			if prediction_cache is not None:
+				data['predicted_monthly_rent'] = prediction_cache.predict(data, transformation_pipeline, model, metrics)
+			else:
+				transformed_data = transformation_pipeline.transform(model_input(data, transformation_pipeline))
+				data['predicted_monthly_rent'] = model.predict(transformed_data)
+		if model_version is not None:
+			data['model_version'] = model_version
+	if persist is not None:
+		persist(data)
+	if metrics is not None:
+		metrics.add_listings(len(data))
+	return len(data)
+
+
+def _stage_timer(metrics, stage):
+	return metrics.timer(stage) if metrics is not None else nullcontext()
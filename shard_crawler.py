@@ -0,0 +1,495 @@
+# IMPORTS
+import argparse
+import datetime
+import io
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import pandas as pd
+from joblib import load
+from aggregates import BOROUGHS_CSV, create_aggregate_tables
+from comparables import load_comparables
+from data_utils import store_batch
+from database import connect
+from duplicates import create_duplicate_tables
+from fetcher import RateLimiter, create_session
+from html_cache import date_key
+from index_crawler import BASE_URL, crawl_area
+from predict import PIPELINE_PATH, MODEL_PATH, artifact_version, load_artifacts
+from revisit_scheduler import create_state_table, update_index
+from run_metrics import RunMetrics
+from scrape_pipeline import run_pipeline
+
+QUEUE_PATH = 'shard_queue.db'
+
+# CLASSES
+class ShardQueue:
+	"""
+	SQLite work queue of the shards of a sharded crawl, shared by the coordinator and every worker process.
+	A shard is one search (term and area). Workers claim shards one at a time, record the listings each shard found, and store every scraped batch here until the coordinator has merged it into the database. A listing found by several shards is only scraped by the first shard to claim it. A claimed shard is leased to its worker, so if the worker dies the shard is claimed again once the lease runs out.
+	Parameters
+	----------
+	queue_path : str -> Default = 'shard_queue.db'
+		Path to the queue database. Workers on other machines can join the crawl if it is on a shared drive.
+
+	timeout : float -> Default = 60
+		Seconds to wait for another process to finish writing.
+	"""
+
+	def __init__(self, queue_path=QUEUE_PATH, timeout=60):
+		self.queue_path = queue_path
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(queue_path, timeout=timeout, check_same_thread=False, isolation_level=None)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS shards (
+			run_date TEXT NOT NULL, shard_id TEXT NOT NULL, term TEXT NOT NULL, area INTEGER NOT NULL,
+			status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL,
+			found INTEGER NOT NULL DEFAULT 0, claimed INTEGER NOT NULL DEFAULT 0, error TEXT, updated TEXT,
+			PRIMARY KEY (run_date, shard_id))''')
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS shard_listings (
+			run_date TEXT NOT NULL, property_id TEXT NOT NULL, property_link TEXT NOT NULL, shard_id TEXT NOT NULL,
+			status TEXT NOT NULL DEFAULT 'pending', reason TEXT, PRIMARY KEY (run_date, property_id))''')
+		self.conn.execute('''CREATE TABLE IF NOT EXISTS shard_batches (
+			batch_id INTEGER PRIMARY KEY, run_date TEXT NOT NULL, shard_id TEXT NOT NULL, num_rows INTEGER NOT NULL,
+			data BLOB NOT NULL, merged INTEGER NOT NULL DEFAULT 0)''')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS idx_shard_listings_shard ON shard_listings (run_date, shard_id, status)')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS idx_shard_batches_merged ON shard_batches (run_date, merged)')
+
+	def add_shards(self, run_date, shards):
+		"""
+		Queues the (term, area) shards of a run. Shards already queued for that run keep their status, so running the coordinator again on the same day resumes the crawl.
+		"""
+
+		with self.lock:
+			self.conn.execute('BEGIN IMMEDIATE')
+			self.conn.executemany('INSERT OR IGNORE INTO shards (run_date, shard_id, term, area, updated) VALUES (?, ?, ?, ?, ?)',
+				[(date_key(run_date), shard_id(term, area), term, area, _now()) for term, area in shards])
+			self.conn.execute('COMMIT')
+
+	def claim(self, run_date, worker, max_attempts=3, lease_seconds=600):
+		"""
+		Claims the next shard to crawl: a pending shard, or one whose worker's lease ran out.
+		Returns
+		------
+		shard : dict
+			shard_id, term and area of the claimed shard, or None if there is nothing left to claim.
+		"""
+
+		with self.lock:
+			self.conn.execute('BEGIN IMMEDIATE')
+			try:
+				row = self.conn.execute('''SELECT shard_id, term, area FROM shards WHERE run_date = ? AND attempts < ?
+					AND (status = 'pending' OR (status = 'running' AND lease_until < ?)) ORDER BY attempts, rowid LIMIT 1''',
+					(date_key(run_date), max_attempts, time.time())).fetchone()
+				if row is not None:
+					self.conn.execute('''UPDATE shards SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, updated = ?
+						WHERE run_date = ? AND shard_id = ?''', (worker, time.time() + lease_seconds, _now(), date_key(run_date), row[0]))
+			finally:
+				self.conn.execute('COMMIT')
+		return None if row is None else dict(zip(('shard_id', 'term', 'area'), row))
+
+	def claim_listings(self, run_date, shard, property_links):
+		"""
+		Records the listings a shard found and returns the ones it has to scrape: those no other shard claimed first and not stored yet.
+		"""
+
+		rows = [(date_key(run_date), link.split('/')[-1], link, shard) for link in property_links]
+		with self.lock:
+			self.conn.execute('BEGIN IMMEDIATE')
+			self.conn.executemany('INSERT OR IGNORE INTO shard_listings (run_date, property_id, property_link, shard_id) VALUES (?, ?, ?, ?)', rows)
+			links = [row[0] for row in self.conn.execute('''SELECT property_link FROM shard_listings
+				WHERE run_date = ? AND shard_id = ? AND status != 'done' ORDER BY rowid''', (date_key(run_date), shard))]
+			claimed = self.conn.execute('SELECT COUNT(*) FROM shard_listings WHERE run_date = ? AND shard_id = ?', (date_key(run_date), shard)).fetchone()[0]
+			self.conn.execute('UPDATE shards SET found = ?, claimed = ?, updated = ? WHERE run_date = ? AND shard_id = ?',
+				(len(rows), claimed, _now(), date_key(run_date), shard))
+			self.conn.execute('COMMIT')
+		return links
+
+	def add_batch(self, run_date, shard, batch, lease_seconds=600):
+		"""
+		Stores a scraped batch of a shard for the coordinator to merge, marks its listings done and renews the shard's lease.
+		"""
+
+		buffer = io.BytesIO()
+		batch.to_parquet(buffer, index=False)
+		with self.lock:
+			self.conn.execute('BEGIN IMMEDIATE')
+			self.conn.execute('INSERT INTO shard_batches (run_date, shard_id, num_rows, data) VALUES (?, ?, ?, ?)',
+				(date_key(run_date), shard, len(batch), buffer.getvalue()))
+			self.conn.executemany("UPDATE shard_listings SET status = 'done', reason = NULL WHERE run_date = ? AND property_id = ?",
+				[(date_key(run_date), str(property_id)) for property_id in batch['property_id']])
+			self.conn.execute('UPDATE shards SET lease_until = ?, updated = ? WHERE run_date = ? AND shard_id = ?',
+				(time.time() + lease_seconds, _now(), date_key(run_date), shard))
+			self.conn.execute('COMMIT')
+
+	def mark_listing_failed(self, run_date, property_link, reason):
+		with self.lock:
+			self.conn.execute("UPDATE shard_listings SET status = 'failed', reason = ? WHERE run_date = ? AND property_id = ?",
+				(str(reason), date_key(run_date), property_link.split('/')[-1]))
+
+	def claimable(self, run_date, max_attempts=3):
+		"""
+		Whether claim would return a shard. Shards whose lease ran out on their last attempt are marked failed first, as no worker can claim them again.
+		"""
+
+		with self.lock:
+			self.conn.execute('''UPDATE shards SET status = 'failed', error = COALESCE(error, 'The worker stopped renewing its lease'), updated = ?
+				WHERE run_date = ? AND status = 'running' AND attempts >= ? AND lease_until < ?''', (_now(), date_key(run_date), max_attempts, time.time()))
+			return self.conn.execute('''SELECT 1 FROM shards WHERE run_date = ? AND attempts < ?
+				AND (status = 'pending' OR (status = 'running' AND lease_until < ?)) LIMIT 1''', (date_key(run_date), max_attempts, time.time())).fetchone() is not None
+
+	def release_worker(self, run_date, worker, error, max_attempts=3):
+		"""
+		Returns the shards held by a worker to the queue, or marks them failed once tried max_attempts times, without waiting for their lease to run out. Used when the worker's process has died.
+		"""
+
+		with self.lock:
+			return self.conn.execute('''UPDATE shards SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ?, lease_until = NULL, updated = ?
+				WHERE run_date = ? AND worker = ? AND status = ?''', (max_attempts, str(error), _now(), date_key(run_date), worker, 'running')).rowcount
+
+	def finish_shard(self, run_date, shard):
+		with self.lock:
+			self.conn.execute("UPDATE shards SET status = 'done', error = NULL, lease_until = NULL, updated = ? WHERE run_date = ? AND shard_id = ?",
+				(_now(), date_key(run_date), shard))
+
+	def fail_shard(self, run_date, shard, error, max_attempts=3):
+		"""
+		Returns a shard to the queue to be retried, or marks it failed once it has been tried max_attempts times.
+		"""
+
+		with self.lock:
+			self.conn.execute('''UPDATE shards SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ?, lease_until = NULL, updated = ?
+				WHERE run_date = ? AND shard_id = ?''', (max_attempts, str(error), _now(), date_key(run_date), shard))
+
+	def unmerged_batches(self, run_date):
+		"""
+		(batch_id, DataFrame) of every batch of a run not merged into the database yet, oldest first.
+		"""
+
+		with self.lock:
+			batch_ids = [row[0] for row in self.conn.execute('SELECT batch_id FROM shard_batches WHERE run_date = ? AND merged = 0 ORDER BY batch_id', (date_key(run_date),))]
+		for batch_id in batch_ids:
+			with self.lock:
+				data = self.conn.execute('SELECT data FROM shard_batches WHERE batch_id = ?', (batch_id,)).fetchone()[0]
+			yield batch_id, pd.read_parquet(io.BytesIO(data))
+
+	def mark_merged(self, batch_id):
+		# The data is no longer needed once it is in the database
+		with self.lock:
+			self.conn.execute("UPDATE shard_batches SET merged = 1, data = x'' WHERE batch_id = ?", (batch_id,))
+
+	def property_links(self, run_date):
+		"""
+		Links to every listing found by the shards of a run, each listing once.
+		"""
+
+		with self.lock:
+			return [row[0] for row in self.conn.execute('SELECT property_link FROM shard_listings WHERE run_date = ? ORDER BY rowid', (date_key(run_date),))]
+
+	def progress(self, run_date):
+		"""
+		Number of shards in each status, and of listings found, scraped, failed and merged, for a run.
+		"""
+
+		with self.lock:
+			shards = dict(self.conn.execute('SELECT status, COUNT(*) FROM shards WHERE run_date = ? GROUP BY status', (date_key(run_date),)).fetchall())
+			listings = dict(self.conn.execute('SELECT status, COUNT(*) FROM shard_listings WHERE run_date = ? GROUP BY status', (date_key(run_date),)).fetchall())
+			merged = self.conn.execute('SELECT COALESCE(SUM(num_rows), 0) FROM shard_batches WHERE run_date = ? AND merged = 1', (date_key(run_date),)).fetchone()[0]
+		return {'shards': shards, 'listings_found': sum(listings.values()), 'listings_scraped': listings.get('done', 0),
+			'listings_failed': listings.get('failed', 0), 'listings_merged': merged}
+
+	def failed_shards(self, run_date):
+		"""
+		(shard_id, attempts, error) of every shard of a run that failed on all its attempts.
+		"""
+
+		with self.lock:
+			return self.conn.execute("SELECT shard_id, attempts, error FROM shards WHERE run_date = ? AND status = 'failed' ORDER BY rowid",
+				(date_key(run_date),)).fetchall()
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
+
+
+# FUNCTIONS
+def crawl_shards(shards, database_path, num_workers=4, queue_path=QUEUE_PATH, pipeline_path=PIPELINE_PATH, model_path=MODEL_PATH,
+		base_url=BASE_URL, requests_per_second=2.0, max_workers=4, batch_size=100, max_attempts=3, lease_seconds=600,
+		progress_seconds=10, metrics_dir='run_metrics', comparables_path='comparables.joblib'):
+	"""
+	Crawls several searches at once as one run, with a pool of worker processes sharing an SQLite work queue.
+	Each shard (a search term and area) is claimed by a worker, which crawls its search results, claims the listings no other shard has claimed and scrapes and predicts them. Meanwhile this process merges every finished batch into the database the same way scrape_flats does, and prints the progress every progress_seconds. A shard that fails, or whose worker process dies, is put back in the queue and retried up to max_attempts times by a new worker, and its listings already stored are not scraped again. If any shard failed on every attempt, no listing is marked as delisted and RuntimeError is raised after the merge. Once every shard is finished, the search results of all shards are used to record which listings are still on the market.
+	Parameters
+	----------
+	shards : list
+		(term, area) of every search, e.g. from make_shards or postcode_shards.
+
+	database_path : str
+		Path to database. If in working directory then just name of the database.
+
+	num_workers : int -> Default = 4
+		Number of worker processes started. More can be started on other machines with `python shard_crawler.py worker`.
+
+	queue_path : str -> Default = 'shard_queue.db'
+		Path to the work queue database.
+
+	pipeline_path : str -> Default = 'full_pipeline.joblib'
+		Path to the fitted transformation pipeline each worker predicts with. Use None to not make predictions.
+
+	model_path : str -> Default = 'tuned_model.joblib'
+		Path to the tuned model.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site to scrape. Point this at the local fixture server to run offline.
+
+	requests_per_second : float -> Default = 2.0
+		Request budget of the whole crawl, split evenly between the workers.
+
+	max_workers : int -> Default = 4
+		Maximum number of listing pages each worker requests at once.
+
+	batch_size : int -> Default = 100
+		Number of listings per stored batch.
+
+	max_attempts : int -> Default = 3
+		Number of times a shard is tried before it is left as failed.
+
+	lease_seconds : float -> Default = 600
+		How long a worker can go without storing a batch before its shard is handed to another worker.
+
+	progress_seconds : float -> Default = 10
+		How often the progress is printed.
+
+	metrics_dir : str -> Default = 'run_metrics'
+		Folder the run report of the merge is written to. Use None to not write it.
+
+	comparables_path : str -> Default = 'comparables.joblib'
+		Comparables index the merged listings are added to. Use None to not keep one.
+	Returns
+	------
+	progress : dict
+		Final number of shards in each status and of listings found, scraped, failed and merged.
+	"""
+
+	today = datetime.date.today().strftime("%d %B %Y")
+	shard_queue = ShardQueue(queue_path)
+	shard_queue.add_shards(today, shards)
+
+	# Spawned rather than forked, so no worker inherits this process's database connections
+	context = multiprocessing.get_context('spawn')
+	worker_kwargs = {'base_url': base_url, 'pipeline_path': pipeline_path, 'model_path': model_path, 'requests_per_second': requests_per_second / num_workers,
+		'max_workers': max_workers, 'batch_size': batch_size, 'max_attempts': max_attempts, 'lease_seconds': lease_seconds}
+	def start_worker():
+		process = context.Process(target=run_worker, args=(queue_path, today), kwargs=worker_kwargs)
+		process.start()
+		return process
+
+	processes = [start_worker() for i in range(num_workers)]
+	print(f"{len(shards)} shards queued for {num_workers} workers.")
+
+	metrics = RunMetrics()
+	conn = connect(database_path)
+	create_state_table(conn)
+	create_aggregate_tables(conn)
+	create_duplicate_tables(conn)
+	comparables = None
+	if comparables_path is not None and pipeline_path is not None:
+		comparables = load_comparables(load(pipeline_path), comparables_path, database_path, version=artifact_version(pipeline_path, model_path))
+	merged_ids = set()
+	released = set()
+	try:
+		last_progress = time.perf_counter()
+		while True:
+			alive = [process for process in processes if process.is_alive()]
+			for process in processes:
+				if process not in alive and process not in released:
+					# A worker that died mid-shard never marks it failed, so put its shards back now rather than when the lease runs out
+					released.add(process)
+					if shard_queue.release_worker(today, f'{socket.gethostname()}-{process.pid}', f'Worker process exited with code {process.exitcode}', max_attempts):
+						print(f"Worker {process.pid} exited with code {process.exitcode} in the middle of a shard. The shard is retried if it has attempts left.")
+			for batch_id, batch in shard_queue.unmerged_batches(today):
+				# A shard handed to another worker after its lease ran out can store the same listing twice
+				batch = batch[~batch['property_id'].astype(str).isin(merged_ids)]
+				if len(batch):
+					store_batch(conn, batch, today, metrics, comparables)
+					metrics.add_listings(len(batch))
+					merged_ids.update(batch['property_id'].astype(str))
+				shard_queue.mark_merged(batch_id)
+
+			# Workers exit once nothing is left to claim, so start new ones for shards put back in the queue or whose lease ran out
+			if len(alive) < num_workers and shard_queue.claimable(today, max_attempts):
+				processes.append(start_worker())
+				continue
+			status = shard_queue.progress(today)['shards']
+			if not alive and not status.get('pending') and not status.get('running'):
+				break
+			if time.perf_counter() - last_progress >= progress_seconds:
+				_print_progress(shard_queue.progress(today))
+				last_progress = time.perf_counter()
+			time.sleep(1)
+
+		progress = shard_queue.progress(today)
+		failed = shard_queue.failed_shards(today)
+		# Listings only a failed shard would have found are missing from the search results, so they must not be taken as delisted
+		update_index(conn, shard_queue.property_links(today), today, complete=not failed)
+	finally:
+		for process in processes:
+			process.join()
+		metrics.finish()
+		if metrics_dir is not None:
+			metrics.write(metrics_dir)
+		conn.close()
+		if comparables is not None:
+			comparables.save(comparables_path)
+
+	_print_progress(progress)
+	for shard, attempts, error in failed:
+		print(f"Shard {shard} failed after {attempts} attempts: {error}")
+	shard_queue.close()
+	if failed:
+		raise RuntimeError(f"{len(failed)} of the {len(shards)} shards failed on every attempt, so their listings were not scraped. Run again to retry them.")
+	return progress
+
+
+def run_worker(queue_path, today, base_url=BASE_URL, pipeline_path=PIPELINE_PATH, model_path=MODEL_PATH, requests_per_second=0.5,
+		max_workers=4, batch_size=100, max_attempts=3, lease_seconds=600):
+	"""
+	Claims shards from the work queue and crawls them until there are none left.
+	For each shard the search results are crawled, the listings no other shard claimed are scraped and predicted, and each batch is stored in the queue for the coordinator to merge. If the search results could not all be loaded or the shard raises an error, the shard is put back in the queue to be retried.
+	Parameters
+	----------
+	queue_path : str
+		Path to the work queue database.
+
+	today : str
+		Date of the run in '%d %B %Y' format.
+
+	base_url : str -> Default = 'https://www.openrent.co.uk/'
+		Site to scrape.
+
+	pipeline_path : str -> Default = 'full_pipeline.joblib'
+		Path to the fitted transformation pipeline. Use None to not make predictions.
+
+	model_path : str -> Default = 'tuned_model.joblib'
+		Path to the tuned model.
+
+	requests_per_second : float -> Default = 0.5
+		Request budget of this worker.
+
+	max_workers : int -> Default = 4
+		Maximum number of listing pages requested at once.
+
+	batch_size : int -> Default = 100
+		Number of listings per stored batch.
+
+	max_attempts : int -> Default = 3
+		Number of times a shard is tried before it is left as failed.
+
+	lease_seconds : float -> Default = 600
+		How long the worker can go without storing a batch before its shard is handed to another worker.
+	Returns
+	------
+	num_shards : int
+		Number of shards this worker finished.
+	"""
+
+	transformation_pipeline, model, model_version = load_artifacts(pipeline_path, model_path) if pipeline_path is not None else (None, None, None)
+	worker = f'{socket.gethostname()}-{os.getpid()}'
+	shard_queue = ShardQueue(queue_path)
+	session = create_session(pool_size=max_workers)
+	limiter = RateLimiter(requests_per_second)
+	metrics = RunMetrics()
+	num_shards = 0
+	try:
+		while True:
+			shard = shard_queue.claim(today, worker, max_attempts, lease_seconds)
+			if shard is None:
+				break
+			try:
+				hrefs, complete = crawl_area(session, limiter, shard['area'], shard['term'], base_url, metrics=metrics)
+				property_links = shard_queue.claim_listings(today, shard['shard_id'], [base_url + href for href in hrefs])
+				run_pipeline(property_links, today, transformation_pipeline=transformation_pipeline, model=model,
+					persist=lambda batch: shard_queue.add_batch(today, shard['shard_id'], batch, lease_seconds), batch_size=batch_size,
+					max_workers=max_workers, requests_per_second=requests_per_second, parse_workers=0, model_version=model_version,
+					on_failure=lambda property_link, reason: shard_queue.mark_listing_failed(today, property_link, reason), metrics=metrics)
+				if not complete:
+					raise RuntimeError(f"The search results stopped loading after {len(hrefs)} listings")
+				shard_queue.finish_shard(today, shard['shard_id'])
+				num_shards += 1
+			except Exception as e:
+				shard_queue.fail_shard(today, shard['shard_id'], f'{type(e).__name__}: {e}', max_attempts)
+	finally:
+		session.close()
+		shard_queue.close()
+	return num_shards
+
+
+def make_shards(terms=('London',), areas=(2,)):
+	"""
+	Every (term, area) combination of the given search terms and radiuses.
+	"""
+
+	return [(term, area) for term in terms for area in areas]
+
+
+def postcode_shards(area=1, boroughs_csv=BOROUGHS_CSV):
+	"""
+	One shard per London postcode district, each searching that district with a small radius. Together they cover London more completely than one large search, as each search only returns a limited number of results.
+	Parameters
+	----------
+	area : int -> Default = 1
+		Search radius around each district.
+
+	boroughs_csv : str -> Default = 'postcode_boroughs.csv'
+		CSV of the postcode districts to search.
+	Returns
+	------
+	shards : list
+		(district, area) of each shard.
+	"""
+
+	return [(district, area) for district in pd.read_csv(boroughs_csv)['postcode']]
+
+
+def shard_id(term, area):
+	return f'{term}|{area}'
+
+
+def _print_progress(progress):
+	shards = progress['shards']
+	print(f"Shards: {shards.get('done', 0)}/{sum(shards.values())} done, {shards.get('running', 0)} running, {shards.get('failed', 0)} failed. "
+		f"Listings: {progress['listings_found']} found, {progress['listings_scraped']} scraped, {progress['listings_failed']} failed, {progress['listings_merged']} merged.")
+
+
+def _now():
+	return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Crawl several Open Rent searches at once with worker processes sharing a work queue.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	coordinate = subparsers.add_parser('coordinate', help='Queue the shards, start the workers and merge their results into the database')
+	coordinate.add_argument('--database', required=True)
+	coordinate.add_argument('--terms', nargs='+', default=['London'])
+	coordinate.add_argument('--areas', type=int, nargs='+', default=[2])
+	coordinate.add_argument('--postcode-districts', action='store_true', help='Also search every postcode district')
+	coordinate.add_argument('--workers', type=int, default=4)
+	coordinate.add_argument('--requests-per-second', type=float, default=2.0)
+	coordinate.add_argument('--base-url', default=BASE_URL)
+	coordinate.add_argument('--queue', default=QUEUE_PATH)
+	worker = subparsers.add_parser('worker', help="Join a running crawl, e.g. from another machine with the queue on a shared drive")
+	worker.add_argument('--queue', default=QUEUE_PATH)
+	worker.add_argument('--date', default=datetime.date.today().strftime("%d %B %Y"))
+	worker.add_argument('--requests-per-second', type=float, default=0.5)
+	worker.add_argument('--base-url', default=BASE_URL)
+	args = parser.parse_args()
+
+	if args.command == 'coordinate':
+		shards = make_shards(args.terms, args.areas) + (postcode_shards() if args.postcode_districts else [])
+		crawl_shards(shards, args.database, num_workers=args.workers, queue_path=args.queue, base_url=args.base_url,
+			requests_per_second=args.requests_per_second)
+	else:
+		run_worker(args.queue, args.date, base_url=args.base_url, requests_per_second=args.requests_per_second)
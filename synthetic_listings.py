@@ -0,0 +1,224 @@
+# IMPORTS
+import datetime
+import random
+from fixture_server import build_index_page
+
+# Values the generated listings are drawn from
+POSTCODES = ['E1', 'E2', 'E3', 'E14', 'E17', 'N1', 'N4', 'N7', 'N16', 'NW1', 'NW3', 'NW6', 'SE1', 'SE8', 'SE15',
+	'SE16', 'SW2', 'SW4', 'SW9', 'SW11', 'W2', 'W6', 'W9', 'W12']
+STREETS = ['High Street', 'Church Road', 'Station Road', 'Victoria Road', 'Park Lane', 'Mill Lane', 'Queens Road',
+	'Rotherhithe Street', 'Holloway Road', 'Kings Avenue', 'Albert Embankment', 'Green Lanes']
+STATIONS = ['Canada Water', 'Holloway Road', 'Bethnal Green', 'Stratford', 'Brixton', 'Clapham North', 'Camden Town',
+	'Finsbury Park', 'Shepherds Bush', 'Paddington', 'Peckham Rye', 'Deptford Bridge', 'Whitechapel', 'Kilburn']
+PROPERTY_TYPES = ['Flat', 'Flat', 'Flat', 'Maisonette', 'Studio Flat', 'Room in a Shared Flat']
+FURNISHING = ['Furnished', 'Unfurnished', 'Part Furnished']
+# Descriptions are built from these templates and words, so that two generated listings share few word shingles, as two real listings by different landlords do
+SENTENCES = [
+	'{adjective} {rooms} bedroom {building} on the {floor} floor of a {era} {block}.',
+	'The {room} has {feature} and {feature2}, with {size} square feet of living space in total.',
+	'{minutes} minutes from {station}, close to {amenity} and {amenity2}.',
+	'{offer} from {month}, {tenants}.',
+	'Recently {work} in {year}, with {feature} throughout and {feature2} in the {room2}.',
+	'Our {landlord} lives {distance} away and {promise}.',
+	'Bills for {utility} are {bills}, council tax band {band}.']
+WORDS = {
+	'adjective': ['Bright', 'Spacious', 'Charming', 'Stylish', 'Quiet', 'Modern', 'Cosy', 'Elegant', 'Sunny', 'Airy', 'Immaculate', 'Characterful'],
+	'building': ['apartment', 'flat', 'conversion', 'maisonette', 'penthouse', 'duplex', 'garden flat', 'mansion flat'],
+	'floor': ['ground', 'first', 'second', 'third', 'fourth', 'fifth', 'top', 'lower ground'],
+	'era': ['Victorian', 'Georgian', 'Edwardian', 'new build', '1930s', 'post war', 'converted warehouse', 'purpose built', 'period'],
+	'block': ['terrace', 'townhouse', 'mansion block', 'development', 'building', 'house', 'school conversion', 'tower'],
+	'room': ['kitchen', 'living room', 'reception', 'master bedroom', 'bathroom', 'dining room', 'study', 'hallway'],
+	'room2': ['kitchen', 'living room', 'reception', 'second bedroom', 'en suite', 'dining area', 'box room', 'utility room'],
+	'feature': ['wooden floors', 'high ceilings', 'bay windows', 'a breakfast bar', 'fitted wardrobes', 'underfloor heating', 'sash windows',
+		'a juliet balcony', 'integrated appliances', 'exposed brick', 'a roof terrace', 'skylights', 'a walk in shower', 'built in storage'],
+	'feature2': ['a dishwasher', 'a washing machine', 'a gas hob', 'a bath tub', 'a fireplace', 'plenty of light', 'garden views',
+		'a power shower', 'new carpets', 'double glazing', 'a private entrance', 'a south facing aspect', 'a home office nook'],
+	'station': ['Canada Water', 'Holloway Road', 'Bethnal Green', 'Stratford', 'Brixton', 'Clapham North', 'Camden Town', 'Finsbury Park',
+		'Shepherds Bush', 'Paddington', 'Peckham Rye', 'Deptford Bridge', 'Whitechapel', 'Kilburn', 'Angel', 'Oval', 'Bow Road'],
+	'amenity': ['the park', 'a supermarket', 'the high street', 'a gym', 'local cafes', 'the canal', 'a primary school', 'the market',
+		'a cinema', 'the common', 'several pubs', 'a leisure centre'],
+	'amenity2': ['bus routes', 'a library', 'the overground', 'cycle lanes', 'restaurants', 'a farmers market', 'the river', 'a health centre',
+		'independent shops', 'a swimming pool', 'tennis courts', 'a nursery'],
+	'offer': ['Available', 'Ready to move into', 'Offered furnished', 'Offered unfurnished', 'Let on a long term basis', 'Free to view'],
+	'month': ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'],
+	'tenants': ['ideal for professionals', 'suits a couple', 'sharers welcome', 'no agency fees', 'students considered', 'families welcome',
+		'pets considered', 'references required', 'viewings from this weekend', 'contact us to arrange a viewing'],
+	'work': ['refurbished', 'redecorated', 'renovated', 'repainted', 'modernised', 'upgraded', 'rewired', 'extended'],
+	'landlord': ['landlord', 'owner', 'family', 'management company', 'letting team', 'caretaker'],
+	'distance': ['nearby', 'around the corner', 'in the area', 'a short drive', 'on site', 'across the road'],
+	'promise': ['repairs are handled quickly', 'responds to messages the same day', 'keeps the building well maintained',
+		'is happy to discuss a longer tenancy', 'welcomes long term tenants', 'can provide parking on request'],
+	'utility': ['water', 'internet', 'gas and electricity', 'heating', 'broadband and water', 'electricity'],
+	'bills': ['not included', 'included', 'split between tenants', 'paid quarterly', 'shared with the building', 'on a prepay meter'],
+	'band': ['A', 'B', 'C', 'D', 'E', 'F']}
+
+LISTING_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} - To Rent Now for £{rent:,.2f} p/m</title>
+</head>
+<body>
+<nav class="navbar navbar-default"><div class="container"><a class="navbar-brand" href="/">OpenRent</a></div></nav>
+<div class="container">
+	<div class="row">
+		<div class="col-md-8">
+			<h1 class="property-title">
+				{title}
+			</h1>
+			<table class="table table-striped intro-stats">
+				<tbody>
+					<tr><td>Location</td><td>London</td></tr>
+					<tr><td>Bedrooms</td><td>{bedrooms}</td></tr>
+					<tr><td>Bathrooms</td><td>{bathrooms}</td></tr>
+					<tr><td>Max Tenants</td><td>{max_tenants}</td></tr>
+				</tbody>
+			</table>
+			<div class="description">
+				{description}
+			</div>
+			<h3>Price &amp; Bills</h3>
+			<table class="table table-striped">
+				<tbody>
+					<tr><td>Deposit</td><td>£{deposit:,.2f}</td></tr>
+					<tr><td>Rent PCM</td><td>£{rent:,.2f}</td></tr>
+					<tr><td>Bills Included</td><td>{bills_included}</td></tr>
+				</tbody>
+			</table>
+			<h3>Tenant Preferences</h3>
+			<table class="table table-striped">
+				<tbody>
+					<tr><td>Student Friendly</td><td>{student_friendly}</td></tr>
+					<tr><td>Families Allowed</td><td>{family_friendly}</td></tr>
+					<tr><td>Pets Allowed</td><td>{pet_friendly}</td></tr>
+					<tr><td>Smokers Allowed</td><td>{smoker_friendly}</td></tr>
+				</tbody>
+			</table>
+			<h3>Availability</h3>
+			<table class="table table-striped">
+				<tbody>
+					<tr><td>Available From</td><td>{available_from}</td></tr>
+					<tr><td>Minimum Tenancy</td><td>{min_tenancy} Months</td></tr>
+				</tbody>
+			</table>
+			<h3>Features</h3>
+			<table class="table table-striped">
+				<tbody>
+					<tr><td>Garden</td><td>{garden}</td></tr>
+					<tr><td>Parking</td><td>{parking}</td></tr>
+					<tr><td>Fireplace</td><td>{fireplace}</td></tr>
+					<tr><td>Furnishing</td><td>{furnishing}</td></tr>
+				</tbody>
+			</table>
+			<h3>Transport</h3>
+			<table class="table table-striped mt-1">
+				<tbody>
+					<tr><td>Station</td><td>Walk</td><td>Mode</td><td></td></tr>
+{stations}
+				</tbody>
+			</table>
+		</div>
+	</div>
+</div>
+<footer class="footer"><div class="container">&copy; OpenRent</div></footer>
+</body>
+</html>'''
+
+# FUNCTIONS
+def generate_description(rng=None):
+	"""
+	Generates a listing description of four sentences drawn from SENTENCES, with every word slot filled at random.
+	Parameters
+	----------
+	rng : random.Random -> Default = None
+		Random number generator to draw from.
+
+	Returns
+	------
+	description : str
+		Listing description.
+	"""
+
+	rng = rng or random.Random()
+	values = {key: rng.choice(words) for key, words in WORDS.items()}
+	values.update(rooms=rng.randint(1, 4), size=rng.randint(350, 1500), minutes=rng.randint(1, 20), year=rng.randint(2005, 2025))
+	return ' '.join(sentence.format(**values) for sentence in rng.sample(SENTENCES, 4))
+
+
+def generate_listing_page(rng=None, description=None):
+	"""
+	Generates the HTML of a random but realistic Open Rent listing page, with the same tables scrape_flats reads from a real one.
+	Parameters
+	----------
+	rng : random.Random -> Default = None
+		Random number generator to draw from. Pass a seeded generator to get the same pages every time.
+
+	description : str -> Default = None
+		Description of the listing. If not provided, one is generated with generate_description.
+
+	Returns
+	------
+	html : str
+		Listing page HTML.
+	"""
+
+	rng = rng or random.Random()
+	property_type = rng.choice(PROPERTY_TYPES)
+	bedrooms = 1 if property_type.startswith(('Studio', 'Room')) else rng.randint(1, 4)
+	bathrooms = rng.randint(1, max(1, bedrooms - 1))
+	title = f'{property_type}, {rng.choice(STREETS)}, {rng.choice(POSTCODES)}'
+	if property_type in ('Flat', 'Maisonette'):
+		title = f'{bedrooms} Bed {title}'
+	rent = rng.randint(8, 30) * 50 + 300 * bedrooms
+
+	available_from = 'Today'
+	if rng.random() < 0.6:
+		available_from = (datetime.date(2026, 1, 1) + datetime.timedelta(days=rng.randint(0, 365))).strftime('%d %B %Y')
+
+	stations = rng.sample(STATIONS, 3)
+	minutes = sorted(rng.randint(1, 20) for station in stations)
+	station_rows = '\n'.join(f'\t\t\t\t\t<tr><td>{station}</td><td>{mins} mins</td><td><i class="fa fa-subway"></i></td></tr>'
+		for station, mins in zip(stations, minutes))
+
+	def icon(probability):
+		return '<i class="fa fa-check"></i>' if rng.random() < probability else '<i class="fa fa-times"></i>'
+
+	return LISTING_TEMPLATE.format(
+		title=title, rent=rent, bedrooms=bedrooms, bathrooms=bathrooms, max_tenants=bedrooms + rng.randint(0, 2),
+		description=description if description is not None else generate_description(rng), deposit=round(rent * 12 / 52 * 5, 2), bills_included=icon(0.1),
+		student_friendly=icon(0.3), family_friendly=icon(0.6), pet_friendly=icon(0.2), smoker_friendly=icon(0.1),
+		available_from=available_from, min_tenancy=rng.choice([1, 3, 6, 6, 12, 12, 12]), garden=icon(0.3),
+		parking=icon(0.3), fireplace=icon(0.1), furnishing=rng.choice(FURNISHING), stations=station_rows)
+
+
+def generate_pages(num_pages, seed=0, first_id=1000000):
+	"""
+	Generates listing pages as (property_link, html) tuples, in the form iter_pages returns them.
+	Parameters
+	----------
+	num_pages : int
+		Number of pages to generate.
+
+	seed : int -> Default = 0
+		Seed for the random number generator, so the same pages are generated every time.
+
+	first_id : int -> Default = 1000000
+		Property ID of the first listing. Following listings count up from here.
+
+	Returns
+	------
+	pages : generator
+		(property_link, html) tuples.
+	"""
+
+	rng = random.Random(seed)
+	for i in range(num_pages):
+		yield f'https://www.openrent.co.uk//{first_id + i}', generate_listing_page(rng)
+
+
+def generate_index_page(num_listings, first_id=1000000):
+	"""
+	Generates a search results page with num_listings 'pli clearfix' links, as served by the fixture server.
+	"""
+
+	return build_index_page(num_listings, first_id=first_id)
@@ -0,0 +1,64 @@
+# IMPORTS
+from urllib.parse import parse_qs, urlsplit
+import pytest
+import fixture_server
+from fixture_server import serve_fixtures
+from index_crawler import discover_listings
+
+# FUNCTIONS
+@pytest.fixture
+def server():
+	server, base_url = serve_fixtures(num_listings=45, latency=0, batch_size=20)
+	server.base_url = base_url
+	yield server
+	server.shutdown()
+
+
+def search_skips(server, area):
+	# skip parameter of every search results request made for one area, in order
+	queries = [parse_qs(urlsplit(path).query) for path in server.requests if 'properties-to-rent' in path]
+	return [int(query['skip'][0]) for query in queries if query['area'] == [str(area)]]
+
+
+def test_pages_through_lazy_loaded_batches(server):
+	hrefs, complete = discover_listings([5], base_url=server.base_url, requests_per_second=1000, selenium_fallback=False)
+
+	assert hrefs == [f'/{1000000 + i}' for i in range(45)]
+	assert complete
+	# Each request skips the listings already loaded, and the empty batch after the last one ends the crawl
+	assert search_skips(server, 5) == [0, 20, 40, 45]
+
+
+def test_stops_when_a_batch_adds_nothing_new(server, monkeypatch):
+	# Serve the first batch again whatever the skip, as the site does once it runs out of listings
+	build_index_page = fixture_server.build_index_page
+	monkeypatch.setattr(fixture_server, 'build_index_page', lambda num_listings, first_id=1000000: build_index_page(num_listings))
+
+	hrefs, complete = discover_listings([5], base_url=server.base_url, requests_per_second=1000, selenium_fallback=False)
+
+	assert hrefs == [f'/{1000000 + i}' for i in range(20)]
+	assert complete
+	assert search_skips(server, 5) == [0, 20]
+
+
+def test_failed_batch_marks_the_results_incomplete(server, monkeypatch):
+	# Drop the connection on the second batch, as a timeout or server error would end the crawl
+	build_index_page = fixture_server.build_index_page
+	def failing_index_page(num_listings, first_id=1000000):
+		if first_id > 1000000:
+			raise ConnectionAbortedError('Batch failed to load')
+		return build_index_page(num_listings, first_id)
+	monkeypatch.setattr(fixture_server, 'build_index_page', failing_index_page)
+
+	hrefs, complete = discover_listings([5], base_url=server.base_url, requests_per_second=1000, selenium_fallback=False)
+
+	assert hrefs == [f'/{1000000 + i}' for i in range(20)]
+	assert not complete
+
+
+def test_listings_shared_between_areas_are_returned_once(server):
+	hrefs, complete = discover_listings([2, 5], base_url=server.base_url, requests_per_second=1000, selenium_fallback=False)
+
+	assert hrefs == [f'/{1000000 + i}' for i in range(45)]
+	assert search_skips(server, 2) == [0, 20, 40, 45]
+	assert search_skips(server, 5) == [0, 20, 40, 45]